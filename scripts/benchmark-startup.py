@@ -0,0 +1,134 @@
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+CLI = os.path.join(SRC_DIR, 'cryptopic.py')
+
+# тяжелые модули, которые не должны загружаться без необходимости
+HEAVY_MODULES = ['PIL.Image', 'Cryptodome', 'concurrent.futures', 'crypto_block', 'crypto_stream']
+
+# время запуска CLI: стена по лучшему из N запусков и отчет python -X importtime
+def scenarios(workdir):
+    from PIL import Image
+
+    image_path = os.path.join(workdir, 'tiny.png')
+    Image.new('RGB', (16, 16), (120, 30, 200)).save(image_path)
+    stream_path = os.path.join(workdir, 'tiny_stream.cpic')
+    ctr_path = os.path.join(workdir, 'tiny_ctr.cpic')
+
+    return [
+        ('help', ['--help']),
+        ('arg-error', ['--mode', 'encrypt', '--in', image_path, '--out', stream_path, '--algo', 'stream',
+                       '--key', 'k', '--tile', '4']),
+        ('encrypt-stream', ['--mode', 'encrypt', '--in', image_path, '--out', stream_path, '--algo', 'stream',
+                            '--key', 'k', '--kdf', 'legacy']),
+        ('decrypt-stream', ['--mode', 'decrypt', '--in', stream_path, '--out', os.path.join(workdir, 'dec_stream.png'),
+                            '--algo', 'stream', '--key', 'k']),
+        ('encrypt-ctr', ['--mode', 'encrypt', '--in', image_path, '--out', ctr_path, '--algo', 'aes-ctr',
+                         '--key', 'k', '--kdf', 'legacy']),
+        ('decrypt-ctr', ['--mode', 'decrypt', '--in', ctr_path, '--out', os.path.join(workdir, 'dec_ctr.png'),
+                         '--algo', 'aes-ctr', '--key', 'k']),
+    ]
+
+# строки "import time: self | cumulative | name" -> [(name, cumulative_us, depth)]
+def parse_importtime(stderr):
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(cumulative), depth))
+    return imports
+
+def run_cli(cli_args, importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + [CLI] + cli_args
+    start = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True)
+    return time.perf_counter() - start, result
+
+def measure_scenario(cli_args, repeats):
+    best = min(run_cli(cli_args)[0] for _ in range(repeats))
+    _, result = run_cli(cli_args, importtime=True)
+    imports = parse_importtime(result.stderr)
+
+    # модули верхнего уровня уже включают время вложенных
+    total_us = sum(cumulative for _, cumulative, depth in imports if depth == 0)
+    loaded = {name for name, _, _ in imports}
+    heavy = [module for module in HEAVY_MODULES if module in loaded]
+    top = sorted((entry for entry in imports if entry[2] == 0), key=lambda entry: -entry[1])
+    return best, total_us, heavy, top, result.returncode
+
+# тот же запрос шифрования через демон (--mode serve): процесс и модули уже загружены
+def bench_server(repeats=5):
+    sys.path.append(SRC_DIR)
+    from server import call
+
+    with tempfile.TemporaryDirectory() as workdir:
+        socket_path = os.path.join(workdir, 'bench.sock')
+        daemon = subprocess.Popen([sys.executable, CLI, '--mode', 'serve', '--socket', socket_path, '--workers', '1'],
+                                  stdout=subprocess.DEVNULL)
+        try:
+            for _ in range(100):
+                if os.path.exists(socket_path):
+                    break
+                time.sleep(0.05)
+
+            print("\n Демон (--mode serve), тот же запрос без запуска процесса")
+            for name, cli_args in scenarios(workdir):
+                if not name.startswith(('encrypt', 'decrypt')):
+                    continue
+                options = dict(zip(cli_args[::2], cli_args[1::2]))
+                request = {"op": options['--mode'], "algo": options['--algo'], "key": options['--key'],
+                           "input": options['--in'], "output": options['--out'], "kdf": options.get('--kdf', 'legacy')}
+                best = None
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    response, _ = call(request, socket_path=socket_path)
+                    elapsed = time.perf_counter() - start
+                    if not response['ok']:
+                        raise RuntimeError(f"{name}: {response['error']}")
+                    best = elapsed if best is None else min(best, elapsed)
+                print(f"   {name}: {best * 1000:.1f} мс (лучший из {repeats})")
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+def bench_startup(repeats=5, top_count=5, history=None):
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, cli_args in scenarios(workdir):
+            best, total_us, heavy, top, code = measure_scenario(cli_args, repeats)
+            print(f"\n {name}: {best * 1000:.1f} мс (лучший из {repeats}), импорт {total_us / 1000:.1f} мс, код {code}")
+            print(f"   тяжелые модули: {', '.join(heavy) or 'нет'}")
+            for module, cumulative, _ in top[:top_count]:
+                print(f"   {cumulative / 1000:8.1f} мс  {module}")
+            rows.append([time.strftime('%Y-%m-%d %H:%M:%S'), name, f"{best * 1000:.1f}", f"{total_us / 1000:.1f}",
+                         ' '.join(heavy)])
+
+    # история для отслеживания регрессий времени запуска
+    if history:
+        new_file = not os.path.exists(history)
+        with open(history, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(['time', 'scenario', 'wall_ms', 'import_ms', 'heavy_modules'])
+            writer.writerows(rows)
+        print(f"\n Результаты добавлены в {history}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Время запуска CLI CryptoPic и отчет по импортам')
+    parser.add_argument('--repeats', type=int, default=5, help='Число запусков на сценарий (берется лучший)')
+    parser.add_argument('--top', type=int, default=5, help='Сколько самых дорогих импортов показать')
+    parser.add_argument('--history', help='CSV-файл, в который дописываются результаты')
+    parser.add_argument('--server', action='store_true', help='Сравнить с теми же запросами к демону (--mode serve)')
+    args = parser.parse_args()
+
+    bench_startup(args.repeats, args.top, args.history)
+    if args.server:
+        bench_server(args.repeats)
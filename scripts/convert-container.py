@@ -0,0 +1,67 @@
+import argparse
+import glob
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from container import is_container, convert_legacy
+
+# перевод старых шифров (.bin + .meta.json) в контейнеры без расшифровки
+def collect_inputs(sources):
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            files += sorted(glob.glob(os.path.join(source, '*.bin')))
+        else:
+            files += sorted(glob.glob(source)) or [source]
+    return files
+
+def output_path_for(input_path, output_dir, in_place):
+    if in_place:
+        return input_path
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir or os.path.dirname(input_path), f"{stem}.cpic")
+
+def convert_all(sources, output_dir=None, in_place=False):
+    converted = 0
+    failed = 0
+
+    for input_path in collect_inputs(sources):
+        if is_container(input_path):
+            print(f" Пропуск {input_path}: уже контейнер")
+            continue
+
+        output_path = output_path_for(input_path, output_dir, in_place)
+        meta_path = input_path + ".meta.json"
+        # на месте: сначала пишем рядом, затем атомарно заменяем исходный файл
+        target = output_path + ".tmp" if in_place else output_path
+
+        try:
+            convert_legacy(input_path, target, meta_path)
+            if in_place:
+                os.replace(target, output_path)
+                os.remove(meta_path)
+            converted += 1
+            print(f" {input_path} -> {output_path}")
+        except Exception as e:
+            if in_place and os.path.exists(target):
+                os.remove(target)
+            failed += 1
+            print(f" Ошибка {input_path}: {e}")
+
+    print(f"\n Сконвертировано: {converted}, ошибок: {failed}")
+    return failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Перевод шифров .bin + .meta.json в контейнер CryptoPic')
+    parser.add_argument('sources', nargs='+', help='Файлы .bin, glob-шаблоны или каталоги')
+    parser.add_argument('--out-dir', help='Каталог для контейнеров (по умолчанию - рядом с исходными, расширение .cpic)')
+    parser.add_argument('--in-place', action='store_true',
+                        help='Заменить .bin контейнером с тем же именем и удалить .meta.json')
+    args = parser.parse_args()
+
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    sys.exit(1 if convert_all(args.sources, args.out_dir, args.in_place) else 0)
@@ -100,7 +100,7 @@ TEST_COMMANDS = [
         
         ("python src/cryptopic.py --mode encrypt --in imgs/input/gradient.png --out imgs/encrypted/gradient_aes_cfb.bin --algo aes-cfb --key \"test123\"",
          "Шифрование gradient (AES-CFB)"),
-        ("python src/cryptopic.py --mode decrypt --in imgs/encrypted/gradient_aes_cfb.bin --out imgs/decrypted/gradient_aes_cfb_dec.bmp --algo aes-ecb --key \"test123\" --meta imgs/encrypted/gradient_aes_cfb.bin.meta.json",
+        ("python src/cryptopic.py --mode decrypt --in imgs/encrypted/gradient_aes_cfb.bin --out imgs/decrypted/gradient_aes_cfb_dec.bmp --algo aes-cfb --key \"test123\" --meta imgs/encrypted/gradient_aes_cfb.bin.meta.json",
          "Дешифрование gradient (AES-CFB)"),
         
         ("python src/cryptopic.py --mode encrypt --in imgs/input/my.jpg --out imgs/encrypted/my_aes_cfb.bin --algo aes-cfb --key \"test123\"",
@@ -0,0 +1,92 @@
+import asyncio
+import functools
+import json
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+# выполнение шифрования из asyncio-кода без блокировки цикла событий
+#
+# Декодирование Pillow, AES/RC4 и запись шифра выполняются в исполнителе
+# (по умолчанию - пул на max_concurrency потоков, по умолчанию os.cpu_count(); можно
+# передать свой ThreadPoolExecutor или ProcessPoolExecutor вместе с его max_concurrency). Запись метаданных и других
+# небольших файлов идет в отдельном пуле потоков ввода-вывода, чтобы не ждать
+# освобождения потоков шифрования.
+#
+# Противодавление: одновременно выполняется и ждет в очереди исполнителя не
+# больше max_pending операций; остальные вызовы ждут на семафоре, не занимая
+# память под очередь. saturated позволяет сразу отказать клиенту (например,
+# ответом 503) вместо ожидания.
+#
+# Асинхронные варианты функций - *_async в crypto_block и crypto_stream,
+# encrypt_file_async/decrypt_file_async в cryptopic; все принимают runner=None
+# (общий исполнитель, см. configure).
+
+# сколько операций на поток исполнителя может ждать в очереди
+PENDING_PER_WORKER = 2
+IO_WORKERS = 4
+
+class AsyncRunner:
+
+    # max_concurrency - число потоков исполнителя по умолчанию (или потоков/процессов переданного executor),
+    # по нему считается max_pending
+    def __init__(self, executor=None, max_pending=None, io_executor=None, max_concurrency=None):
+        self.max_concurrency = max(1, max_concurrency or os.cpu_count() or 1)
+        self.executor = executor or ThreadPoolExecutor(max_workers=self.max_concurrency)
+        self.io_executor = io_executor or ThreadPoolExecutor(max_workers=IO_WORKERS)
+        self.max_pending = max_pending or self.max_concurrency * PENDING_PER_WORKER
+        # семафор привязывается к циклу событий - свой на каждый цикл (asyncio.run в тестах и скриптах)
+        self._slots = weakref.WeakKeyDictionary()
+        self.pending = 0
+
+    @property
+    def saturated(self):
+        return self.pending >= self.max_pending
+
+    # func(*args, **kwargs) в исполнителе; при max_pending операций в работе - ожидание
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        if loop not in self._slots:
+            self._slots[loop] = asyncio.Semaphore(self.max_pending)
+        async with self._slots[loop]:
+            self.pending += 1
+            try:
+                return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+            finally:
+                self.pending -= 1
+
+    async def write_file(self, path, data):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.io_executor, _write_file, path, data)
+
+    async def write_json(self, path, obj):
+        await self.write_file(path, json.dumps(obj, indent=2).encode('utf-8'))
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+        self.io_executor.shutdown(wait=wait)
+
+def _write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+_default_runner = None
+
+# общий исполнитель для вызовов без runner=; повторный вызов создает новый, а пулы
+# прежнего закрывает (без ожидания: начатые операции доработают), кроме переданных заново
+def configure(executor=None, max_pending=None, io_executor=None, max_concurrency=None):
+    global _default_runner
+    previous = _default_runner
+    _default_runner = AsyncRunner(executor, max_pending, io_executor, max_concurrency)
+    if previous is not None:
+        for pool in (previous.executor, previous.io_executor):
+            if pool not in (_default_runner.executor, _default_runner.io_executor):
+                pool.shutdown(wait=False)
+    return _default_runner
+
+def resolve_runner(runner=None):
+    if runner is not None:
+        return runner
+    if _default_runner is None:
+        configure()
+    return _default_runner
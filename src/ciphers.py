@@ -0,0 +1,219 @@
+import importlib
+
+# реестр шифров: идентификатор алгоритма -> бэкенд с единым интерфейсом
+#
+# Модуль бэкенда (crypto_stream, crypto_block, crypto_aead) импортируется при первом обращении,
+# поэтому запуск с --algo stream не загружает AES, и наоборот.
+#
+# Возможности шифра:
+#     parallel_encrypt / parallel_decrypt - обработка сегментами в потоках (workers > 1)
+#     seekable          - расшифровка с любого блока без расшифровки предыдущих
+#     requires_padding  - шифр длиннее данных (дополнение до целого блока)
+#     iv_field          - поле метаданных с IV/nonce, None - шифр без IV
+#     tiles             - плиточный режим и расшифровка области
+#     authenticated     - шифр с тегами (AEAD): поврежденный шифр или неверный ключ отвергаются
+
+# размер блока AES (для длины шифра с паддингом без импорта бэкенда)
+BLOCK_SIZE = 16
+
+class Cipher:
+
+    def __init__(self, algorithm_id, meta_name, report_name, label, module, iv_field=None, requires_padding=False,
+                 parallel_encrypt=False, parallel_decrypt=False, seekable=False, tiles=False, authenticated=False):
+        self.algorithm_id = algorithm_id
+        self.meta_name = meta_name
+        # имя алгоритма в отчетах метрик и суффикс имен файлов (gradient_cbc)
+        self.report_name = report_name
+        self.label = label
+        self.module = module
+        self.iv_field = iv_field
+        self.requires_padding = requires_padding
+        self.parallel_encrypt = parallel_encrypt
+        self.parallel_decrypt = parallel_decrypt
+        self.seekable = seekable
+        self.tiles = tiles
+        self.authenticated = authenticated
+        self._backend = None
+
+    def __repr__(self):
+        return f"Cipher({self.algorithm_id!r})"
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = importlib.import_module(self.module)
+        return self._backend
+
+    @property
+    def uses_iv(self):
+        return self.iv_field is not None
+
+    # размер выходного буфера для encrypt_into (ECB/CBC - с паддингом до целого блока)
+    def encrypted_length(self, data_length):
+        if self.requires_padding:
+            return (data_length // BLOCK_SIZE + 1) * BLOCK_SIZE
+        return data_length
+
+    # единый интерфейс: потоковое шифрование в файл, дешифрование в буфер, байты в памяти;
+    # encrypt - как block_encrypt/stream_encrypt: изображение (путь или файловый объект) -> шифр и метаданные
+
+    def encrypt_to_file(self, image_path, output_path, key, iv=None, nonce=None, workers=1, container=False,
+                        pyramid_levels=0, **kdf_options):
+        raise NotImplementedError
+
+    def decrypt_to_buffer(self, input_path, key, meta, workers=1, payload_offset=0, payload_length=None):
+        raise NotImplementedError
+
+    def encrypt(self, image, key, iv=None, nonce=None, workers=1, **kdf_options):
+        raise NotImplementedError
+
+    def encrypt_bytes(self, data, key, iv=None, nonce=None, workers=1, **kdf_options):
+        raise NotImplementedError
+
+    def decrypt_bytes(self, encrypted_bytes, key, meta, workers=1):
+        raise NotImplementedError
+
+    # "сырые" пиксели из любого буфера -> буфер вызывающего; (число байт, метаданные)
+    def encrypt_into(self, data, output, key, size=None, image_mode=None, iv=None, nonce=None, workers=1, **kdf_options):
+        raise NotImplementedError
+
+    def decrypt_into(self, encrypted, output, key, meta, workers=1):
+        raise NotImplementedError
+
+    def encrypt_tiles_to_file(self, image_path, output_path, key, tile_size, nonce=None, workers=1, **kdf_options):
+        raise ValueError(f"Плиточное шифрование не поддерживается для {self.algorithm_id}!")
+
+    def decrypt_region(self, input_path, key, info, region=None, workers=1):
+        raise ValueError(f"Плиточное шифрование не поддерживается для {self.algorithm_id}!")
+
+class StreamCipher(Cipher):
+
+    def __init__(self):
+        super().__init__('stream', 'stream-rc4-custom', 'stream-rc4-custom', 'stream', 'crypto_stream', iv_field='iv')
+
+    def encrypt_to_file(self, image_path, output_path, key, iv=None, nonce=None, workers=1, container=False,
+                        pyramid_levels=0, **kdf_options):
+        return self.backend.stream_encrypt_to_file(image_path, output_path, key, iv, container=container,
+                                                   pyramid_levels=pyramid_levels, **kdf_options)
+
+    def decrypt_to_buffer(self, input_path, key, meta, workers=1, payload_offset=0, payload_length=None):
+        return self.backend.stream_decrypt_to_buffer(input_path, key, meta, payload_offset=payload_offset,
+                                                     payload_length=payload_length)
+
+    def encrypt(self, image, key, iv=None, nonce=None, workers=1, **kdf_options):
+        return self.backend.stream_encrypt(image, key, iv, **kdf_options)
+
+    def encrypt_bytes(self, data, key, iv=None, nonce=None, workers=1, **kdf_options):
+        return self.backend.stream_encrypt_bytes(data, key, iv, **kdf_options)
+
+    def decrypt_bytes(self, encrypted_bytes, key, meta, workers=1):
+        return self.backend.stream_decrypt_bytes(encrypted_bytes, key, meta)
+
+    def encrypt_into(self, data, output, key, size=None, image_mode=None, iv=None, nonce=None, workers=1, **kdf_options):
+        return self.backend.stream_encrypt_into(data, output, key, size, image_mode, iv, **kdf_options)
+
+    def decrypt_into(self, encrypted, output, key, meta, workers=1):
+        return self.backend.stream_decrypt_into(encrypted, output, key, meta)
+
+class BlockCipher(Cipher):
+
+    def __init__(self, mode, **capabilities):
+        super().__init__(f'aes-{mode}', f'AES-{mode.upper()}', f'aes-{mode}', mode, 'crypto_block', **capabilities)
+        self.mode = mode
+
+    def encrypt_to_file(self, image_path, output_path, key, iv=None, nonce=None, workers=1, container=False,
+                        pyramid_levels=0, **kdf_options):
+        return self.backend.block_encrypt_to_file(image_path, output_path, key, mode=self.mode, iv=iv, nonce=nonce,
+                                                  workers=workers, container=container,
+                                                  pyramid_levels=pyramid_levels, **kdf_options)
+
+    def decrypt_to_buffer(self, input_path, key, meta, workers=1, payload_offset=0, payload_length=None):
+        return self.backend.block_decrypt_to_buffer(input_path, key, meta, workers=workers,
+                                                    payload_offset=payload_offset, payload_length=payload_length)
+
+    def encrypt(self, image, key, iv=None, nonce=None, workers=1, **kdf_options):
+        return self.backend.block_encrypt(image, key, mode=self.mode, iv=iv, nonce=nonce, workers=workers, **kdf_options)
+
+    def encrypt_bytes(self, data, key, iv=None, nonce=None, workers=1, **kdf_options):
+        return self.backend.block_encrypt_bytes(data, key, mode=self.mode, iv=iv, nonce=nonce, workers=workers,
+                                                **kdf_options)
+
+    def decrypt_bytes(self, encrypted_bytes, key, meta, workers=1):
+        return self.backend.block_decrypt_bytes(encrypted_bytes, key, meta, workers=workers)
+
+    def encrypt_into(self, data, output, key, size=None, image_mode=None, iv=None, nonce=None, workers=1, **kdf_options):
+        return self.backend.block_encrypt_into(data, output, key, size, image_mode, mode=self.mode, iv=iv, nonce=nonce,
+                                               workers=workers, **kdf_options)
+
+    def decrypt_into(self, encrypted, output, key, meta, workers=1):
+        return self.backend.block_decrypt_into(encrypted, output, key, meta, workers=workers)
+
+    def encrypt_tiles_to_file(self, image_path, output_path, key, tile_size, nonce=None, workers=1, **kdf_options):
+        if not self.tiles:
+            return super().encrypt_tiles_to_file(image_path, output_path, key, tile_size, nonce, workers, **kdf_options)
+        return self.backend.block_encrypt_tiles_to_file(image_path, output_path, key, tile_size=tile_size,
+                                                        nonce=nonce, workers=workers, **kdf_options)
+
+    def decrypt_region(self, input_path, key, info, region=None, workers=1):
+        if not self.tiles:
+            return super().decrypt_region(input_path, key, info, region, workers)
+        return self.backend.block_decrypt_region(input_path, key, info, region, workers=workers)
+
+class AEADCipher(Cipher):
+
+    def __init__(self, algorithm_id, meta_name, label):
+        super().__init__(algorithm_id, meta_name, algorithm_id, label, 'crypto_aead', iv_field='nonce', parallel_encrypt=True,
+                         parallel_decrypt=True, seekable=True, authenticated=True)
+
+    # данные и тег на каждый сегмент
+    def encrypted_length(self, data_length):
+        return self.backend.encrypted_length(data_length)
+
+    def encrypt_to_file(self, image_path, output_path, key, iv=None, nonce=None, workers=1, container=False,
+                        pyramid_levels=0, **kdf_options):
+        return self.backend.aead_encrypt_to_file(image_path, output_path, key, self.algorithm_id, nonce=nonce, workers=workers,
+                                                 container=container, pyramid_levels=pyramid_levels, **kdf_options)
+
+    def decrypt_to_buffer(self, input_path, key, meta, workers=1, payload_offset=0, payload_length=None):
+        return self.backend.aead_decrypt_to_buffer(input_path, key, meta, workers=workers, payload_offset=payload_offset,
+                                                   payload_length=payload_length)
+
+    def encrypt(self, image, key, iv=None, nonce=None, workers=1, **kdf_options):
+        return self.backend.aead_encrypt(image, key, self.algorithm_id, nonce=nonce, workers=workers, **kdf_options)
+
+    def encrypt_bytes(self, data, key, iv=None, nonce=None, workers=1, **kdf_options):
+        return self.backend.aead_encrypt_bytes(data, key, self.algorithm_id, nonce=nonce, workers=workers, **kdf_options)
+
+    def decrypt_bytes(self, encrypted_bytes, key, meta, workers=1):
+        return self.backend.aead_decrypt_bytes(encrypted_bytes, key, meta, workers=workers)
+
+    def encrypt_into(self, data, output, key, size=None, image_mode=None, iv=None, nonce=None, workers=1, **kdf_options):
+        return self.backend.aead_encrypt_into(data, output, key, size, image_mode, algorithm=self.algorithm_id, nonce=nonce,
+                                              workers=workers, **kdf_options)
+
+    def decrypt_into(self, encrypted, output, key, meta, workers=1):
+        return self.backend.aead_decrypt_into(encrypted, output, key, meta, workers=workers)
+
+CIPHERS = {cipher.algorithm_id: cipher for cipher in [
+    StreamCipher(),
+    BlockCipher('ecb', requires_padding=True, parallel_encrypt=True, parallel_decrypt=True, seekable=True),
+    BlockCipher('cbc', iv_field='iv', requires_padding=True, parallel_decrypt=True, seekable=True),
+    BlockCipher('ctr', iv_field='nonce', parallel_encrypt=True, parallel_decrypt=True, seekable=True, tiles=True),
+    BlockCipher('cfb', iv_field='iv', parallel_decrypt=True, seekable=True),
+    AEADCipher('aes-gcm', 'AES-GCM', 'gcm'),
+    AEADCipher('chacha20-poly1305', 'ChaCha20-Poly1305', 'chacha20'),
+]}
+
+ALGORITHM_IDS = list(CIPHERS)
+
+# шифр по идентификатору CLI ('aes-cbc') или по имени из метаданных ('AES-CBC')
+def get_cipher(name):
+    if name in CIPHERS:
+        return CIPHERS[name]
+    for cipher in CIPHERS.values():
+        if name == cipher.meta_name:
+            return cipher
+    raise ValueError(f"Неизвестный алгоритм: {name}")
+
+def cipher_for_meta(meta):
+    return get_cipher(meta.get('algorithm', ''))
@@ -0,0 +1,314 @@
+import json
+import os
+import struct
+from collections import namedtuple
+
+from image_io import CHUNK_SIZE, iter_file_chunks
+
+# контейнер CryptoPic: заголовок и шифр в одном файле вместо .bin + .meta.json
+#
+# Заголовок фиксированного размера (little-endian):
+#
+#     magic        4s   b'CPIC'
+#     version      B
+#     algorithm    B    индекс в ALGORITHMS
+#     flags        B    FLAG_*
+#     key_size     B    0 - не задан (RC4)
+#     width        I
+#     height       I
+#     image_mode   8s   режим PIL, дополнен нулями
+#     iv_length    B    16 - IV, 8 - nonce CTR, 7 - префикс nonce AEAD, 0 - нет
+#     iv           16s
+#     key_hash     16s
+#     ext_length   I    длина области расширений
+#     payload_len  Q
+#
+# Затем расширения (тип B, длина I, значение) и сам шифр.
+# Неизвестные типы расширений пропускаются - их можно добавлять без смены версии.
+
+MAGIC = b'CPIC'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBBII8sB16s16sIQ')
+EXTENSION_HEADER = struct.Struct('<BI')
+
+# сколько байт читается за один раз - обычно заголовок вместе с расширениями
+HEADER_READ_SIZE = 4096
+
+# поле iv в заголовке и в таблице пирамиды; более длинный IV не поместится
+IV_FIELD_SIZE = 16
+
+ALGORITHMS = ['stream-rc4-custom', 'AES-ECB', 'AES-CBC', 'AES-CFB', 'AES-CTR', 'AES-GCM', 'ChaCha20-Poly1305']
+# шифры с аутентификацией: в поле iv - префикс nonce сегментов
+AEAD_ALGORITHMS = ['AES-GCM', 'ChaCha20-Poly1305']
+
+FLAG_REQUIRES_PADDING = 0x01
+FLAG_KEY_HASH = 0x02
+# RC4: расписание ключа keyed-iv (без флага - прежнее combined)
+FLAG_KSA_KEYED_IV = 0x04
+
+EXT_ORIGINAL_FILENAME = 1
+# таблица плиток: размер плитки, затем (смещение в шифре, длина) для каждой плитки
+EXT_TILE_TABLE = 2
+
+TILE_TABLE_HEADER = struct.Struct('<II')
+TILE_ENTRY = struct.Struct('<QI')
+
+# пирамида уменьшенных копий: для каждого уровня размер, свой IV/nonce,
+# смещение от начала основного шифра и длина; уровни лежат сразу за основным шифром
+EXT_PYRAMID = 3
+PYRAMID_ENTRY = struct.Struct('<IIB16sQQ')
+MAX_PYRAMID_LEVELS = 16
+
+# получение ключа из пароля: индекс в KDF_NAMES, стоимость, затем соль до конца значения;
+# без этого расширения ключ получается прежним способом
+EXT_KDF = 4
+KDF_HEADER = struct.Struct('<BI')
+KDF_NAMES = ['pbkdf2-sha256', 'scrypt']
+
+# AEAD: размер сегмента, каждый сегмент шифра заканчивается тегом
+EXT_AEAD = 5
+AEAD_HEADER = struct.Struct('<I')
+
+ContainerInfo = namedtuple('ContainerInfo', ['meta', 'payload_offset', 'payload_length', 'extensions'])
+PyramidLevel = namedtuple('PyramidLevel', ['size', 'iv', 'offset', 'length'])
+
+def is_container(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def pack_extensions(extensions):
+    return b''.join(EXTENSION_HEADER.pack(ext_type, len(value)) + value for ext_type, value in extensions.items())
+
+def unpack_extensions(data):
+    extensions = {}
+    position = 0
+    while position < len(data):
+        if position + EXTENSION_HEADER.size > len(data):
+            raise ValueError("Контейнер поврежден: обрезана область расширений!")
+        ext_type, length = EXTENSION_HEADER.unpack_from(data, position)
+        position += EXTENSION_HEADER.size
+        extensions[ext_type] = bytes(data[position:position + length])
+        position += length
+    return extensions
+
+def pack_tile_table(tile_size, entries):
+    header = TILE_TABLE_HEADER.pack(*tile_size)
+    return header + b''.join(TILE_ENTRY.pack(offset, length) for offset, length in entries)
+
+def unpack_tile_table(data):
+    tile_size = list(TILE_TABLE_HEADER.unpack_from(data))
+    entries = list(TILE_ENTRY.iter_unpack(data[TILE_TABLE_HEADER.size:]))
+    return tile_size, entries
+
+def check_iv_size(iv):
+    if len(iv) > IV_FIELD_SIZE:
+        raise ValueError(f"IV/nonce длиной {len(iv)} байт не помещается в контейнер (максимум {IV_FIELD_SIZE})!")
+
+def pack_pyramid_table(levels):
+    for _, iv, _, _ in levels:
+        check_iv_size(iv)
+    return b''.join(PYRAMID_ENTRY.pack(width, height, len(iv), iv, offset, length)
+                    for (width, height), iv, offset, length in levels)
+
+def unpack_pyramid_table(data):
+    return [PyramidLevel([width, height], iv[:iv_length], offset, length)
+            for width, height, iv_length, iv, offset, length in PYRAMID_ENTRY.iter_unpack(data)]
+
+# таблица пирамиды по (размер, iv, длина) уровней; payload_length - длина основного шифра
+def pyramid_table(payload_length, levels):
+    if len(levels) > MAX_PYRAMID_LEVELS:
+        raise ValueError(f"Слишком много уровней пирамиды: {len(levels)}, максимум {MAX_PYRAMID_LEVELS}")
+    
+    entries = []
+    offset = payload_length
+    for size, iv, length in levels:
+        entries.append(PyramidLevel(size, iv, offset, length))
+        offset += length
+    return pack_pyramid_table(entries)
+
+def pack_header(meta, payload_length=0, extensions=None):
+    algorithm = meta.get('algorithm')
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Алгоритм {algorithm} не поддерживается контейнером!")
+
+    # IV для RC4/CBC/CFB, nonce для CTR, префикс nonce для AEAD
+    iv = bytes.fromhex(meta.get('nonce') or meta.get('iv') or '')
+    check_iv_size(iv)
+    key_hash = bytes.fromhex(meta.get('key_hash') or '')
+
+    flags = 0
+    if meta.get('requires_padding'):
+        flags |= FLAG_REQUIRES_PADDING
+    if key_hash:
+        flags |= FLAG_KEY_HASH
+    if meta.get('ksa') == 'keyed-iv':
+        flags |= FLAG_KSA_KEYED_IV
+    elif meta.get('ksa') not in (None, 'combined'):
+        raise ValueError(f"Вариант расписания ключа {meta['ksa']} не поддерживается контейнером!")
+
+    extensions = dict(extensions or {})
+    if meta.get('original_filename'):
+        extensions[EXT_ORIGINAL_FILENAME] = meta['original_filename'].encode('utf-8')
+    if meta.get('kdf'):
+        if meta['kdf'] not in KDF_NAMES:
+            raise ValueError(f"Алгоритм получения ключа {meta['kdf']} не поддерживается контейнером!")
+        extensions[EXT_KDF] = KDF_HEADER.pack(KDF_NAMES.index(meta['kdf']), meta['kdf_cost']) + bytes.fromhex(meta['salt'])
+    if meta.get('segment_size'):
+        extensions[EXT_AEAD] = AEAD_HEADER.pack(meta['segment_size'])
+    extension_data = pack_extensions(extensions)
+
+    width, height = meta['original_size']
+    header = HEADER.pack(
+        MAGIC, VERSION, ALGORITHMS.index(algorithm), flags, meta.get('key_size', 0),
+        width, height, meta['mode'].encode('ascii'), len(iv), iv, key_hash,
+        len(extension_data), payload_length
+    )
+    return header + extension_data
+
+def unpack_header(data):
+    if len(data) < HEADER.size or bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError("Файл не является контейнером CryptoPic!")
+
+    (_, version, algorithm_index, flags, key_size, width, height, image_mode,
+     iv_length, iv, key_hash, ext_length, payload_length) = HEADER.unpack_from(data)
+
+    if version > VERSION:
+        raise ValueError(f"Неподдерживаемая версия контейнера: {version}")
+    if algorithm_index >= len(ALGORITHMS):
+        raise ValueError(f"Неизвестный алгоритм в контейнере: {algorithm_index}")
+
+    payload_offset = HEADER.size + ext_length
+    if len(data) < payload_offset:
+        raise ValueError("Контейнер поврежден: заголовок обрезан!")
+    extensions = unpack_extensions(data[HEADER.size:payload_offset])
+
+    algorithm = ALGORITHMS[algorithm_index]
+    iv_hex = iv[:iv_length].hex()
+    original_filename = extensions.get(EXT_ORIGINAL_FILENAME, b'').decode('utf-8')
+
+    # те же поля и в том же порядке, что и в .meta.json
+    meta = {"algorithm": algorithm, "original_size": [width, height], "mode": image_mode.rstrip(b'\0').decode('ascii')}
+    if algorithm in AEAD_ALGORITHMS:
+        if EXT_AEAD not in extensions:
+            raise ValueError("Контейнер поврежден: нет размера сегмента AEAD!")
+        meta["key_size"] = key_size
+        meta["original_filename"] = original_filename
+        if flags & FLAG_KEY_HASH:
+            meta["key_hash"] = key_hash.hex()
+        meta["nonce"] = iv_hex
+        meta["segment_size"] = AEAD_HEADER.unpack_from(extensions[EXT_AEAD])[0]
+    elif algorithm.startswith('AES-'):
+        meta["key_size"] = key_size
+        meta["original_filename"] = original_filename
+        if flags & FLAG_KEY_HASH:
+            meta["key_hash"] = key_hash.hex()
+        meta["requires_padding"] = bool(flags & FLAG_REQUIRES_PADDING)
+        if algorithm == 'AES-CTR':
+            meta["nonce"] = iv_hex
+        elif iv_length:
+            meta["iv"] = iv_hex
+    else:
+        meta["iv"] = iv_hex
+        meta["original_filename"] = original_filename
+        if flags & FLAG_KEY_HASH:
+            meta["key_hash"] = key_hash.hex()
+        if flags & FLAG_KSA_KEYED_IV:
+            meta["ksa"] = 'keyed-iv'
+
+    if EXT_KDF in extensions:
+        kdf_index, kdf_cost = KDF_HEADER.unpack_from(extensions[EXT_KDF])
+        if kdf_index >= len(KDF_NAMES):
+            raise ValueError(f"Неизвестный алгоритм получения ключа в контейнере: {kdf_index}")
+        meta["kdf"] = KDF_NAMES[kdf_index]
+        meta["kdf_cost"] = kdf_cost
+        meta["salt"] = extensions[EXT_KDF][KDF_HEADER.size:].hex()
+
+    if EXT_TILE_TABLE in extensions:
+        meta["tile_size"] = unpack_tile_table(extensions[EXT_TILE_TABLE])[0]
+    if EXT_PYRAMID in extensions:
+        meta["pyramid_levels"] = len(extensions[EXT_PYRAMID]) // PYRAMID_ENTRY.size
+
+    return ContainerInfo(meta, payload_offset, payload_length, extensions)
+
+# заголовок читается одним вызовом read; второй - только если расширения не поместились
+def read_container(path):
+    with open(path, 'rb') as f:
+        data = f.read(HEADER_READ_SIZE)
+        if len(data) >= HEADER.size and data[:len(MAGIC)] == MAGIC:
+            ext_length = HEADER.unpack_from(data)[-2]
+            missing = HEADER.size + ext_length - len(data)
+            if missing > 0:
+                data += f.read(missing)
+        file_size = os.fstat(f.fileno()).st_size
+
+    info = unpack_header(data)
+    if info.payload_offset + info.payload_length > file_size:
+        raise ValueError("Контейнер поврежден: шифр короче, чем указано в заголовке!")
+    return info
+
+# запись контейнера из порций шифра; длина шифра дописывается в заголовок в конце;
+# trailer - порции после основного шифра (уровни пирамиды), в его длину не входят
+def write_container(f, meta, chunks, extensions=None, trailer=()):
+    start = f.tell()
+    header = pack_header(meta, 0, extensions)
+    f.write(header)
+
+    payload_length = 0
+    for chunk in chunks:
+        f.write(chunk)
+        payload_length += len(chunk)
+    for chunk in trailer:
+        f.write(chunk)
+
+    end = f.tell()
+    f.seek(start)
+    f.write(pack_header(meta, payload_length, extensions))
+    f.seek(end)
+    return payload_length
+
+# метаданные и положение шифра уровня пирамиды; уровень 0 - исходное изображение
+def level_payload(info, level=0):
+    if level == 0:
+        return info.meta, info.payload_offset, info.payload_length
+
+    levels = unpack_pyramid_table(info.extensions.get(EXT_PYRAMID, b''))
+    if not levels:
+        raise ValueError("В контейнере нет пирамиды уменьшенных копий!")
+    if not 1 <= level <= len(levels):
+        raise ValueError(f"Уровень {level} отсутствует: в контейнере уровни 0-{len(levels)}")
+
+    entry = levels[level - 1]
+    meta = dict(info.meta, original_size=entry.size)
+    if entry.iv:
+        meta["nonce" if "nonce" in meta else "iv"] = entry.iv.hex()
+    return meta, info.payload_offset + entry.offset, entry.length
+
+# метаданные шифра: из заголовка контейнера или из .meta.json рядом с ним
+def read_meta(path, meta_file=None):
+    if is_container(path):
+        return read_container(path).meta
+
+    with open(meta_file or path + ".meta.json", 'r') as f:
+        return json.load(f)
+
+# метаданные и байты шифра для любого из двух форматов
+def read_payload(path, meta_file=None):
+    if not is_container(path):
+        meta = read_meta(path, meta_file)
+        with open(path, 'rb') as f:
+            return meta, f.read()
+
+    info = read_container(path)
+    with open(path, 'rb') as f:
+        f.seek(info.payload_offset)
+        return info.meta, f.read(info.payload_length)
+
+# перенос старого .bin + .meta.json в контейнер без расшифровки
+def convert_legacy(input_path, output_path, meta_file=None, chunk_size=CHUNK_SIZE):
+    if is_container(input_path):
+        raise ValueError(f"Файл уже является контейнером: {input_path}")
+
+    meta = read_meta(input_path, meta_file)
+    with open(output_path, 'wb') as f:
+        write_container(f, meta, iter_file_chunks(input_path, chunk_size))
+    return meta
@@ -0,0 +1,374 @@
+from PIL import Image
+import os
+from concurrent.futures import ThreadPoolExecutor
+from Cryptodome.Cipher import AES, ChaCha20_Poly1305
+
+from image_io import (
+    CHUNK_SIZE, source_filename, raw_image_size, iter_image_chunks, map_file, check_decrypted_size, pyramid_sizes,
+    iter_pyramid_images, buffer_image_info, byte_view, check_buffer_size, check_output_size
+)
+from kdf import simple_hash, kdf_params, key_from_params, key_fingerprint, check_key, DEFAULT_KDF
+from container import write_container, pyramid_table, EXT_PYRAMID
+
+# шифрование с аутентификацией (AEAD): AES-GCM и ChaCha20-Poly1305 по сегментам
+#
+# Пиксели делятся на сегменты по SEGMENT_SIZE байт, каждый шифруется отдельно и
+# получает свой тег (схема STREAM): шифр = сегмент_0 || тег_0 || сегмент_1 || тег_1 ...
+#
+# nonce сегмента (12 байт) = префикс (7 случайных байт на шифр, хранится в метаданных)
+# || номер сегмента (4 байта, big-endian) || 1, если сегмент последний, иначе 0.
+# Переставленные, повторенные или отброшенные в конце сегменты не проходят проверку.
+# Алгоритм, размер и режим изображения входят в проверяемые данные (AAD) каждого сегмента.
+#
+# Дешифрование проверяет тег каждого сегмента до перехода к следующему: неверный ключ
+# или поврежденный шифр отвергаются на первом же плохом сегменте, не расшифровывая
+# остальное. Сегменты независимы, поэтому при workers > 1 обрабатываются в потоках
+# (Cryptodome отпускает GIL); при дешифровании в потоках сегмент 0 проверяется заранее,
+# а на первом плохом теге ожидающие сегменты отменяются.
+#
+# Скорость: AES-GCM - гамма AES-CTR плюс GHASH, поэтому в одном потоке он не быстрее
+# AES-CTR; ChaCha20-Poly1305 в Cryptodome - переносимая реализация, медленнее AES с AES-NI.
+# Измерение - bench_aead_vs_ctr в scripts/benchmark.py.
+
+AEAD_ALGORITHMS = {'aes-gcm': 'AES-GCM', 'chacha20-poly1305': 'ChaCha20-Poly1305'}
+
+# длина ключа (AES-256, ChaCha20)
+AEAD_KEY_SIZE = 32
+
+NONCE_PREFIX_SIZE = 7
+TAG_SIZE = 16
+
+# размер сегмента: чем больше, тем меньше накладных расходов на тег, чем меньше - тем раньше отказ
+SEGMENT_SIZE = CHUNK_SIZE
+# номер сегмента занимает 4 байта nonce
+MAX_SEGMENTS = 2 ** 32
+
+def new_aead_cipher(key, algorithm, nonce):
+    if algorithm == 'aes-gcm':
+        return AES.new(key, AES.MODE_GCM, nonce=nonce, mac_len=TAG_SIZE)
+    elif algorithm == 'chacha20-poly1305':
+        return ChaCha20_Poly1305.new(key=key, nonce=nonce)
+    else:
+        raise ValueError(f"Неизвестный алгоритм AEAD: {algorithm}")
+
+def _algorithm_id(meta_name):
+    for algorithm, name in AEAD_ALGORITHMS.items():
+        if name == meta_name:
+            return algorithm
+    raise ValueError(f"Неверный алгоритм в метаданных: {meta_name}")
+
+def _segment_nonce(prefix, index, last):
+    return prefix + index.to_bytes(4, 'big') + (b'\x01' if last else b'\x00')
+
+# проверяемые данные сегмента: подмена размера или режима изображения не пройдет проверку;
+# для байтов без размера изображения (encrypt_bytes) - только алгоритм
+def associated_data(meta_name, size=None, image_mode=None):
+    if size is None:
+        return meta_name.encode('ascii')
+    width, height = size
+    return f"{meta_name}:{width}x{height}:{image_mode}".encode('ascii')
+
+def segment_count(data_length, segment_size=SEGMENT_SIZE):
+    return max(1, -(-data_length // segment_size))
+
+# длина шифра: данные и тег на каждый сегмент (пустые данные - один пустой сегмент)
+def encrypted_length(data_length, segment_size=SEGMENT_SIZE):
+    return data_length + segment_count(data_length, segment_size) * TAG_SIZE
+
+def generate_nonce_prefix():
+    return os.urandom(NONCE_PREFIX_SIZE)
+
+def initialize_aead_key(key_string):
+    if isinstance(key_string, bytes):
+        key_bytes = key_string
+    else:
+        key_bytes = key_string.encode('utf-8')
+
+    # прежний способ без соли: ключ другой длины приводится к 32 байтам простым хэшем
+    if len(key_bytes) != AEAD_KEY_SIZE:
+        key_bytes = simple_hash(key_bytes, AEAD_KEY_SIZE)
+    return key_bytes
+
+def derive_aead_key(key_string, params):
+    return key_from_params(key_string, params, AEAD_KEY_SIZE, initialize_aead_key)
+
+def seal_segment(key, algorithm, prefix, index, last, aad, data, output):
+    cipher = new_aead_cipher(key, algorithm, _segment_nonce(prefix, index, last))
+    cipher.update(aad)
+    cipher.encrypt(data, output=output[:len(data)])
+    output[len(data):len(data) + TAG_SIZE] = cipher.digest()
+
+def open_segment(key, algorithm, prefix, index, last, aad, data, output):
+    cipher = new_aead_cipher(key, algorithm, _segment_nonce(prefix, index, last))
+    cipher.update(aad)
+    body = len(data) - TAG_SIZE
+    cipher.decrypt(data[:body], output=output[:body])
+    try:
+        cipher.verify(data[body:])
+    except ValueError:
+        # непроверенные данные не оставляем в буфере вызывающего
+        output[:body] = bytes(body)
+        raise ValueError(f"Ошибка аутентификации сегмента {index}: неверный ключ или шифр поврежден!")
+
+# число сегментов по длине шифра; длина, которой не может быть у шифра, - ошибка
+def segment_count_from_encrypted(encrypted_length_value, segment_size=SEGMENT_SIZE):
+    stride = segment_size + TAG_SIZE
+    full, rest = divmod(encrypted_length_value, stride)
+    if (rest and rest < TAG_SIZE) or encrypted_length_value < TAG_SIZE:
+        raise ValueError(f"Шифр поврежден: длина {encrypted_length_value} байт не соответствует сегментам с тегами!")
+    return full + (1 if rest else 0)
+
+# все сегменты из source в target; при workers > 1 - в потоках, иначе по порядку
+# (дешифрование останавливается на первом сегменте, не прошедшем проверку, и в потоках)
+def crypt_segments(source, target, key, algorithm, prefix, aad, decrypt=False, workers=1, segment_size=SEGMENT_SIZE):
+    stride = segment_size + TAG_SIZE
+    data_length = len(source) - segment_count_from_encrypted(len(source), segment_size) * TAG_SIZE if decrypt else len(source)
+    count = segment_count(data_length, segment_size)
+    if count > MAX_SEGMENTS:
+        raise ValueError(f"Слишком много сегментов: {count}, максимум {MAX_SEGMENTS}")
+
+    def process_segment(index):
+        last = index == count - 1
+        plain_start = index * segment_size
+        plain_end = min(plain_start + segment_size, data_length)
+        sealed_start = index * stride
+        sealed_end = sealed_start + (plain_end - plain_start) + TAG_SIZE
+        if decrypt:
+            open_segment(key, algorithm, prefix, index, last, aad, source[sealed_start:sealed_end], target[plain_start:plain_end])
+        else:
+            seal_segment(key, algorithm, prefix, index, last, aad, source[plain_start:plain_end], target[sealed_start:sealed_end])
+
+    if workers <= 1 or count == 1:
+        for index in range(count):
+            process_segment(index)
+    else:
+        # дешифрование: сегмент 0 проверяется до запуска потоков - неверный ключ отвергается сразу
+        first = 1 if decrypt else 0
+        if decrypt:
+            process_segment(0)
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = [executor.submit(process_segment, index) for index in range(first, count)]
+            # результаты по порядку сегментов: на первом плохом теге ожидающие сегменты отменяются
+            for future in futures:
+                future.result()
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    return data_length if decrypt else len(source) + count * TAG_SIZE
+
+def _prepare_nonce(nonce):
+    if nonce is None:
+        nonce = generate_nonce_prefix()
+        print(f"Сгенерирован случайный префикс nonce: {nonce.hex()}")
+    else:
+        if isinstance(nonce, str):
+            nonce = bytes.fromhex(nonce)
+        if len(nonce) != NONCE_PREFIX_SIZE:
+            raise ValueError(f"Префикс nonce для AEAD должен быть {NONCE_PREFIX_SIZE} байт, а не {len(nonce)}!")
+        print(f"Используется префикс nonce: {nonce.hex()}")
+    return nonce
+
+def _cipher_meta(key_string, key_bytes, algorithm, nonce, params):
+    meta = {
+        "algorithm": AEAD_ALGORITHMS[algorithm],
+        "key_size": len(key_bytes),
+        "key_hash": key_fingerprint(key_string, key_bytes, params),
+        "nonce": nonce.hex(),
+        "segment_size": SEGMENT_SIZE
+    }
+    meta.update(params)
+    return meta
+
+def _build_meta(size, image_mode, original_filename, cipher_meta):
+    meta = {
+        "algorithm": cipher_meta['algorithm'],
+        "original_size": size,
+        "mode": image_mode,
+        "key_size": cipher_meta['key_size'],
+        "original_filename": original_filename,
+        "key_hash": cipher_meta['key_hash'],
+        "nonce": cipher_meta['nonce'],
+        "segment_size": cipher_meta['segment_size']
+    }
+
+    for field in ['kdf', 'kdf_cost', 'salt']:
+        if field in cipher_meta:
+            meta[field] = cipher_meta[field]
+
+    return meta
+
+# шифрование байтов пикселей в памяти; size/image_mode (если заданы) входят в проверяемые данные
+def aead_encrypt_bytes(data, key_string, algorithm='aes-gcm', nonce=None, workers=1, kdf=DEFAULT_KDF, salt=None, size=None, image_mode=None):
+    params = kdf_params(kdf, salt)
+    key_bytes = derive_aead_key(key_string, params)
+    nonce = _prepare_nonce(nonce)
+    cipher_meta = _cipher_meta(key_string, key_bytes, algorithm, nonce, params)
+
+    source = byte_view(data)
+    output = bytearray(encrypted_length(len(source)))
+    aad = associated_data(cipher_meta['algorithm'], size, image_mode)
+    crypt_segments(source, memoryview(output), key_bytes, algorithm, nonce, aad, workers=workers)
+    print(f"Режим: {cipher_meta['algorithm']}")
+
+    return output, cipher_meta
+
+def aead_encrypt(image_path, key_string, algorithm='aes-gcm', nonce=None, workers=1, kdf=DEFAULT_KDF, salt=None):
+    img = Image.open(image_path)
+    img_bytes = img.tobytes()
+
+    encrypted_bytes, cipher_meta = aead_encrypt_bytes(img_bytes, key_string, algorithm, nonce, workers=workers, kdf=kdf, salt=salt,
+                                                      size=img.size, image_mode=img.mode)
+
+    return encrypted_bytes, _build_meta(img.size, img.mode, source_filename(image_path), cipher_meta)
+
+# "сырые" пиксели из любого буфера сразу в буфер вызывающего; (число байт, метаданные)
+def aead_encrypt_into(data, output, key_string, size=None, image_mode=None, algorithm='aes-gcm', nonce=None, workers=1, kdf=DEFAULT_KDF, salt=None,
+                      original_filename=''):
+    size, image_mode = buffer_image_info(data, size, image_mode)
+    source = byte_view(data)
+    check_buffer_size(len(source), raw_image_size(size, image_mode))
+    length = encrypted_length(len(source))
+    target = byte_view(output, writable=True)
+    check_output_size(len(target), length)
+
+    params = kdf_params(kdf, salt)
+    key_bytes = derive_aead_key(key_string, params)
+    nonce = _prepare_nonce(nonce)
+    cipher_meta = _cipher_meta(key_string, key_bytes, algorithm, nonce, params)
+    aad = associated_data(cipher_meta['algorithm'], size, image_mode)
+    crypt_segments(source, target[:length], key_bytes, algorithm, nonce, aad, workers=workers)
+
+    return length, _build_meta(size, image_mode, original_filename, cipher_meta)
+
+# сегменты шифра из порций изображения: порции перегруппировываются в сегменты ровно по SEGMENT_SIZE;
+# с executor - пачками по workers сегментов в потоках (в памяти не больше одной пачки)
+def _sealed_segments(chunks, data_length, key_bytes, algorithm, nonce, aad, executor=None, workers=1):
+    count = segment_count(data_length)
+
+    def seal(index, data):
+        output = bytearray(len(data) + TAG_SIZE)
+        seal_segment(key_bytes, algorithm, nonce, index, index == count - 1, aad, data, memoryview(output))
+        return output
+
+    def segments():
+        pending = bytearray()
+        index = 0
+        for chunk in chunks:
+            pending += chunk
+            while len(pending) >= SEGMENT_SIZE and index < count - 1:
+                yield index, bytes(pending[:SEGMENT_SIZE])
+                del pending[:SEGMENT_SIZE]
+                index += 1
+        yield index, bytes(pending)
+
+    if executor is None:
+        for index, data in segments():
+            yield seal(index, data)
+        return
+
+    batch = []
+    for segment in segments():
+        batch.append(segment)
+        if len(batch) == workers:
+            yield from executor.map(lambda item: seal(*item), batch)
+            batch = []
+    yield from executor.map(lambda item: seal(*item), batch)
+
+# потоковое шифрование в файл; pyramid_levels - уменьшенные копии, каждая со своим префиксом nonce
+def aead_encrypt_to_file(image_path, output_path, key_string, algorithm='aes-gcm', nonce=None, workers=1, chunk_size=CHUNK_SIZE, container=False,
+                         pyramid_levels=0, kdf=DEFAULT_KDF, salt=None):
+    if pyramid_levels and not container:
+        raise ValueError("Пирамида уменьшенных копий хранится только в формате container!")
+
+    img = Image.open(image_path)
+    params = kdf_params(kdf, salt)
+    key_bytes = derive_aead_key(key_string, params)
+    nonce = _prepare_nonce(nonce)
+    meta = _build_meta(img.size, img.mode, source_filename(image_path), _cipher_meta(key_string, key_bytes, algorithm, nonce, params))
+    print(f"Режим: {meta['algorithm']}")
+
+    data_length = raw_image_size(img.size, img.mode)
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    chunks = _sealed_segments(iter_image_chunks(img, chunk_size), data_length, key_bytes, algorithm, nonce,
+                              associated_data(meta['algorithm'], img.size, img.mode), executor, workers)
+
+    level_nonces = [generate_nonce_prefix() for _ in range(pyramid_levels)]
+
+    def level_chunks():
+        for level_img, level_nonce in zip(iter_pyramid_images(img, pyramid_levels), level_nonces):
+            yield from _sealed_segments(iter_image_chunks(level_img, chunk_size), raw_image_size(level_img.size, img.mode), key_bytes,
+                                        algorithm, level_nonce, associated_data(meta['algorithm'], level_img.size, img.mode), executor, workers)
+
+    try:
+        with open(output_path, 'wb') as f:
+            if container:
+                extensions = {}
+                if pyramid_levels:
+                    extensions[EXT_PYRAMID] = pyramid_table(encrypted_length(data_length), [
+                        (size, level_nonce, encrypted_length(raw_image_size(size, img.mode)))
+                        for size, level_nonce in zip(pyramid_sizes(img.size, pyramid_levels), level_nonces)
+                    ])
+                write_container(f, meta, chunks, extensions, trailer=level_chunks())
+            else:
+                for chunk in chunks:
+                    f.write(chunk)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return meta
+
+def _prepare_decrypt(key_string, meta):
+    algorithm = _algorithm_id(meta.get('algorithm', ''))
+    if meta.get('segment_size', SEGMENT_SIZE) != SEGMENT_SIZE:
+        raise ValueError(f"Неподдерживаемый размер сегмента: {meta['segment_size']}")
+
+    nonce_hex = meta.get('nonce')
+    if not nonce_hex:
+        raise ValueError("Nonce не найден в метаданных!")
+
+    key_bytes = derive_aead_key(key_string, meta)
+    check_key(key_string, key_bytes, meta)
+    return algorithm, key_bytes, bytes.fromhex(nonce_hex)
+
+def _aad_for(meta):
+    return associated_data(meta['algorithm'], meta.get('original_size'), meta.get('mode'))
+
+# дешифрование байтов в памяти; meta - метаданные файла или параметры из aead_encrypt_bytes
+def aead_decrypt_bytes(encrypted_bytes, key_string, meta, workers=1):
+    algorithm, key_bytes, nonce = _prepare_decrypt(key_string, meta)
+    source = byte_view(encrypted_bytes)
+    output = bytearray(len(source) - segment_count_from_encrypted(len(source)) * TAG_SIZE)
+    crypt_segments(source, memoryview(output), key_bytes, algorithm, nonce, _aad_for(meta), decrypt=True, workers=workers)
+    return output
+
+def aead_decrypt(input_path, key_string, meta, workers=1):
+    with open(input_path, 'rb') as f:
+        encrypted_bytes = f.read()
+
+    return aead_decrypt_bytes(encrypted_bytes, key_string, meta, workers=workers)
+
+# шифр отображается в память и расшифровывается сегментами в буфер размером с изображение
+def aead_decrypt_to_buffer(input_path, key_string, meta, workers=1, payload_offset=0, payload_length=None):
+    algorithm, key_bytes, nonce = _prepare_decrypt(key_string, meta)
+    expected_size = raw_image_size(meta['original_size'], meta['mode'])
+
+    with map_file(input_path, payload_offset, payload_length) as payload:
+        check_decrypted_size(len(payload) - segment_count_from_encrypted(len(payload)) * TAG_SIZE, expected_size)
+        buffer = bytearray(expected_size)
+        crypt_segments(payload, memoryview(buffer), key_bytes, algorithm, nonce, _aad_for(meta), decrypt=True, workers=workers)
+
+    return buffer
+
+# дешифрование в буфер вызывающего; возвращает число записанных байт
+def aead_decrypt_into(encrypted, output, key_string, meta, workers=1):
+    algorithm, key_bytes, nonce = _prepare_decrypt(key_string, meta)
+    expected_size = raw_image_size(meta['original_size'], meta['mode'])
+    source = byte_view(encrypted)
+    check_decrypted_size(len(source) - segment_count_from_encrypted(len(source)) * TAG_SIZE, expected_size)
+    target = byte_view(output, writable=True)
+    check_output_size(len(target), expected_size)
+
+    return crypt_segments(source, target[:expected_size], key_bytes, algorithm, nonce, _aad_for(meta), decrypt=True, workers=workers)
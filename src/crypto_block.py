@@ -1,17 +1,47 @@
 from PIL import Image
-import os
+from concurrent.futures import ThreadPoolExecutor
 from Cryptodome.Cipher import AES
 from Cryptodome.Util.Padding import pad, unpad
 from Cryptodome.Random import get_random_bytes
 
+from image_io import (
+    CHUNK_SIZE, source_filename, raw_image_size, iter_image_chunks, map_file, check_decrypted_size, tile_grid, tiles_in_region,
+    pyramid_sizes, iter_pyramid_images, buffer_image_info, byte_view, check_buffer_size, check_output_size
+)
+from kdf import kdf_params, key_from_params, key_fingerprint, check_key, DEFAULT_KDF
+from container import write_container, pack_tile_table, unpack_tile_table, pyramid_table, EXT_TILE_TABLE, EXT_PYRAMID
+
+# минимальный размер сегмента для параллельного шифрования
+MIN_PARALLEL_SEGMENT = 64 * 1024
+
+# длина ключа, получаемого через KDF (AES-256); прежний способ дает 16 байт
+AES_KEY_SIZE = 32
+
+# плиточный режим: сторона плитки по умолчанию и сдвиг счетчика CTR на номер плитки
+# (каждой плитке - свои 2^32 блоков счетчика, гамма плиток не пересекается)
+DEFAULT_TILE_SIZE = 256
+TILE_COUNTER_SHIFT = 32
+
 #шифрование блоков независимо
-def ecb_encrypt(data, key):
+def ecb_encrypt(data, key, workers=1):
+    if workers > 1:
+        # выровненная часть - параллельно, паддинг только у хвоста
+        aligned = len(data) - len(data) % AES.block_size
+        output = bytearray(aligned + AES.block_size)
+        out = memoryview(output)
+        parallel_crypt(memoryview(data)[:aligned], key, 'ecb', workers=workers, output=out[:aligned])
+        AES.new(key, AES.MODE_ECB).encrypt(pad(bytes(data[aligned:]), AES.block_size), output=out[aligned:])
+        return output
+    
     cipher = AES.new(key, AES.MODE_ECB)
     #дополнение данных до размера блока
     padded_data = pad(data, AES.block_size)
     return cipher.encrypt(padded_data)
 
-def ecb_decrypt(encrypted_data, key):
+def ecb_decrypt(encrypted_data, key, workers=1):
+    if workers > 1:
+        return _unpad_in_place(parallel_crypt(encrypted_data, key, 'ecb', decrypt=True, workers=workers))
+    
     cipher = AES.new(key, AES.MODE_ECB)
     decrypted_data = cipher.decrypt(encrypted_data)
     return unpad(decrypted_data, AES.block_size)
@@ -22,7 +52,10 @@ def cbc_encrypt(data, key, iv):
     padded_data = pad(data, AES.block_size)
     return cipher.encrypt(padded_data)
 
-def cbc_decrypt(encrypted_data, key, iv):
+def cbc_decrypt(encrypted_data, key, iv, workers=1):
+    if workers > 1:
+        return _unpad_in_place(parallel_crypt(encrypted_data, key, 'cbc', decrypt=True, workers=workers, iv=iv))
+    
     cipher = AES.new(key, AES.MODE_CBC, iv=iv)
     decrypted_data = cipher.decrypt(encrypted_data)
     return unpad(decrypted_data, AES.block_size)
@@ -32,19 +65,151 @@ def cfb_encrypt(data, key, iv):
     cipher = AES.new(key, AES.MODE_CFB, iv=iv, segment_size=128)
     return cipher.encrypt(data)
 
-def cfb_decrypt(encrypted_data, key, iv):
+def cfb_decrypt(encrypted_data, key, iv, workers=1):
+    if workers > 1:
+        return parallel_crypt(encrypted_data, key, 'cfb', decrypt=True, workers=workers, iv=iv)
+    
     cipher = AES.new(key, AES.MODE_CFB, iv=iv, segment_size=128)
     return cipher.decrypt(encrypted_data)
 
 #шифр с уникальным nonce, паддинг не нужен
-def ctr_encrypt(data, key, nonce):
+def ctr_encrypt(data, key, nonce, workers=1):
+    if workers > 1:
+        return parallel_crypt(data, key, 'ctr', workers=workers, nonce=nonce)
+    
     cipher = AES.new(key, AES.MODE_CTR, nonce=nonce)
     return cipher.encrypt(data)
 
-def ctr_decrypt(encrypted_data, key, nonce):
+def ctr_decrypt(encrypted_data, key, nonce, workers=1):
+    if workers > 1:
+        return parallel_crypt(encrypted_data, key, 'ctr', decrypt=True, workers=workers, nonce=nonce)
+    
     cipher = AES.new(key, AES.MODE_CTR, nonce=nonce)
     return cipher.decrypt(encrypted_data)
 
+# режимы, которые можно обрабатывать независимыми сегментами
+def is_parallelizable(mode, decrypt=False):
+    return mode in ['ecb', 'ctr'] or (decrypt and mode in ['cbc', 'cfb'])
+
+# параллельная обработка выровненными по блоку сегментами в потоках
+# (Cryptodome отпускает GIL на время шифрования); результат побитно совпадает
+# с однопоточным: CTR получает смещение счетчика, CBC/CFB при дешифровании -
+# предыдущий блок шифртекста в качестве IV
+def parallel_crypt(data, key, mode, decrypt=False, workers=1, iv=None, nonce=None, block_offset=0, output=None):
+    if not is_parallelizable(mode, decrypt):
+        raise ValueError(f"Режим {mode.upper()} нельзя распараллелить при {'дешифровании' if decrypt else 'шифровании'}")
+    
+    data = memoryview(data).cast('B')
+    if output is None:
+        output = bytearray(len(data))
+    out = memoryview(output)
+    
+    per_worker = -(-len(data) // max(1, workers))
+    segment = max(MIN_PARALLEL_SEGMENT, -(-per_worker // AES.block_size) * AES.block_size)
+    
+    def process_segment(start):
+        end = min(start + segment, len(data))
+        if mode == 'ctr':
+            cipher = AES.new(key, AES.MODE_CTR, nonce=nonce, initial_value=block_offset + start // AES.block_size)
+        elif mode == 'ecb':
+            cipher = AES.new(key, AES.MODE_ECB)
+        else:
+            segment_iv = iv if start == 0 else bytes(data[start - AES.block_size:start])
+            cipher = new_aes_cipher(key, mode, iv=segment_iv)
+        
+        if decrypt:
+            cipher.decrypt(data[start:end], output=out[start:end])
+        else:
+            cipher.encrypt(data[start:end], output=out[start:end])
+    
+    starts = range(0, len(data), segment)
+    if workers <= 1 or len(starts) <= 1:
+        for start in starts:
+            process_segment(start)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(process_segment, starts))
+    
+    return output
+
+# снятие паддинга без копирования всего буфера
+def _unpad_in_place(buffer):
+    if len(buffer) < AES.block_size:
+        raise ValueError("Padding is incorrect.")
+    tail = unpad(bytes(buffer[-AES.block_size:]), AES.block_size)
+    del buffer[len(buffer) - AES.block_size + len(tail):]
+    return buffer
+
+def new_aes_cipher(key, mode, iv=None, nonce=None):
+    if mode == 'ecb':
+        return AES.new(key, AES.MODE_ECB)
+    elif mode == 'cbc':
+        return AES.new(key, AES.MODE_CBC, iv=iv)
+    elif mode == 'cfb':
+        return AES.new(key, AES.MODE_CFB, iv=iv, segment_size=128)
+    elif mode == 'ctr':
+        return AES.new(key, AES.MODE_CTR, nonce=nonce)
+    else:
+        raise ValueError(f"Неизвестный режим шифрования: {mode}")
+
+# пошаговое шифрование порциями: один объект шифра на всё изображение,
+# паддинг (ECB/CBC) добавляется/снимается только у последней порции;
+# при workers > 1 параллелизуемые режимы обрабатывают порцию в потоках
+class AESChunkCipher:
+
+    def __init__(self, key, mode, iv=None, nonce=None, decrypt=False, workers=1):
+        self.key = key
+        self.mode = mode
+        self.iv = iv
+        self.nonce = nonce
+        self.decrypt = decrypt
+        self.workers = workers
+        self.requires_padding = mode in ['ecb', 'cbc']
+        self.parallel = workers > 1 and is_parallelizable(mode, decrypt)
+        self.cipher = None if self.parallel else new_aes_cipher(key, mode, iv, nonce)
+        self.block_offset = 0
+        self.pending = b''
+
+    def _process(self, data):
+        if not self.parallel:
+            if self.decrypt:
+                return self.cipher.decrypt(data)
+            return self.cipher.encrypt(data)
+
+        output = parallel_crypt(data, self.key, self.mode, decrypt=self.decrypt, workers=self.workers,
+                                iv=self.iv, nonce=self.nonce, block_offset=self.block_offset)
+        # следующая порция продолжает счетчик CTR / цепочку CBC и CFB
+        self.block_offset += len(data) // AES.block_size
+        if self.mode in ['cbc', 'cfb'] and len(data) >= AES.block_size:
+            self.iv = bytes(data[-AES.block_size:])
+        return output
+
+    def update(self, data):
+        if not self.requires_padding and not self.parallel:
+            return self._process(data)
+
+        # в параллельном режиме порции тоже выравниваются по блоку
+        data = self.pending + data
+        aligned = len(data) - len(data) % AES.block_size
+        # при дешифровании последний блок придерживаем - в нем паддинг
+        if self.requires_padding and self.decrypt and aligned == len(data):
+            aligned = max(0, aligned - AES.block_size)
+
+        self.pending = data[aligned:]
+        if aligned == 0:
+            return b''
+        return self._process(data[:aligned])
+
+    def finalize(self):
+        if self.requires_padding:
+            if self.decrypt:
+                return unpad(bytes(self._process(self.pending)), AES.block_size)
+            return self._process(pad(self.pending, AES.block_size))
+
+        if self.pending:
+            return self._process(self.pending)
+        return b''
+
 def initialize_aes_key(key_string):
     if isinstance(key_string, bytes):
         key_bytes = key_string
@@ -59,42 +224,17 @@ def initialize_aes_key(key_string):
     
     return key_bytes
 
+# ключ по параметрам KDF из метаданных; без них - прежний initialize_aes_key
+def derive_aes_key(key_string, params):
+    return key_from_params(key_string, params, AES_KEY_SIZE, initialize_aes_key)
+
 def generate_secure_iv():
     return get_random_bytes(AES.block_size) 
 
 def generate_secure_nonce():
     return get_random_bytes(8)  # 8 байт для CTR nonce
 
-def simple_hash(data, output_length=32, return_hex=False):
-    if isinstance(data, str):
-        data = data.encode('utf-8')
-    
-    # Простой алгоритм перемешивания
-    result = bytearray(output_length)
-    
-    #заполнение первоначальное 
-    for i in range(output_length):
-        result[i] = (data[i % len(data)] + i * 37) & 0xFF
-    
-    # Раунды перемешивания
-    for round in range(5):
-        for i in range(output_length):
-            # XOR с соседним байтом
-            result[i] ^= result[(i + 11) % output_length]
-            result[i] = (result[i] * 167 + 113) & 0xFF
-    
-    if return_hex:
-        return result.hex()
-    else:
-        return bytes(result)
-
-def block_encrypt(image_path, key_string, mode='cbc', iv=None, nonce=None):
-    img = Image.open(image_path)
-    img_bytes = img.tobytes()
-    
-    #ключ
-    key_bytes = initialize_aes_key(key_string)
-    
+def _prepare_iv_nonce(mode, iv, nonce):
     #IV/nonce - конвертируем строки в bytes
     if mode in ['cbc', 'cfb']:
         iv = generate_secure_iv()
@@ -109,53 +249,343 @@ def block_encrypt(image_path, key_string, mode='cbc', iv=None, nonce=None):
                 nonce = bytes.fromhex(nonce)
             print(f"Используется nonce: {nonce.hex()}")
     
+    return iv, nonce
+
+def _cipher_meta(key_string, key_bytes, mode, iv, nonce, params):
+    meta = {
+        "algorithm": f"AES-{mode.upper()}",
+        "key_size": len(key_bytes),
+        "key_hash": key_fingerprint(key_string, key_bytes, params),
+        "requires_padding": mode in ['ecb', 'cbc']
+    }
+    meta.update(params)
+    
+    #добавляем IV/nonce в метаданные
+    if mode in ['cbc', 'cfb']:
+        meta['iv'] = iv.hex()
+    
+    if mode == 'ctr':
+        meta['nonce'] = nonce.hex()
+    
+    return meta
+
+def _build_meta(size, image_mode, original_filename, cipher_meta):
+    #метаданные
+    meta = {
+        "algorithm": cipher_meta['algorithm'],
+        "original_size": size,
+        "mode": image_mode,
+        "key_size": cipher_meta['key_size'],
+        "original_filename": original_filename,
+        "key_hash": cipher_meta['key_hash'],
+        "requires_padding": cipher_meta['requires_padding']
+    }
+    
+    for field in ['iv', 'nonce', 'kdf', 'kdf_cost', 'salt']:
+        if field in cipher_meta:
+            meta[field] = cipher_meta[field]
+    
+    return meta
+
+# шифрование уже декодированных байтов пикселей (байты на входе, байты на выходе);
+# вторым значением возвращаются параметры шифра для дешифрования
+def block_encrypt_bytes(data, key_string, mode='cbc', iv=None, nonce=None, workers=1, kdf=DEFAULT_KDF, salt=None):
+    #ключ
+    params = kdf_params(kdf, salt)
+    key_bytes = derive_aes_key(key_string, params)
+    
+    iv, nonce = _prepare_iv_nonce(mode, iv, nonce)
+    
     #режим шифрования
     if mode == 'ecb':
-        encrypted_bytes = ecb_encrypt(img_bytes, key_bytes)
+        encrypted_bytes = ecb_encrypt(data, key_bytes, workers=workers)
         print("Режим: ECB")
         
     elif mode == 'cbc':
-        encrypted_bytes = cbc_encrypt(img_bytes, key_bytes, iv)
+        encrypted_bytes = cbc_encrypt(data, key_bytes, iv)
         print("Режим: CBC")
         
     elif mode == 'cfb':
-        encrypted_bytes = cfb_encrypt(img_bytes, key_bytes, iv)
+        encrypted_bytes = cfb_encrypt(data, key_bytes, iv)
         print("Режим: CFB")
         
     elif mode == 'ctr':
-        encrypted_bytes = ctr_encrypt(img_bytes, key_bytes, nonce)
+        encrypted_bytes = ctr_encrypt(data, key_bytes, nonce, workers=workers)
         print("Режим: CTR")
         
     else:
         raise ValueError(f"Неизвестный режим шифрования: {mode}")
     
-    #метаданные
-    meta = {
-        "algorithm": f"AES-{mode.upper()}",
-        "original_size": img.size,
-        "mode": img.mode,
-        "key_size": len(key_bytes),
-        "original_filename": os.path.basename(image_path),
-        "key_hash": simple_hash(key_string, 16, return_hex=True),
-        "requires_padding": mode in ['ecb', 'cbc']
-    }
+    return encrypted_bytes, _cipher_meta(key_string, key_bytes, mode, iv, nonce, params)
+
+def block_encrypt(image_path, key_string, mode='cbc', iv=None, nonce=None, workers=1, kdf=DEFAULT_KDF, salt=None):
+    img = Image.open(image_path)
+    img_bytes = img.tobytes()
     
-    #добавляем IV/nonce в метаданные
-    if mode in ['cbc', 'cfb']:
-        meta['iv'] = iv.hex()
+    encrypted_bytes, cipher_meta = block_encrypt_bytes(img_bytes, key_string, mode=mode, iv=iv, nonce=nonce, workers=workers, kdf=kdf, salt=salt)
     
-    if mode == 'ctr':
-        meta['nonce'] = nonce.hex()
+    return encrypted_bytes, _build_meta(img.size, img.mode, source_filename(image_path), cipher_meta)
+
+# шифрование "сырых" пикселей из любого буфера (NumPy-массив, memoryview, bytearray)
+# сразу в выходной буфер вызывающего - без декодирования, PNG и промежуточных bytes;
+# output должен вмещать encrypted_length(len(data), mode) байт (ECB/CBC - с паддингом);
+# возвращает (число записанных байт, метаданные)
+def block_encrypt_into(data, output, key_string, size=None, image_mode=None, mode='cbc', iv=None, nonce=None, workers=1, kdf=DEFAULT_KDF, salt=None,
+                       original_filename=''):
+    size, image_mode = buffer_image_info(data, size, image_mode)
+    source = byte_view(data)
+    check_buffer_size(len(source), raw_image_size(size, image_mode))
+    length = encrypted_length(len(source), mode)
+    target = byte_view(output, writable=True)
+    check_output_size(len(target), length)
+    
+    params = kdf_params(kdf, salt)
+    key_bytes = derive_aes_key(key_string, params)
+    iv, nonce = _prepare_iv_nonce(mode, iv, nonce)
+    print(f"Режим: {mode.upper()}")
+    
+    if mode in ['ecb', 'cbc']:
+        # выровненная часть - прямо в выходной буфер, паддинг копируется только у хвоста
+        aligned = len(source) - len(source) % AES.block_size
+        if workers > 1 and is_parallelizable(mode):
+            parallel_crypt(source[:aligned], key_bytes, mode, workers=workers, output=target[:aligned])
+            cipher = new_aes_cipher(key_bytes, mode)
+        else:
+            cipher = new_aes_cipher(key_bytes, mode, iv=iv)
+            if aligned:
+                cipher.encrypt(source[:aligned], output=target[:aligned])
+        cipher.encrypt(pad(bytes(source[aligned:]), AES.block_size), output=target[aligned:length])
+    
+    elif workers > 1 and is_parallelizable(mode):
+        parallel_crypt(source, key_bytes, mode, workers=workers, iv=iv, nonce=nonce, output=target[:length])
+    
+    else:
+        new_aes_cipher(key_bytes, mode, iv=iv, nonce=nonce).encrypt(source, output=target[:length])
+    
+    return length, _build_meta(size, image_mode, original_filename, _cipher_meta(key_string, key_bytes, mode, iv, nonce, params))
+
+# длина шифра для данных заданной длины (ECB/CBC дополняются до целого блока)
+def encrypted_length(data_length, mode):
+    if mode in ['ecb', 'cbc']:
+        return (data_length // AES.block_size + 1) * AES.block_size
+    return data_length
+
+def _encrypt_chunks(img, cipher, chunk_size):
+    for chunk in iter_image_chunks(img, chunk_size):
+        yield cipher.update(chunk)
+    yield cipher.finalize()
+
+# потоковое шифрование: изображение читается полосами и пишется в файл по частям
+# container=True - шифр с заголовком в одном файле, иначе только шифр (метаданные отдельно);
+# pyramid_levels - сколько уменьшенных копий (1/2, 1/4, ...) дописать в контейнер,
+# каждая шифруется с собственным IV/nonce
+def block_encrypt_to_file(image_path, output_path, key_string, mode='cbc', iv=None, nonce=None, chunk_size=CHUNK_SIZE, workers=1, container=False, pyramid_levels=0,
+                          kdf=DEFAULT_KDF, salt=None):
+    if pyramid_levels and not container:
+        raise ValueError("Пирамида уменьшенных копий хранится только в формате container!")
+    
+    img = Image.open(image_path)
+    params = kdf_params(kdf, salt)
+    key_bytes = derive_aes_key(key_string, params)
+    iv, nonce = _prepare_iv_nonce(mode, iv, nonce)
+    
+    cipher = AESChunkCipher(key_bytes, mode, iv=iv, nonce=nonce, workers=workers)
+    print(f"Режим: {mode.upper()}")
+    meta = _build_meta(img.size, img.mode, source_filename(image_path), _cipher_meta(key_string, key_bytes, mode, iv, nonce, params))
+    
+    # уровни пирамиды: свой IV/nonce на уровень, длины известны заранее
+    levels = []
+    for size in pyramid_sizes(img.size, pyramid_levels):
+        level_iv, level_nonce = _prepare_iv_nonce(mode, None, None)
+        level_cipher = AESChunkCipher(key_bytes, mode, iv=level_iv, nonce=level_nonce, workers=workers)
+        levels.append((size, level_iv or level_nonce or b'', level_cipher))
+    
+    def level_chunks():
+        for level_img, (_, _, level_cipher) in zip(iter_pyramid_images(img, pyramid_levels), levels):
+            yield from _encrypt_chunks(level_img, level_cipher, chunk_size)
+    
+    with open(output_path, 'wb') as f:
+        if container:
+            extensions = {}
+            if levels:
+                payload_length = encrypted_length(raw_image_size(img.size, img.mode), mode)
+                extensions[EXT_PYRAMID] = pyramid_table(payload_length, [
+                    (size, level_iv, encrypted_length(raw_image_size(size, img.mode), mode)) for size, level_iv, _ in levels
+                ])
+            write_container(f, meta, _encrypt_chunks(img, cipher, chunk_size), extensions, trailer=level_chunks())
+        else:
+            for chunk in _encrypt_chunks(img, cipher, chunk_size):
+                f.write(chunk)
     
-    return encrypted_bytes, meta
+    return meta
 
+def _tile_counter(index):
+    return index << TILE_COUNTER_SHIFT
+
+# плиточное шифрование (только CTR): каждая плитка шифруется отдельно со своим
+# смещением счетчика, таблица плиток (смещение и длина в шифре) пишется в заголовок
+# контейнера - по ней block_decrypt_region расшифровывает только нужные плитки
+def block_encrypt_tiles_to_file(image_path, output_path, key_string, tile_size=DEFAULT_TILE_SIZE, nonce=None, workers=1, kdf=DEFAULT_KDF, salt=None):
+    if tile_size <= 0:
+        raise ValueError(f"Размер плитки должен быть положительным: {tile_size}")
+    
+    img = Image.open(image_path)
+    params = kdf_params(kdf, salt)
+    key_bytes = derive_aes_key(key_string, params)
+    _, nonce = _prepare_iv_nonce('ctr', None, nonce)
+    
+    print(f"Режим: CTR, плитки {tile_size}x{tile_size}")
+    meta = _build_meta(img.size, img.mode, source_filename(image_path), _cipher_meta(key_string, key_bytes, 'ctr', None, nonce, params))
+    meta['tile_size'] = [tile_size, tile_size]
+    
+    # CTR не меняет длину, поэтому таблица известна до шифрования
+    tiles = list(tile_grid(img.size, meta['tile_size']))
+    entries = []
+    offset = 0
+    for _, (left, top, right, bottom) in tiles:
+        length = raw_image_size((right - left, bottom - top), img.mode)
+        entries.append((offset, length))
+        offset += length
+    
+    def chunks():
+        for index, box in tiles:
+            yield parallel_crypt(img.crop(box).tobytes(), key_bytes, 'ctr', workers=workers, nonce=nonce, block_offset=_tile_counter(index))
+    
+    with open(output_path, 'wb') as f:
+        write_container(f, meta, chunks(), {EXT_TILE_TABLE: pack_tile_table(meta['tile_size'], entries)})
+    
+    return meta
 
-def block_decrypt(input_path, key_string, meta):
+
+def block_decrypt(input_path, key_string, meta, workers=1):
 
     # Загружаем зашифрованные данные
     with open(input_path, 'rb') as f:
         encrypted_bytes = f.read()
     
+    return block_decrypt_bytes(encrypted_bytes, key_string, meta, workers=workers)
+
+# дешифрование байтов в памяти; meta - метаданные файла или параметры из block_encrypt_bytes
+def block_decrypt_bytes(encrypted_bytes, key_string, meta, workers=1):
+    mode, key_bytes, iv, nonce = _prepare_decrypt(key_string, meta)
+    
+    # Выбираем режим дешифрования
+    if mode == 'ecb':
+        decrypted_bytes = ecb_decrypt(encrypted_bytes, key_bytes, workers=workers)
+        
+    elif mode == 'cbc':
+        decrypted_bytes = cbc_decrypt(encrypted_bytes, key_bytes, iv, workers=workers)
+        
+    elif mode == 'cfb':
+        decrypted_bytes = cfb_decrypt(encrypted_bytes, key_bytes, iv, workers=workers)
+        
+    elif mode == 'ctr':
+        decrypted_bytes = ctr_decrypt(encrypted_bytes, key_bytes, nonce, workers=workers)
+        
+    else:
+        raise ValueError(f"Неизвестный режим шифрования: {mode}")
+    
+    return decrypted_bytes
+
+# шифр отображается в память и расшифровывается сразу в итоговый буфер (output=),
+# без промежуточных bytes; паддинг снимается обрезкой хвоста буфера;
+# payload_offset/payload_length - положение шифра в файле (для контейнера)
+def block_decrypt_to_buffer(input_path, key_string, meta, workers=1, payload_offset=0, payload_length=None):
+    mode, key_bytes, iv, nonce = _prepare_decrypt(key_string, meta)
+    expected_size = raw_image_size(meta['original_size'], meta['mode'])
+    requires_padding = mode in ['ecb', 'cbc']
+    
+    with map_file(input_path, payload_offset, payload_length) as payload:
+        if requires_padding and len(payload) % AES.block_size:
+            raise ValueError(f"Длина шифра ({len(payload)} байт) не кратна размеру блока AES!")
+        if not requires_padding:
+            check_decrypted_size(len(payload), expected_size)
+        
+        buffer = bytearray(len(payload))
+        parallel_crypt(payload, key_bytes, mode, decrypt=True, workers=workers, iv=iv, nonce=nonce, output=buffer)
+    
+    if requires_padding:
+        _unpad_in_place(buffer)
+        check_decrypted_size(len(buffer), expected_size)
+    
+    return buffer
+
+# дешифрование в буфер вызывающего (например, NumPy-массив формы изображения);
+# паддинг ECB/CBC снимается с последнего блока, остальное пишется без промежуточных копий;
+# возвращает число записанных байт (размер "сырых" пикселей изображения)
+def block_decrypt_into(encrypted, output, key_string, meta, workers=1):
+    mode, key_bytes, iv, nonce = _prepare_decrypt(key_string, meta)
+    expected_size = raw_image_size(meta['original_size'], meta['mode'])
+    source = byte_view(encrypted)
+    target = byte_view(output, writable=True)
+    check_output_size(len(target), expected_size)
+    
+    if mode in ['ecb', 'cbc']:
+        if len(source) < AES.block_size or len(source) % AES.block_size:
+            raise ValueError(f"Длина шифра ({len(source)} байт) не кратна размеру блока AES!")
+        
+        # все блоки, кроме последнего, - прямо в выходной буфер
+        body = len(source) - AES.block_size
+        if body > expected_size:
+            raise ValueError(f"Шифр ({len(source)} байт) длиннее изображения ({expected_size} байт) с паддингом!")
+        if workers > 1:
+            parallel_crypt(source[:body], key_bytes, mode, decrypt=True, workers=workers, iv=iv, output=target[:body])
+        elif body:
+            new_aes_cipher(key_bytes, mode, iv=iv).decrypt(source[:body], output=target[:body])
+        
+        # последний блок: IV для CBC - предыдущий блок шифра
+        last_iv = bytes(source[body - AES.block_size:body]) if body else iv
+        tail = unpad(new_aes_cipher(key_bytes, mode, iv=last_iv).decrypt(bytes(source[body:])), AES.block_size)
+        check_decrypted_size(body + len(tail), expected_size)
+        target[body:expected_size] = tail
+    
+    else:
+        check_decrypted_size(len(source), expected_size)
+        if workers > 1:
+            parallel_crypt(source, key_bytes, mode, decrypt=True, workers=workers, iv=iv, nonce=nonce, output=target[:expected_size])
+        else:
+            new_aes_cipher(key_bytes, mode, iv=iv, nonce=nonce).decrypt(source, output=target[:expected_size])
+    
+    return expected_size
+
+# расшифровка области (x, y, w, h) плиточного контейнера: отображаются в память и
+# расшифровываются только пересекающие ее плитки; region=None - всё изображение
+def block_decrypt_region(input_path, key_string, info, region=None, workers=1):
+    meta = info.meta
+    if EXT_TILE_TABLE not in info.extensions:
+        raise ValueError("Контейнер не плиточный: в нем нет таблицы плиток!")
+    
+    mode, key_bytes, _, nonce = _prepare_decrypt(key_string, meta)
+    if mode != 'ctr':
+        raise ValueError(f"Плиточный режим поддерживается только для CTR, а не {mode.upper()}!")
+    
+    tile_size, entries = unpack_tile_table(info.extensions[EXT_TILE_TABLE])
+    width, height = meta['original_size']
+    x, y, w, h = region or (0, 0, width, height)
+    if w <= 0 or h <= 0 or x < 0 or y < 0 or x + w > width or y + h > height:
+        raise ValueError(f"Область {x},{y},{w},{h} выходит за пределы изображения {width}x{height}!")
+    
+    result = Image.new(meta['mode'], (w, h))
+    decrypted_tiles = 0
+    
+    with map_file(input_path, info.payload_offset, info.payload_length) as payload:
+        for index, (left, top, right, bottom) in tiles_in_region((width, height), tile_size, (x, y, w, h)):
+            if index >= len(entries):
+                raise ValueError(f"Таблица плиток повреждена: нет записи для плитки {index}!")
+            offset, length = entries[index]
+            tile_dims = (right - left, bottom - top)
+            check_decrypted_size(length, raw_image_size(tile_dims, meta['mode']))
+            
+            data = parallel_crypt(payload[offset:offset + length], key_bytes, 'ctr', decrypt=True, workers=workers, nonce=nonce, block_offset=_tile_counter(index))
+            tile = Image.frombuffer(meta['mode'], tile_dims, bytes(data), 'raw', meta['mode'], 0, 1)
+            # края плитки за пределами области отсекаются при вставке
+            result.paste(tile, (left - x, top - y))
+            decrypted_tiles += 1
+    
+    print(f"Расшифровано плиток: {decrypted_tiles} из {len(entries)}")
+    return result
+
+def _prepare_decrypt(key_string, meta):
     # Проверяем метаданные
     algorithm = meta.get('algorithm', '')
     if not algorithm.startswith('AES-'):
@@ -163,15 +593,9 @@ def block_decrypt(input_path, key_string, meta):
     
     mode = algorithm.split('-')[1].lower()
     
-    # Проверяем хэш ключа
-    expected_hash = meta.get('key_hash')
-    if expected_hash:
-        actual_hash = simple_hash(key_string, 16, return_hex=True)
-        if actual_hash != expected_hash:
-            print("Предупреждение: хэш ключа не совпадает! Возможно неверный ключ.")
-    
-    # Инициализируем ключ
-    key_bytes = initialize_aes_key(key_string)
+    # Инициализируем ключ (KDF из метаданных) и проверяем его хэш
+    key_bytes = derive_aes_key(key_string, meta)
+    check_key(key_string, key_bytes, meta)
     
     # Получаем IV/nonce из метаданных
     iv = None
@@ -191,20 +615,25 @@ def block_decrypt(input_path, key_string, meta):
         nonce = bytes.fromhex(nonce_hex)
         print(f"Используется nonce из метаданных: {nonce_hex[:16]}...")
     
-    # Выбираем режим дешифрования
-    if mode == 'ecb':
-        decrypted_bytes = ecb_decrypt(encrypted_bytes, key_bytes)
-        
-    elif mode == 'cbc':
-        decrypted_bytes = cbc_decrypt(encrypted_bytes, key_bytes, iv)
-        
-    elif mode == 'cfb':
-        decrypted_bytes = cfb_decrypt(encrypted_bytes, key_bytes, iv)
-        
-    elif mode == 'ctr':
-        decrypted_bytes = ctr_decrypt(encrypted_bytes, key_bytes, nonce)
-        
-    else:
-        raise ValueError(f"Неизвестный режим шифрования: {mode}")
-    
-    return decrypted_bytes
+    return mode, key_bytes, iv, nonce
+
+# асинхронные варианты для asyncio-сервисов: декодирование, AES и запись шифра
+# выполняются в исполнителе runner (см. async_api), цикл событий не блокируется
+async def block_encrypt_async(image_path, key_string, mode='cbc', iv=None, nonce=None, workers=1, kdf=DEFAULT_KDF, salt=None, runner=None):
+    from async_api import resolve_runner
+    return await resolve_runner(runner).run(block_encrypt, image_path, key_string, mode=mode, iv=iv, nonce=nonce, workers=workers, kdf=kdf, salt=salt)
+
+async def block_encrypt_to_file_async(image_path, output_path, key_string, mode='cbc', iv=None, nonce=None, workers=1, container=False, pyramid_levels=0,
+                                      kdf=DEFAULT_KDF, salt=None, runner=None):
+    from async_api import resolve_runner
+    return await resolve_runner(runner).run(block_encrypt_to_file, image_path, output_path, key_string, mode=mode, iv=iv, nonce=nonce, workers=workers,
+                                            container=container, pyramid_levels=pyramid_levels, kdf=kdf, salt=salt)
+
+async def block_decrypt_bytes_async(encrypted_bytes, key_string, meta, workers=1, runner=None):
+    from async_api import resolve_runner
+    return await resolve_runner(runner).run(block_decrypt_bytes, encrypted_bytes, key_string, meta, workers=workers)
+
+async def block_decrypt_to_buffer_async(input_path, key_string, meta, workers=1, payload_offset=0, payload_length=None, runner=None):
+    from async_api import resolve_runner
+    return await resolve_runner(runner).run(block_decrypt_to_buffer, input_path, key_string, meta, workers=workers,
+                                            payload_offset=payload_offset, payload_length=payload_length)
@@ -1,44 +1,140 @@
 from PIL import Image
 import os
+from functools import lru_cache
+
+from image_io import (
+    CHUNK_SIZE, source_filename, raw_image_size, iter_image_chunks, map_file, check_decrypted_size, pyramid_sizes, iter_pyramid_images,
+    buffer_image_info, byte_view, check_buffer_size, check_output_size
+)
+from kdf import simple_hash, kdf_params, key_from_params, key_fingerprint, check_key, DEFAULT_KDF
+from container import write_container, pyramid_table, EXT_PYRAMID
+
+# размер блока, которым генерируется гамма
+KEYSTREAM_BLOCK_SIZE = 64 * 1024
+
+# длина ключа, получаемого через KDF
+RC4_KEY_SIZE = 32
+
+# длина IV (ровно столько помещается в поле iv контейнера)
+IV_SIZE = 16
+
+# сколько перестановок ключа (проходы KSA без IV) держать в кэше
+KSA_CACHE_SIZE = 64
+
+# варианты расписания ключа (KSA):
+# combined - прежний: два прохода по ключ + IV, от IV зависит почти весь KSA;
+# keyed-iv - два прохода только по ключу (один раз на ключ, из кэша), затем один проход по IV -
+# на каждое сообщение остается 256 шагов вместо 512
+KSA_COMBINED = 'combined'
+KSA_KEYED_IV = 'keyed-iv'
+KSA_VARIANTS = [KSA_COMBINED, KSA_KEYED_IV]
+DEFAULT_KSA = KSA_KEYED_IV
 
 class RC4:
     
-    def __init__(self, key, iv):
-        self.S = list(range(256))
+    def __init__(self, key, iv, ksa=KSA_COMBINED):
+        # для keyed-iv перестановка ключа берется из кэша, на IV остается один проход
+        self.S = list(key_scheduling(bytes(key), bytes(iv), ksa))
         self.i = 0
         self.j = 0
-        self._key_scheduling(key, iv)
-    
-    #улучшение с помощью двойного перемешивания
-    def _key_scheduling(self, key, iv):
-        # ключ + IV для усиления безопасности
-        combined_key = key + iv
-        j = 0
-        
-        # первое перемешивания на основе ключа
-        for i in range(256):
-            j = (j + self.S[i] + combined_key[i % len(combined_key)]) % 256
-            self.S[i], self.S[j] = self.S[j], self.S[i]
-        
-        # Второй раунд для лучшего перемешивания
-        j = 0
-        for i in range(256):
-            j = (j + self.S[i] + combined_key[(i + 128) % len(combined_key)]) % 256
-            self.S[i], self.S[j] = self.S[j], self.S[i]
     
     def generate_keystream(self, length):
-        keystream = bytearray()
-        for _ in range(length):
-            self.i = (self.i + 1) % 256
-            self.j = (self.j + self.S[self.i]) % 256
-            
-            self.S[self.i], self.S[self.j] = self.S[self.j], self.S[self.i]
+        keystream = bytearray(length)
+        self.keystream_into(keystream)
+        return bytes(keystream)
+    
+    # заполняет заранее выделенный буфер гаммой блоками, без append по байту
+    def keystream_into(self, buffer, block_size=KEYSTREAM_BLOCK_SIZE):
+        view = memoryview(buffer).cast('B')
+        for start in range(0, len(view), block_size):
+            end = min(start + block_size, len(view))
+            view[start:end] = self._keystream_block(end - start)
+        return buffer
+    
+    def _keystream_block(self, length):
+        # локальные переменные вместо атрибутов - основной выигрыш в скорости
+        S = self.S
+        i = self.i
+        j = self.j
+        block = bytearray(length)
+        for n in range(length):
+            i = (i + 1) & 0xFF
+            si = S[i]
+            j = (j + si) & 0xFF
+            sj = S[j]
+            S[i] = sj
+            S[j] = si
             
             # дополнительный элемент для нелинейности:
-            k = self.S[(self.S[self.i] + self.S[self.j] + self.S[(self.i * self.j) % 256]) % 256]
-            keystream.append(k)
+            block[n] = S[(sj + si + S[(i * j) & 0xFF]) & 0xFF]
         
-        return bytes(keystream)
+        self.i = i
+        self.j = j
+        return block
+    
+    # XOR очередной порции данных с гаммой (состояние сохраняется между вызовами)
+    def crypt(self, data):
+        keystream = self.generate_keystream(len(data))
+        return xor_bytes(data, keystream)
+    
+    # XOR сразу в выходной буфер блоками - без гаммы и результата размером со все данные
+    def crypt_into(self, data, output, block_size=KEYSTREAM_BLOCK_SIZE):
+        source = memoryview(data).cast('B')
+        target = memoryview(output).cast('B')
+        for start in range(0, len(source), block_size):
+            end = min(start + block_size, len(source))
+            target[start:end] = xor_bytes(source[start:end], self._keystream_block(end - start))
+        return output
+
+# без кэша: IV свой у каждого сообщения, кэшируется только независимая от IV часть (_keyed_state)
+def key_scheduling(key, iv, ksa=KSA_COMBINED):
+    if ksa == KSA_COMBINED:
+        return _combined_scheduling(key, iv)
+    elif ksa == KSA_KEYED_IV:
+        return _keyed_iv_scheduling(key, iv)
+    else:
+        raise ValueError(f"Неизвестный вариант расписания ключа RC4: {ksa}")
+
+#улучшение с помощью двойного перемешивания
+def _combined_scheduling(key, iv):
+    S = list(range(256))
+    # ключ + IV для усиления безопасности
+    combined_key = key + iv
+    j = 0
+    
+    # первое перемешивания на основе ключа
+    for i in range(256):
+        j = (j + S[i] + combined_key[i % len(combined_key)]) % 256
+        S[i], S[j] = S[j], S[i]
+    
+    # Второй раунд для лучшего перемешивания
+    j = 0
+    for i in range(256):
+        j = (j + S[i] + combined_key[(i + 128) % len(combined_key)]) % 256
+        S[i], S[j] = S[j], S[i]
+    
+    return bytes(S)
+
+def _keyed_iv_scheduling(key, iv):
+    S = list(_keyed_state(key))
+    if not iv:
+        return bytes(S)
+    
+    # один проход по IV поверх перестановки ключа
+    iv_length = len(iv)
+    j = 0
+    for i in range(256):
+        si = S[i]
+        j = (j + si + iv[i % iv_length]) & 0xFF
+        S[i] = S[j]
+        S[j] = si
+    
+    return bytes(S)
+
+# два прохода только по ключу - общая часть для всех IV
+@lru_cache(maxsize=KSA_CACHE_SIZE)
+def _keyed_state(key):
+    return _combined_scheduling(key, b'')
 
 def initialize_rc4_key(key_string):
     combined = key_string.encode('utf-8') 
@@ -49,69 +145,188 @@ def initialize_rc4_key(key_string):
     
     return combined
 
-#простая хэш функция
-def simple_hash(data, output_length=32, return_hex=False):
-    if isinstance(data, str):
-        data = data.encode('utf-8')
+# XOR целиком через большие числа - без цикла по байтам в Python
+def xor_bytes(data, keystream):
+    length = len(data)
+    if length == 0:
+        return b''
     
-    # Простой алгоритм перемешивания
-    result = bytearray(output_length)
+    result = int.from_bytes(data, 'little') ^ int.from_bytes(keystream[:length], 'little')
+    return result.to_bytes(length, 'little')
+
+# ключ по параметрам KDF из метаданных; без них - прежний initialize_rc4_key
+def derive_rc4_key(key_string, params):
+    return key_from_params(key_string, params, RC4_KEY_SIZE, initialize_rc4_key)
+
+def rc4_encrypt_decrypt(data, key, iv, ksa=KSA_COMBINED):
+    rc4 = RC4(key, iv, ksa)
     
-    # Первоначальное заполнение
-    for i in range(output_length):
-        result[i] = (data[i % len(data)] + i * 37) & 0xFF
+    # Применяем XOR
+    return rc4.crypt(data)
+
+# шифрование уже декодированных байтов пикселей (байты на входе, байты на выходе);
+# вторым значением возвращаются параметры шифра для дешифрования
+def stream_encrypt_bytes(data, key_string, iv=None, kdf=DEFAULT_KDF, salt=None, ksa=DEFAULT_KSA):
+    iv = _prepare_iv(iv)
     
-    # Раунды перемешивания
-    for round in range(5):
-        for i in range(output_length):
-            result[i] ^= result[(i + 11) % output_length]
-            result[i] = (result[i] * 167 + 113) & 0xFF
+    # Инициализируем ключ
+    params = kdf_params(kdf, salt)
+    key_bytes = derive_rc4_key(key_string, params)
     
-    if return_hex:
-        return result.hex()  
-    else:
-        return bytes(result)  
-
-def rc4_encrypt_decrypt(data, key, iv):
-    rc4 = RC4(key, iv)
-    keystream = rc4.generate_keystream(len(data))
+    # Шифруем
+    encrypted_bytes = rc4_encrypt_decrypt(data, key_bytes, iv, ksa)
     
-    # Применяем XOR
-    return bytes([data[i] ^ keystream[i] for i in range(len(data))])
+    return encrypted_bytes, _cipher_meta(key_string, key_bytes, iv, params, ksa)
 
-def stream_encrypt(image_path, key_string, iv=None):
+def stream_encrypt(image_path, key_string, iv=None, kdf=DEFAULT_KDF, salt=None, ksa=DEFAULT_KSA):
     img = Image.open(image_path)
     img_bytes = img.tobytes()
     
-    if iv is None:
-        iv = os.urandom(16)  # 16 байт 
-        print(f" Сгенерирован случайный IV: {iv.hex()}")
-    else:
-        print(f" Используется предоставленный IV: {iv.hex()}")
+    encrypted_bytes, cipher_meta = stream_encrypt_bytes(img_bytes, key_string, iv, kdf=kdf, salt=salt, ksa=ksa)
     
-    # Инициализируем ключ
-    key_bytes = initialize_rc4_key(key_string)
+    return encrypted_bytes, _build_meta(img.size, img.mode, source_filename(image_path), cipher_meta)
+
+# шифрование "сырых" пикселей из любого буфера (NumPy-массив, memoryview, bytearray)
+# сразу в выходной буфер вызывающего - без декодирования и промежуточных bytes;
+# возвращает (число записанных байт, метаданные)
+def stream_encrypt_into(data, output, key_string, size=None, image_mode=None, iv=None, kdf=DEFAULT_KDF, salt=None, ksa=DEFAULT_KSA,
+                        original_filename=''):
+    size, image_mode = buffer_image_info(data, size, image_mode)
+    source = byte_view(data)
+    check_buffer_size(len(source), raw_image_size(size, image_mode))
+    target = byte_view(output, writable=True)
+    check_output_size(len(target), len(source))
+    iv = _prepare_iv(iv)
     
-    # Шифруем
-    encrypted_bytes = rc4_encrypt_decrypt(img_bytes, key_bytes, iv)
+    params = kdf_params(kdf, salt)
+    key_bytes = derive_rc4_key(key_string, params)
+    RC4(key_bytes, iv, ksa).crypt_into(source, target[:len(source)])
+    
+    return len(source), _build_meta(size, image_mode, original_filename, _cipher_meta(key_string, key_bytes, iv, params, ksa))
+
+# случайный IV или проверка заданного: IV другой длины не поместится в контейнер
+def _prepare_iv(iv):
+    if iv is None:
+        iv = os.urandom(IV_SIZE)
+        print(f" Сгенерирован случайный IV: {iv.hex()}")
+        return iv
     
-    # Метаданные
+    if isinstance(iv, str):
+        iv = bytes.fromhex(iv)
+    if len(iv) != IV_SIZE:
+        raise ValueError(f"IV для RC4 должен быть {IV_SIZE} байт, а не {len(iv)}!")
+    print(f" Используется предоставленный IV: {iv.hex()}")
+    return iv
+
+def _cipher_meta(key_string, key_bytes, iv, params, ksa):
     meta = {
         "algorithm": "stream-rc4-custom",
-        "original_size": img.size,
-        "mode": img.mode,
         "iv": iv.hex(),
-        "original_filename": os.path.basename(image_path),
-        "key_hash": simple_hash(key_string, 16, return_hex=True)  
+        "key_hash": key_fingerprint(key_string, key_bytes, params)
     }
+    # прежний вариант KSA не отмечается - старые метаданные читаются без изменений
+    if ksa != KSA_COMBINED:
+        meta["ksa"] = ksa
+    meta.update(params)
+    return meta
+
+def _build_meta(size, image_mode, original_filename, cipher_meta):
+    meta = {
+        "algorithm": cipher_meta['algorithm'],
+        "original_size": size,
+        "mode": image_mode,
+        "iv": cipher_meta['iv'],
+        "original_filename": original_filename,
+        "key_hash": cipher_meta['key_hash']
+    }
+    
+    for field in ['ksa', 'kdf', 'kdf_cost', 'salt']:
+        if field in cipher_meta:
+            meta[field] = cipher_meta[field]
     
-    return encrypted_bytes, meta
+    return meta
+
+# потоковое шифрование: изображение читается полосами и пишется в файл по частям
+# container=True - шифр с заголовком в одном файле, иначе только шифр (метаданные отдельно)
+def stream_encrypt_to_file(image_path, output_path, key_string, iv=None, chunk_size=CHUNK_SIZE, container=False, pyramid_levels=0,
+                           kdf=DEFAULT_KDF, salt=None, ksa=DEFAULT_KSA):
+    if pyramid_levels and not container:
+        raise ValueError("Пирамида уменьшенных копий хранится только в формате container!")
+    
+    img = Image.open(image_path)
+    iv = _prepare_iv(iv)
+    
+    # состояние RC4 переносится между порциями
+    params = kdf_params(kdf, salt)
+    key_bytes = derive_rc4_key(key_string, params)
+    rc4 = RC4(key_bytes, iv, ksa)
+    meta = _build_meta(img.size, img.mode, source_filename(image_path), _cipher_meta(key_string, key_bytes, iv, params, ksa))
+    chunks = (rc4.crypt(chunk) for chunk in iter_image_chunks(img, chunk_size))
+    
+    # уровни пирамиды (1/2, 1/4, ...) - каждый со своим IV, гамма не повторяется
+    level_ivs = [os.urandom(IV_SIZE) for _ in range(pyramid_levels)]
+    
+    def level_chunks():
+        for level_img, level_iv in zip(iter_pyramid_images(img, pyramid_levels), level_ivs):
+            level_rc4 = RC4(key_bytes, level_iv, ksa)
+            for chunk in iter_image_chunks(level_img, chunk_size):
+                yield level_rc4.crypt(chunk)
+    
+    with open(output_path, 'wb') as f:
+        if container:
+            extensions = {}
+            if pyramid_levels:
+                extensions[EXT_PYRAMID] = pyramid_table(raw_image_size(img.size, img.mode), [
+                    (size, level_iv, raw_image_size(size, img.mode)) for size, level_iv in zip(pyramid_sizes(img.size, pyramid_levels), level_ivs)
+                ])
+            write_container(f, meta, chunks, extensions, trailer=level_chunks())
+        else:
+            for chunk in chunks:
+                f.write(chunk)
+    
+    return meta
 
 def stream_decrypt(input_path, key_string, meta):
     # Загружаем зашифрованные данные
     with open(input_path, 'rb') as f:
         encrypted_bytes = f.read()
     
+    return stream_decrypt_bytes(encrypted_bytes, key_string, meta)
+
+# дешифрование байтов в памяти; meta - метаданные файла или параметры из stream_encrypt_bytes
+def stream_decrypt_bytes(encrypted_bytes, key_string, meta):
+    rc4 = _init_decrypt(key_string, meta)
+    
+    # Дешифруем
+    return rc4.crypt(encrypted_bytes)
+
+# потоковое дешифрование в заранее выделенный буфер размером с изображение
+# шифр отображается в память и расшифровывается сразу в итоговый буфер;
+# payload_offset/payload_length - положение шифра в файле (для контейнера)
+def stream_decrypt_to_buffer(input_path, key_string, meta, payload_offset=0, payload_length=None):
+    rc4 = _init_decrypt(key_string, meta)
+    expected_size = raw_image_size(meta['original_size'], meta['mode'])
+    
+    with map_file(input_path, payload_offset, payload_length) as payload:
+        check_decrypted_size(len(payload), expected_size)
+        buffer = bytearray(expected_size)
+        rc4.crypt_into(payload, buffer)
+    
+    return buffer
+
+# дешифрование в буфер вызывающего (например, NumPy-массив формы изображения);
+# возвращает число записанных байт
+def stream_decrypt_into(encrypted, output, key_string, meta):
+    rc4 = _init_decrypt(key_string, meta)
+    source = byte_view(encrypted)
+    check_decrypted_size(len(source), raw_image_size(meta['original_size'], meta['mode']))
+    target = byte_view(output, writable=True)
+    check_output_size(len(target), len(source))
+    
+    rc4.crypt_into(source, target[:len(source)])
+    return len(source)
+
+def _init_decrypt(key_string, meta):
     # Получаем IV из метаданных
     iv_hex = meta.get('iv')
     if not iv_hex:
@@ -119,16 +334,29 @@ def stream_decrypt(input_path, key_string, meta):
     
     iv = bytes.fromhex(iv_hex)
     
-    expected_hash = meta.get('key_hash')
-    if expected_hash:
-        actual_hash = simple_hash(key_string, 16, return_hex=True)
-        if actual_hash != expected_hash:
-            print("  Предупреждение: хэш ключа не совпадает! Возможно неверный ключ.")
-    
-    # Инициализируем ключ
-    key_bytes = initialize_rc4_key(key_string)
-    
-    # Дешифруем
-    decrypted_bytes = rc4_encrypt_decrypt(encrypted_bytes, key_bytes, iv)
+    # Инициализируем ключ (KDF из метаданных) и проверяем его хэш
+    key_bytes = derive_rc4_key(key_string, meta)
+    check_key(key_string, key_bytes, meta)
     
-    return decrypted_bytes
\ No newline at end of file
+    return RC4(key_bytes, iv, meta.get('ksa', KSA_COMBINED))
+
+# асинхронные варианты для asyncio-сервисов: декодирование, RC4 и запись шифра
+# выполняются в исполнителе runner (см. async_api), цикл событий не блокируется
+async def stream_encrypt_async(image_path, key_string, iv=None, kdf=DEFAULT_KDF, salt=None, ksa=DEFAULT_KSA, runner=None):
+    from async_api import resolve_runner
+    return await resolve_runner(runner).run(stream_encrypt, image_path, key_string, iv, kdf=kdf, salt=salt, ksa=ksa)
+
+async def stream_encrypt_to_file_async(image_path, output_path, key_string, iv=None, container=False, pyramid_levels=0,
+                                       kdf=DEFAULT_KDF, salt=None, ksa=DEFAULT_KSA, runner=None):
+    from async_api import resolve_runner
+    return await resolve_runner(runner).run(stream_encrypt_to_file, image_path, output_path, key_string, iv, container=container,
+                                            pyramid_levels=pyramid_levels, kdf=kdf, salt=salt, ksa=ksa)
+
+async def stream_decrypt_bytes_async(encrypted_bytes, key_string, meta, runner=None):
+    from async_api import resolve_runner
+    return await resolve_runner(runner).run(stream_decrypt_bytes, encrypted_bytes, key_string, meta)
+
+async def stream_decrypt_to_buffer_async(input_path, key_string, meta, payload_offset=0, payload_length=None, runner=None):
+    from async_api import resolve_runner
+    return await resolve_runner(runner).run(stream_decrypt_to_buffer, input_path, key_string, meta,
+                                            payload_offset=payload_offset, payload_length=payload_length)
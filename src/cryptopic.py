@@ -2,120 +2,456 @@ import argparse
 import os
 import sys
 import json
+import glob
+import io
+import time
+from contextlib import redirect_stdout
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from crypto_stream import stream_encrypt, stream_decrypt
-from crypto_block import block_encrypt, block_decrypt
+# при запуске загружаются только легкие модули: реестр шифров и имена KDF;
+# PIL, Cryptodome, модуль шифра и пул процессов импортируются там, где нужны,
+# поэтому --help и ошибки аргументов не платят за их загрузку
+from ciphers import ALGORITHM_IDS, get_cipher, cipher_for_meta
+from kdf import KDF_NAMES, DEFAULT_KDF, KDF_LEGACY, generate_salt
+
+# расширения изображений, которые берутся из каталога в пакетном режиме
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+# шифры для decrypt-batch: .bin (контейнер или legacy) и .cpic
+ENCRYPTED_EXTENSIONS = ('.bin', '.cpic')
+
+# длина --iv: IV RC4 и блок AES (crypto_stream.IV_SIZE, без импорта модуля шифра)
+IV_SIZE = 16
 
 def main():
     parser = argparse.ArgumentParser(description='CryptoPic - Image Encryption Tool')
     
     # Основные параметры
-    parser.add_argument('--mode', choices=['encrypt', 'decrypt'], required=True, 
-                       help='Режим работы: encrypt или decrypt')
+    parser.add_argument('--mode', choices=['encrypt', 'decrypt', 'encrypt-batch', 'decrypt-batch', 'serve'], required=True,
+                       help='Режим работы: encrypt, decrypt, пакетные encrypt-batch/decrypt-batch или демон serve')
     
     # Параметры для encrypt/decrypt режимов
-    parser.add_argument('--in', dest='input_file', required=True,
-                       help='Входной файл (изображение или шифр)')
-    parser.add_argument('--out', dest='output_file', required=True,
-                       help='Выходной файл')
-    parser.add_argument('--algo', choices=['stream', 'aes-ecb', 'aes-cbc', 'aes-ctr', 'aes-cfb'], required=True,
-                       help='Алгоритм шифрования')
-    parser.add_argument('--key', required=True,
+    parser.add_argument('--in', dest='input_file',
+                       help='Входной файл (изображение или шифр); в пакетном режиме - каталог, glob-шаблон или файл-список')
+    parser.add_argument('--out', dest='output_file',
+                       help='Выходной файл; в пакетном режиме - выходной каталог')
+    parser.add_argument('--algo', choices=ALGORITHM_IDS,
+                       help='Алгоритм шифрования (в режиме serve - загрузить заранее только его)')
+    parser.add_argument('--key',
                        help='Ключ шифрования')
     
     # Опциональные параметры
     parser.add_argument('--iv', help='IV в hex формате (для CBC)')
-    parser.add_argument('--nonce', help='Nonce в hex формате (для CTR)')
-    parser.add_argument('--meta', help='Файл с метаданными для дешифрования')
+    parser.add_argument('--nonce', help='Nonce в hex формате (для CTR; для aes-gcm/chacha20-poly1305 - префикс nonce, 7 байт)')
+    parser.add_argument('--meta', help='Файл с метаданными для дешифрования (только для формата legacy)')
+    parser.add_argument('--format', dest='output_format', choices=['container', 'legacy'], default='container',
+                       help='Формат шифра: container - заголовок и шифр в одном файле, legacy - шифр и .meta.json')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                       help='Количество процессов для пакетного режима, потоков демона в режиме serve')
+    parser.add_argument('--threads', type=int, default=1,
+                       help='Количество потоков AES для одного изображения (ECB/CTR, AEAD, а также дешифрование CBC/CFB)')
+    parser.add_argument('--tile', type=int,
+                       help='Плиточное шифрование с заданной стороной плитки в пикселях (только aes-ctr, формат container)')
+    parser.add_argument('--region', type=parse_region,
+                       help='Дешифровать только область x,y,w,h (у плиточного контейнера читаются лишь нужные плитки)')
+    parser.add_argument('--kdf', choices=KDF_NAMES, default=DEFAULT_KDF,
+                       help='Получение ключа из пароля при шифровании (legacy - прежний способ без соли)')
+    parser.add_argument('--pyramid', type=int, default=0,
+                       help='Сколько уменьшенных копий (1/2, 1/4, ...) зашифровать в контейнер для быстрого предпросмотра')
+    parser.add_argument('--level', type=int, default=0,
+                       help='Уровень пирамиды для дешифрования: 0 - исходное изображение, N - уменьшенное в 2^N раз')
+    parser.add_argument('--socket',
+                       help='Unix-сокет демона в режиме serve (по умолчанию cryptopic.sock в $XDG_RUNTIME_DIR или в каталоге cryptopic-<uid> во временном каталоге)')
     
     args = parser.parse_args()
+    validate_args(parser, args)
     
     try:
         if args.mode == 'encrypt':
             handle_encrypt(args)
         elif args.mode == 'decrypt':
             handle_decrypt(args)
-            
+        elif args.mode in ['encrypt-batch', 'decrypt-batch']:
+            if handle_batch(args) > 0:
+                sys.exit(1)
+        elif args.mode == 'serve':
+            handle_serve(args)
+    
     except Exception as e:
         print(f"Ошибка: {e}")
         sys.exit(1)
 
-def handle_encrypt(args):
-    """Обработка шифрования"""
-    print(f"Шифруем {args.input_file} алгоритмом {args.algo}...")
+def validate_args(parser, args):
+    """Проверки сочетаний аргументов до загрузки модулей шифрования"""
+    # демону нужны только --socket/--workers, остальное приходит в запросах
+    if args.mode == 'serve':
+        if args.workers is not None and args.workers < 1:
+            parser.error("--workers должно быть не меньше 1")
+        return
     
-    # Определяем режим для блочного шифрования
-    mode = None
-    if args.algo.startswith('aes-'):
-        mode = args.algo.replace('aes-', '')  # 'ecb', 'cbc', 'ctr'
-    
-    # алгоритм шифрования
-    if args.algo == 'stream':
-        encrypted_data, meta = stream_encrypt(args.input_file, args.key, args.iv)
-    
-    elif args.algo.startswith('aes-'):
-        # Используем block_encrypt для всех AES режимов
-        encrypted_data, meta = block_encrypt(
-            args.input_file, 
-            args.key, 
-            mode=mode,
-            iv=args.iv,
-            nonce=args.nonce
-        )
+    missing = [option for option, value in [('--in', args.input_file), ('--out', args.output_file), ('--algo', args.algo),
+                                            ('--key', args.key)] if value is None]
+    if missing:
+        parser.error(f"обязательные аргументы: {', '.join(missing)}")
+    if args.socket:
+        parser.error("--socket используется только в режиме serve")
+    
+    cipher = get_cipher(args.algo)
+    
+    if args.threads < 1:
+        parser.error("--threads должно быть не меньше 1")
+    if args.tile is not None:
+        if args.tile <= 0:
+            parser.error("--tile должно быть положительным")
+        if not cipher.tiles:
+            parser.error(f"--tile не поддерживается для {args.algo}")
+        if args.output_format != 'container':
+            parser.error("--tile требует --format container")
+        if args.pyramid:
+            parser.error("--tile не сочетается с --pyramid")
+    if args.pyramid < 0 or args.level < 0:
+        parser.error("--pyramid и --level не могут быть отрицательными")
+    if args.pyramid and args.output_format != 'container':
+        parser.error("--pyramid требует --format container")
+    if args.iv is not None:
+        try:
+            iv_length = len(bytes.fromhex(args.iv))
+        except ValueError:
+            parser.error("--iv должен быть в hex формате")
+        if iv_length != IV_SIZE:
+            parser.error(f"--iv должен быть {IV_SIZE} байт ({IV_SIZE * 2} hex-символов), а не {iv_length}")
+
+def parse_region(text):
+    """Область в виде x,y,w,h"""
+    try:
+        x, y, w, h = (int(part) for part in text.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Область должна иметь вид x,y,w,h: {text}")
+    if w <= 0 or h <= 0 or x < 0 or y < 0:
+        raise argparse.ArgumentTypeError(f"Неверная область: {text}")
+    return x, y, w, h
+
+def encrypt_file(input_file, output_file, algo, key, iv=None, nonce=None, meta_file=None, threads=1, output_format='container', tile_size=None,
+                 pyramid_levels=0, kdf=DEFAULT_KDF, salt=None):
+    meta = encrypt_payload(input_file, output_file, algo, key, iv=iv, nonce=nonce, threads=threads, output_format=output_format,
+                           tile_size=tile_size, pyramid_levels=pyramid_levels, kdf=kdf, salt=salt)
     
-    # сохранение зашифрованных данных
-    with open(args.output_file, 'wb') as f:
-        f.write(encrypted_data)
+    # в контейнере метаданные уже в заголовке
+    if output_format == 'container':
+        return meta, None
     
     # сохранение метаданных
-    meta_filename = args.output_file + ".meta.json"
-    if args.meta:
-        meta_filename = args.meta
+    meta_filename = meta_file or output_file + ".meta.json"
     
     with open(meta_filename, 'w') as f:
         json.dump(meta, f, indent=2)
     
-    print(f"Успешно зашифровано в {args.output_file}")
-    print(f"Метаданные сохранены в {meta_filename}")
-    if meta.get('iv'):
-        print(f"IV: {meta['iv']}")
-    if meta.get('nonce'):
-        print(f"Nonce: {meta['nonce']}")
+    return meta, meta_filename
 
-def handle_decrypt(args):
-    """Обработка дешифрования"""
-    print(f"Дешифруем {args.input_file} алгоритмом {args.algo}...")
+# шифрование с записью шифра (или контейнера) в output_file, возвращает метаданные
+def encrypt_payload(input_file, output_file, algo, key, iv=None, nonce=None, threads=1, output_format='container', tile_size=None,
+                    pyramid_levels=0, kdf=DEFAULT_KDF, salt=None):
+    # бэкенд шифра из реестра (модуль импортируется только для выбранного алгоритма)
+    cipher = get_cipher(algo)
+    container = output_format == 'container'
     
+    # плитки шифруются независимо только в CTR, таблица плиток хранится в контейнере
+    if tile_size:
+        if not cipher.tiles:
+            raise ValueError(f"Плиточное шифрование не поддерживается для {algo}!")
+        if not container:
+            raise ValueError("Плиточное шифрование требует формат container!")
+        if pyramid_levels:
+            raise ValueError("Плиточное шифрование не сочетается с пирамидой уменьшенных копий!")
+    
+    # алгоритм шифрования, шифр пишется в файл по частям
+    if tile_size:
+        meta = cipher.encrypt_tiles_to_file(input_file, output_file, key, tile_size, nonce=nonce, workers=threads,
+                                            kdf=kdf, salt=salt)
+    
+    else:
+        meta = cipher.encrypt_to_file(
+            input_file,
+            output_file,
+            key,
+            iv=iv,
+            nonce=nonce,
+            workers=threads,
+            container=container,
+            pyramid_levels=pyramid_levels,
+            kdf=kdf,
+            salt=salt
+        )
+    
+    return meta
+
+# варианты для asyncio-сервисов: декодирование, шифрование и запись шифра - в исполнителе
+# runner (async_api), запись .meta.json - в пуле ввода-вывода; цикл событий не блокируется
+async def encrypt_file_async(input_file, output_file, algo, key, iv=None, nonce=None, meta_file=None, threads=1, output_format='container',
+                             tile_size=None, pyramid_levels=0, kdf=DEFAULT_KDF, salt=None, runner=None):
+    from async_api import resolve_runner
+    runner = resolve_runner(runner)
+    
+    meta = await runner.run(encrypt_payload, input_file, output_file, algo, key, iv=iv, nonce=nonce, threads=threads,
+                            output_format=output_format, tile_size=tile_size, pyramid_levels=pyramid_levels, kdf=kdf, salt=salt)
+    if output_format == 'container':
+        return meta, None
+    
+    meta_filename = meta_file or output_file + ".meta.json"
+    await runner.write_json(meta_filename, meta)
+    return meta, meta_filename
+
+async def decrypt_file_async(input_file, output_file, algo, key, meta_file=None, threads=1, region=None, level=0, runner=None):
+    from async_api import resolve_runner
+    return await resolve_runner(runner).run(decrypt_file, input_file, output_file, algo, key, meta_file=meta_file, threads=threads,
+                                            region=region, level=level)
+
+def load_meta(input_file, meta_file=None):
     # метаданные
     meta = {}
-    if args.meta:
-        with open(args.meta, 'r') as f:
+    if meta_file:
+        with open(meta_file, 'r') as f:
             meta = json.load(f)
     else:
         # поиск .meta.json файл
-        meta_path = args.input_file + ".meta.json"
+        meta_path = input_file + ".meta.json"
         if os.path.exists(meta_path):
             with open(meta_path, 'r') as f:
                 meta = json.load(f)
         else:
             print("Предупреждение: файл метаданных не найден")
     
-    # алгоритм дешифрования
-    if args.algo == 'stream':
-        decrypted_data = stream_decrypt(args.input_file, args.key, meta)
+    return meta
+
+# шифр по алгоритму из метаданных (заголовка контейнера); явно указанный algo должен с ним совпадать
+def cipher_for_file(algo, meta):
+    if not meta.get('algorithm'):
+        if not algo:
+            raise ValueError("Алгоритм не указан и не найден в метаданных!")
+        return get_cipher(algo)
+    
+    cipher = cipher_for_meta(meta)
+    if algo and get_cipher(algo) is not cipher:
+        raise ValueError(f"Файл зашифрован алгоритмом {cipher.algorithm_id}, а указан --algo {algo}!")
+    return cipher
+
+def decrypt_file(input_file, output_file, algo, key, meta_file=None, threads=1, region=None, level=0):
+    if not os.path.exists(input_file):
+        raise FileNotFoundError(f"Зашифрованный файл не найден: {input_file}")
+    
+    from container import is_container, read_container, level_payload, EXT_TILE_TABLE
+    
+    # контейнер: метаданные из заголовка, шифр - после него; иначе шифр и .meta.json
+    payload_offset, payload_length = 0, None
+    if is_container(input_file):
+        if meta_file:
+            print("Предупреждение: --meta игнорируется, метаданные берутся из заголовка контейнера")
+        info = read_container(input_file)
+        # уровень пирамиды - отдельный шифр со своим размером и IV/nonce
+        meta, payload_offset, payload_length = level_payload(info, level)
+        cipher = cipher_for_file(algo, meta)
+        
+        # плиточный контейнер: расшифровываются только плитки, попавшие в область
+        if EXT_TILE_TABLE in info.extensions:
+            cipher.decrypt_region(input_file, key, info, region, workers=threads).save(output_file)
+            return meta
+    else:
+        if level:
+            raise ValueError("Уровни пирамиды есть только в формате container!")
+        meta = load_meta(input_file, meta_file)
+        cipher = cipher_for_file(algo, meta)
     
-    elif args.algo.startswith('aes-'):
-        # Используем block_decrypt для всех AES режимов
-        decrypted_data = block_decrypt(args.input_file, args.key, meta)
+    # дешифрование, результат собирается в заранее выделенном буфере
+    decrypted_data = cipher.decrypt_to_buffer(input_file, key, meta, workers=threads,
+                                              payload_offset=payload_offset, payload_length=payload_length)
     
-    # восстановление изображения
+    # восстановление изображения прямо из буфера (для L/RGBA/CMYK - без копии пикселей)
     from PIL import Image
-    img = Image.frombytes(meta['mode'], meta['original_size'], decrypted_data)
-    img.save(args.output_file)
+    img = Image.frombuffer(meta['mode'], tuple(meta['original_size']), decrypted_data, 'raw', meta['mode'], 0, 1)
+    
+    # без плиток область вырезается из полностью расшифрованного изображения
+    if region:
+        x, y, w, h = region
+        width, height = img.size
+        if x + w > width or y + h > height:
+            raise ValueError(f"Область {x},{y},{w},{h} выходит за пределы изображения {width}x{height}!")
+        print("Предупреждение: шифр без плиток, для области расшифровано всё изображение")
+        img = img.crop((x, y, x + w, y + h))
+    
+    img.save(output_file)
+    
+    return meta
+
+def handle_encrypt(args):
+    """Обработка шифрования"""
+    print(f"Шифруем {args.input_file} алгоритмом {args.algo}...")
+    
+    meta, meta_filename = encrypt_file(
+        args.input_file,
+        args.output_file,
+        args.algo,
+        args.key,
+        iv=args.iv,
+        nonce=args.nonce,
+        meta_file=args.meta,
+        threads=args.threads,
+        output_format=args.output_format,
+        tile_size=args.tile,
+        pyramid_levels=args.pyramid,
+        kdf=args.kdf
+    )
+    
+    print(f"Успешно зашифровано в {args.output_file}")
+    if meta_filename:
+        print(f"Метаданные сохранены в {meta_filename}")
+    else:
+        print("Метаданные записаны в заголовок контейнера")
+    if meta.get('iv'):
+        print(f"IV: {meta['iv']}")
+    if meta.get('nonce'):
+        print(f"Nonce: {meta['nonce']}")
+
+def handle_decrypt(args):
+    """Обработка дешифрования"""
+    print(f"Дешифруем {args.input_file} алгоритмом {args.algo}...")
+    
+    decrypt_file(args.input_file, args.output_file, args.algo, args.key, meta_file=args.meta, threads=args.threads,
+                 region=args.region, level=args.level)
     
     print(f"Успешно дешифровано в {args.output_file}")
 
+def handle_serve(args):
+    """Демон шифрования на Unix-сокете"""
+    from server import run_server
+    
+    run_server(args.socket, workers=args.workers, algos=[args.algo] if args.algo else None)
+
+def collect_batch_inputs(source, extensions):
+    """Список файлов для пакетного режима: каталог, glob-шаблон или файл-список"""
+    if os.path.isdir(source):
+        files = [os.path.join(source, name) for name in sorted(os.listdir(source))]
+        return [path for path in files if path.lower().endswith(extensions)]
+    
+    if any(char in source for char in '*?['):
+        return sorted(glob.glob(source, recursive=True))
+    
+    if os.path.isfile(source):
+        # файл-список: по одному пути в строке, пути относительно самого списка
+        base_dir = os.path.dirname(os.path.abspath(source))
+        files = []
+        with open(source, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    files.append(os.path.join(base_dir, line))
+        return files
+    
+    raise ValueError(f"Не найден каталог, шаблон или файл-список: {source}")
+
+def batch_output_path(input_file, output_dir, batch_mode, algo):
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    if batch_mode == 'encrypt-batch':
+        return os.path.join(output_dir, f"{stem}_{algo.replace('-', '_')}.bin")
+    return os.path.join(output_dir, f"{stem}_dec.png")
+
+def _run_batch_job(job):
+    """Обработка одного файла в процессе пула; ошибки возвращаются, а не выбрасываются"""
+    batch_mode, input_file, output_file, algo, key, threads, output_format, tile_size, pyramid_levels, kdf, salt = job
+    from image_io import raw_image_size
+    started = time.perf_counter()
+    
+    try:
+        # вывод модулей шифрования не смешиваем с отчетом пакета
+        with redirect_stdout(io.StringIO()):
+            if batch_mode == 'encrypt-batch':
+                meta, _ = encrypt_file(input_file, output_file, algo, key, threads=threads, output_format=output_format,
+                                       tile_size=tile_size, pyramid_levels=pyramid_levels, kdf=kdf, salt=salt)
+            else:
+                meta = decrypt_file(input_file, output_file, algo, key, threads=threads)
+    
+        return {
+            "input": input_file,
+            "output": output_file,
+            "bytes": raw_image_size(meta['original_size'], meta['mode']),
+            "seconds": time.perf_counter() - started,
+            "error": None
+        }
+    except Exception as e:
+        return {
+            "input": input_file,
+            "output": output_file,
+            "bytes": 0,
+            "seconds": time.perf_counter() - started,
+            "error": f"{type(e).__name__}: {e}"
+        }
+
+def handle_batch(args):
+    """Пакетная обработка в пуле процессов, возвращает количество ошибок"""
+    extensions = IMAGE_EXTENSIONS if args.mode == 'encrypt-batch' else ENCRYPTED_EXTENSIONS
+    inputs = collect_batch_inputs(args.input_file, extensions)
+    if not inputs:
+        raise ValueError(f"Нет файлов для обработки: {args.input_file}")
+    
+    if args.iv or args.nonce or args.meta or args.region or args.level:
+        print("Предупреждение: --iv/--nonce/--meta/--region/--level игнорируются в пакетном режиме")
+    
+    os.makedirs(args.output_file, exist_ok=True)
+    workers = max(1, args.workers or 1)
+    print(f"Пакетный режим {args.mode}: {len(inputs)} файлов, {workers} процессов, алгоритм {args.algo}")
+    
+    # одна соль на пакет: ключ из пароля получается один раз на процесс пула (IV/nonce у файлов свои)
+    salt = None if args.kdf == KDF_LEGACY else generate_salt()
+    
+    # файлы, дающие одно и то же имя результата (x.png и x.jpg, a/x.png и b/x.png), не обрабатываются -
+    # иначе они молча перезаписали бы друг друга
+    outputs = {}
+    for path in inputs:
+        outputs.setdefault(batch_output_path(path, args.output_file, args.mode, args.algo), []).append(path)
+    
+    jobs = []
+    results = []
+    for output_path, paths in outputs.items():
+        if len(paths) == 1:
+            jobs.append((args.mode, paths[0], output_path, args.algo, args.key, args.threads, args.output_format, args.tile,
+                         args.pyramid, args.kdf, salt))
+            continue
+        for path in paths:
+            results.append({
+                "input": path,
+                "output": output_path,
+                "bytes": 0,
+                "seconds": 0.0,
+                "error": f"Совпадает имя результата {output_path} у файлов: {', '.join(paths)}"
+            })
+    for result in results:
+        print(f"  ERR {result['input']}: результат {result['output']} совпадает с другим файлом")
+    
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    
+    total = len(inputs)
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_run_batch_job, job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            status = "OK " if result['error'] is None else "ERR"
+            print(f"  [{len(results)}/{total}] {status} {result['input']} ({result['seconds']:.2f} c)")
+    elapsed = time.perf_counter() - started
+    
+    failures = [result for result in results if result['error'] is not None]
+    total_bytes = sum(result['bytes'] for result in results)
+    
+    print(f"\nОбработано: {len(results) - len(failures)}/{len(results)} файлов за {elapsed:.2f} c")
+    if elapsed > 0:
+        print(f"Пропускная способность: {total_bytes / elapsed / (1024 * 1024):.2f} МБ/с, {len(results) / elapsed:.2f} файлов/с")
+    
+    if failures:
+        print(f"Ошибки ({len(failures)}):")
+        for result in failures:
+            print(f"  {result['input']}: {result['error']}")
+    
+    return len(failures)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
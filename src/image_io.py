@@ -0,0 +1,169 @@
+import mmap
+import os
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+from PIL import Image
+
+# размер порции при потоковом шифровании (кратен размеру блока AES)
+CHUNK_SIZE = 1024 * 1024
+
+# сколько декодированных изображений держать в кэше
+DECODED_CACHE_SIZE = 4
+
+# декодированное изображение и его "сырые" пиксели
+DecodedImage = namedtuple('DecodedImage', ['image', 'data'])
+
+# изображение декодируется один раз на (путь, время изменения, размер файла)
+def load_image(path):
+    stat = os.stat(path)
+    return _decode_image(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+@lru_cache(maxsize=DECODED_CACHE_SIZE)
+def _decode_image(path, mtime_ns, file_size):
+    img = Image.open(path)
+    img.load()
+    return DecodedImage(img, img.tobytes())
+
+# имя исходного файла для метаданных; у файлового объекта (байты из сокета) - его атрибут name
+def source_filename(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.basename(source)
+    return os.path.basename(getattr(source, 'name', ''))
+
+# размер "сырых" пикселей изображения, как у img.tobytes()
+def raw_image_size(size, mode):
+    width, height = size
+    # строка из одного пикселя в высоту учитывает выравнивание (например, режим "1")
+    row_bytes = len(Image.new(mode, (width, 1)).tobytes())
+    return row_bytes * height
+
+# читает изображение полосами строк, не создавая полную копию пикселей
+def iter_image_chunks(img, chunk_size=CHUNK_SIZE):
+    width, height = img.size
+    row_bytes = raw_image_size((width, 1), img.mode)
+    rows_per_band = max(1, chunk_size // max(1, row_bytes))
+
+    for top in range(0, height, rows_per_band):
+        bottom = min(height, top + rows_per_band)
+        yield img.crop((0, top, width, bottom)).tobytes()
+
+# читает файл порциями фиксированного размера
+def iter_file_chunks(path, chunk_size=CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+# тело файла (или его часть) отображается в память, а не читается в bytes
+@contextmanager
+def map_file(path, offset=0, length=None):
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if length is None:
+            length = file_size - offset
+        if offset + length > file_size:
+            raise ValueError(f"Файл {path} короче ожидаемого: {file_size} байт вместо {offset + length}!")
+
+        # пустой файл отобразить нельзя
+        if length == 0:
+            yield memoryview(b'')
+            return
+
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            with memoryview(mapped) as whole:
+                view = whole[offset:offset + length]
+                try:
+                    yield view
+                finally:
+                    view.release()
+        finally:
+            try:
+                mapped.close()
+            except BufferError:
+                # срезы еще живы (например, в трассировке исключения) - закроет сборщик мусора
+                pass
+
+# плитки изображения построчно: (номер, (left, top, right, bottom)), крайние плитки меньше
+def tile_grid(size, tile_size):
+    width, height = size
+    tile_width, tile_height = tile_size
+    index = 0
+    for top in range(0, height, tile_height):
+        for left in range(0, width, tile_width):
+            yield index, (left, top, min(left + tile_width, width), min(top + tile_height, height))
+            index += 1
+
+# номера плиток, пересекающих область (x, y, w, h)
+def tiles_in_region(size, tile_size, region):
+    width, height = size
+    tile_width, tile_height = tile_size
+    x, y, w, h = region
+    columns = -(-width // tile_width)
+
+    for row in range(y // tile_height, (y + h - 1) // tile_height + 1):
+        for column in range(x // tile_width, (x + w - 1) // tile_width + 1):
+            left, top = column * tile_width, row * tile_height
+            yield row * columns + column, (left, top, min(left + tile_width, width), min(top + tile_height, height))
+
+# размеры уровней пирамиды 1..levels: каждый вдвое меньше предыдущего (с округлением вверх)
+def pyramid_sizes(size, levels):
+    width, height = size
+    sizes = []
+    for _ in range(levels):
+        width, height = -(-width // 2), -(-height // 2)
+        sizes.append((width, height))
+    return sizes
+
+# уменьшенные копии изображения; каждый уровень строится из предыдущего, а не из оригинала
+def iter_pyramid_images(img, levels):
+    for size in pyramid_sizes(img.size, levels):
+        img = img.resize(size, Image.BOX)
+        yield img
+
+# число каналов NumPy-массива (h, w[, каналы]) -> режим PIL
+ARRAY_MODES = {1: 'L', 3: 'RGB', 4: 'RGBA'}
+
+# размер и режим изображения для "сырого" буфера; для массива uint8 формы (h, w[, каналы])
+# их можно не указывать, для остальных буферов (bytes, bytearray, плоский массив) - обязательны
+def buffer_image_info(buffer, size=None, mode=None):
+    if size is not None and mode is not None:
+        return tuple(size), mode
+
+    view = memoryview(buffer)
+    if view.format == 'B' and view.ndim in (2, 3):
+        height, width = view.shape[:2]
+        channels = view.shape[2] if view.ndim == 3 else 1
+        if channels in ARRAY_MODES:
+            return tuple(size or (width, height)), mode or ARRAY_MODES[channels]
+    raise ValueError("Для буфера без формы (h, w[, каналы]) нужно указать размер и режим изображения!")
+
+# плоское байтовое представление буфера (NumPy-массив, memoryview, bytearray) без копирования
+def byte_view(buffer, writable=False):
+    view = memoryview(buffer)
+    if not view.c_contiguous:
+        raise ValueError("Буфер должен быть непрерывным (C-contiguous), например numpy.ascontiguousarray(...)!")
+    if writable and view.readonly:
+        raise ValueError("Выходной буфер доступен только для чтения!")
+    # пустой массив (например, 0x0): cast не принимает нули в форме - пустое представление
+    if view.nbytes == 0:
+        return memoryview(bytearray()) if writable else memoryview(b'')
+    return view.cast('B')
+
+# буфер пикселей должен совпадать по размеру с изображением
+def check_buffer_size(actual_size, expected_size):
+    if actual_size != expected_size:
+        raise ValueError(f"Размер буфера ({actual_size} байт) не совпадает с размером изображения ({expected_size} байт)!")
+
+# выходной буфер должен вмещать результат
+def check_output_size(output_size, required_size):
+    if output_size < required_size:
+        raise ValueError(f"Выходной буфер мал: {output_size} байт, нужно {required_size}!")
+
+# размер расшифрованных данных должен совпадать с размером пикселей изображения
+def check_decrypted_size(actual_size, expected_size):
+    if actual_size != expected_size:
+        raise ValueError(f"Размер расшифрованных данных ({actual_size} байт) не совпадает с размером изображения ({expected_size} байт)!")
@@ -0,0 +1,116 @@
+from functools import lru_cache
+
+# получение ключа из пароля
+#
+# pbkdf2-sha256 и scrypt - медленные KDF с солью: перебор паролей по шифру дорог.
+# legacy - прежнее дополнение/обрезание пароля и simple_hash; его используют шифры,
+# в метаданных которых нет поля kdf (все файлы, созданные до появления KDF).
+#
+# Медленный KDF для одного и того же (пароль, соль) выполняется один раз за процесс:
+# производные ключи держатся в ограниченном LRU-кэше. Пакетный режим шифрует все
+# файлы с одной солью (IV/nonce у каждого файла свой), поэтому ключ получается
+# один раз на процесс пула, а не на каждое изображение.
+#
+# Cryptodome импортируется внутри функций: для --kdf legacy и для запуска CLI
+# без шифрования (--help, ошибки аргументов) он не загружается.
+
+KDF_PBKDF2 = 'pbkdf2-sha256'
+KDF_SCRYPT = 'scrypt'
+KDF_LEGACY = 'legacy'
+KDF_NAMES = [KDF_PBKDF2, KDF_SCRYPT, KDF_LEGACY]
+DEFAULT_KDF = KDF_PBKDF2
+
+# стоимость: число итераций PBKDF2, параметр N для scrypt (r=8, p=1)
+DEFAULT_COST = {KDF_PBKDF2: 200000, KDF_SCRYPT: 2 ** 15}
+SCRYPT_BLOCK_SIZE = 8
+SCRYPT_PARALLELISM = 1
+
+SALT_SIZE = 16
+KEY_CHECK_SIZE = 16
+
+# сколько производных ключей держать в кэше
+KDF_CACHE_SIZE = 64
+
+#простая хэш функция (прежнее получение ключа и хэш ключа в старых метаданных)
+def simple_hash(data, output_length=32, return_hex=False):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    # Простой алгоритм перемешивания
+    result = bytearray(output_length)
+
+    # Первоначальное заполнение
+    for i in range(output_length):
+        result[i] = (data[i % len(data)] + i * 37) & 0xFF
+
+    # Раунды перемешивания
+    for round in range(5):
+        for i in range(output_length):
+            # XOR с соседним байтом
+            result[i] ^= result[(i + 11) % output_length]
+            result[i] = (result[i] * 167 + 113) & 0xFF
+
+    if return_hex:
+        return result.hex()
+    else:
+        return bytes(result)
+
+def generate_salt():
+    from Cryptodome.Random import get_random_bytes
+
+    return get_random_bytes(SALT_SIZE)
+
+# поля метаданных нового шифра; для legacy полей нет
+def kdf_params(kdf=DEFAULT_KDF, salt=None):
+    if kdf == KDF_LEGACY:
+        return {}
+    if kdf not in DEFAULT_COST:
+        raise ValueError(f"Неизвестный алгоритм получения ключа: {kdf}")
+
+    if salt is None:
+        salt = generate_salt()
+    elif isinstance(salt, str):
+        salt = bytes.fromhex(salt)
+
+    return {"kdf": kdf, "kdf_cost": DEFAULT_COST[kdf], "salt": salt.hex()}
+
+@lru_cache(maxsize=KDF_CACHE_SIZE)
+def derive_key(passphrase, salt, length, kdf=DEFAULT_KDF, cost=None):
+    if isinstance(passphrase, str):
+        passphrase = passphrase.encode('utf-8')
+    cost = cost or DEFAULT_COST.get(kdf)
+
+    if kdf == KDF_PBKDF2:
+        from Cryptodome.Hash import SHA256
+        from Cryptodome.Protocol.KDF import PBKDF2
+        return PBKDF2(passphrase, salt, dkLen=length, count=cost, hmac_hash_module=SHA256)
+    elif kdf == KDF_SCRYPT:
+        from Cryptodome.Protocol.KDF import scrypt
+        return scrypt(passphrase, salt, key_len=length, N=cost, r=SCRYPT_BLOCK_SIZE, p=SCRYPT_PARALLELISM)
+    else:
+        raise ValueError(f"Неизвестный алгоритм получения ключа: {kdf}")
+
+# ключ по полям kdf/kdf_cost/salt из метаданных; без них - прежний способ legacy(пароль)
+def key_from_params(passphrase, params, length, legacy):
+    kdf = params.get('kdf')
+    if not kdf or kdf == KDF_LEGACY:
+        return legacy(passphrase)
+
+    salt_hex = params.get('salt')
+    if not salt_hex:
+        raise ValueError("Соль не найдена в метаданных!")
+    return derive_key(passphrase, bytes.fromhex(salt_hex), length, kdf, params.get('kdf_cost'))
+
+# хэш для проверки ключа при дешифровании: для KDF - от производного ключа,
+# чтобы метаданные не давали обойти медленный KDF при переборе паролей
+def key_fingerprint(passphrase, key_bytes, params):
+    if not params.get('kdf') or params['kdf'] == KDF_LEGACY:
+        return simple_hash(passphrase, KEY_CHECK_SIZE, return_hex=True)
+
+    from Cryptodome.Hash import SHA256
+    return SHA256.new(b'cryptopic-key-check' + key_bytes).hexdigest()[:KEY_CHECK_SIZE * 2]
+
+def check_key(passphrase, key_bytes, meta):
+    expected_hash = meta.get('key_hash')
+    if expected_hash and key_fingerprint(passphrase, key_bytes, meta) != expected_hash:
+        print("Предупреждение: хэш ключа не совпадает! Возможно неверный ключ.")
@@ -1,11 +1,104 @@
 import math
 import json
-import csv
+import glob
+import io
+import time
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from PIL import Image
 import os
-from collections import Counter
-import statistics
-from typing import Dict, Any, Tuple
+import numpy as np
+from typing import Dict, Any, Tuple, List
+
+from image_io import load_image
+from results_store import ResultsStore, new_run_id
+from container import read_meta, read_payload
+from ciphers import AEADCipher, BlockCipher, get_cipher, cipher_for_meta
+
+# количество единичных битов для каждого значения байта
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# ошибки, перехваченные при анализе текущего изображения: вычисление продолжается
+# с резервными значениями, но задание считается неудачным (см. analyze_and_save_metrics)
+METRIC_ERRORS = []
+
+
+def metric_error(message: str):
+    print(message)
+    METRIC_ERRORS.append(message.strip())
+
+
+# постоянная соль для шифрований в анализе чувствительности: меняется только
+# проверяемый бит ключа, а PBKDF2 для одного ключа выполняется один раз (кэш kdf)
+METRICS_SALT = b"cryptopic-metric"
+
+
+# байты как массив uint8 без копирования
+def as_byte_array(data) -> np.ndarray:
+    if isinstance(data, np.ndarray):
+        return data.reshape(-1).astype(np.uint8, copy=False)
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+# гистограмма значений байтов (256 корзин)
+def byte_histogram(data) -> np.ndarray:
+    return np.bincount(as_byte_array(data), minlength=256)
+
+
+# оценки по выборке
+"""
+Вместо всех пар пикселей берется sample случайных позиций (ГПСЧ с seed),
+для каждой оценки считается 95% доверительный интервал:
+
+среднее (NPCR, UACI, avalanche):  m ± z × s / √n
+корреляция (преобразование Фишера): tanh(atanh(r) ± z / √(n - 3))
+"""
+
+CONFIDENCE_LEVEL = 0.95
+CONFIDENCE_Z = 1.959963984540054
+
+
+# точечная оценка, которая ведет себя как float и хранит доверительный интервал
+class Estimate(float):
+    def __new__(cls, value: float, ci_low: float, ci_high: float, sample_size: int):
+        estimate = super().__new__(cls, value)
+        estimate.ci_low = float(ci_low)
+        estimate.ci_high = float(ci_high)
+        estimate.sample_size = int(sample_size)
+        return estimate
+
+
+def confidence_interval(value: float) -> list:
+    if isinstance(value, Estimate):
+        return [value.ci_low, value.ci_high]
+    return [float(value), float(value)]
+
+
+def sample_rng(seed: int) -> np.random.Generator:
+    return np.random.default_rng(seed)
+
+
+# среднее по выборке с интервалом, в процентах при scale=100
+def mean_estimate(values: np.ndarray, scale: float = 100) -> Estimate:
+    n = len(values)
+    mean = float(values.mean())
+    margin = CONFIDENCE_Z * float(values.std(ddof=1)) / math.sqrt(n) if n > 1 else 0.0
+    return Estimate(
+        mean * scale,
+        max(0.0, mean - margin) * scale,
+        min(1.0, mean + margin) * scale,
+        n,
+    )
+
+
+def correlation_estimate(correlation: float, n: int) -> Estimate:
+    if n <= 3 or abs(correlation) >= 1:
+        low, high = (-1.0, 1.0) if n <= 3 else (correlation, correlation)
+        return Estimate(correlation, low, high, n)
+
+    z = math.atanh(correlation)
+    margin = CONFIDENCE_Z / math.sqrt(n - 3)
+    return Estimate(correlation, math.tanh(z - margin), math.tanh(z + margin), n)
 
 
 def save_metrics_to_json(
@@ -31,36 +124,62 @@ log₂ - логарифм по основанию 2
 
 
 def calculate_entropy_from_bytes(data_bytes: bytes) -> float:
-    if not data_bytes:
+    if len(data_bytes) == 0:
+        return 0.0
+
+    return entropy_from_histogram(byte_histogram(data_bytes))
+
+
+# энтропия по готовой гистограмме
+def entropy_from_histogram(byte_counts: np.ndarray) -> float:
+    total_bytes = int(byte_counts.sum())
+    if total_bytes == 0:
         return 0.0
 
-    byte_counts = Counter(data_bytes)
-    total_bytes = len(data_bytes)
+    probabilities = byte_counts[byte_counts > 0] / total_bytes
+    entropy = np.sum(probabilities * np.log2(1 / probabilities))
+
+    return float(entropy)
+
+
+# совмещенный анализ: энтропия и распределение из одной гистограммы
+def analyze_bytes(data_bytes: bytes, label: str) -> Dict[str, Any]:
+    byte_counts = byte_histogram(data_bytes)
+    return {
+        "entropy": entropy_from_histogram(byte_counts),
+        "distribution": distribution_from_histogram(byte_counts, label),
+    }
 
-    entropy = 0.0
-    for count in byte_counts.values():
-        probability = count / total_bytes
-        if probability > 0:
-            entropy -= probability * math.log2(probability)
 
-    return entropy
+def channel_names(channel_count: int) -> list:
+    return ["R", "G", "B", "A"][:channel_count] if channel_count > 1 else ["L"]
+
+
+# энтропия каналов по чередующимся байтам пикселей (одна гистограмма на канал)
+def calculate_channel_entropy_from_bytes(
+    data_bytes: bytes, channel_count: int
+) -> Dict[str, float]:
+    data_array = as_byte_array(data_bytes)
+    return {
+        name: entropy_from_histogram(byte_histogram(data_array[i::channel_count]))
+        for i, name in enumerate(channel_names(channel_count))
+    }
 
 
 # энтропия шеннона для изображения
 def calculate_entropy(image_path: str) -> float:
     try:
-        img = Image.open(image_path)
-        img_bytes = img.tobytes()
+        img_bytes = load_image(image_path).data
         return calculate_entropy_from_bytes(img_bytes)
     except Exception as e:
-        print(f"Ошибка вычисления энтропии для {image_path}: {e}")
+        metric_error(f"Ошибка вычисления энтропии для {image_path}: {e}")
         return 0.0
 
 
 # энтропия для каждого канала исходного изображения
 def calculate_channel_entropy_for_image(image_path: str) -> Dict[str, float]:
     try:
-        img = Image.open(image_path)
+        img = load_image(image_path).image
         channels = img.split()
 
         channel_entropies = {}
@@ -73,7 +192,7 @@ def calculate_channel_entropy_for_image(image_path: str) -> Dict[str, float]:
 
         return channel_entropies
     except Exception as e:
-        print(f"Ошибка вычисления энтропии каналов для {image_path}: {e}")
+        metric_error(f"Ошибка вычисления энтропии каналов для {image_path}: {e}")
         return {}
 
 
@@ -84,47 +203,17 @@ def calculate_channel_entropy_for_encrypted(
     try:
         channel_entropies = {}
 
-        if original_mode == "RGB":
-            expected_size = original_size[0] * original_size[1] * 3
+        channel_counts = {"RGB": 3, "L": 1, "RGBA": 4}
+        if original_mode in channel_counts:
+            channel_count = channel_counts[original_mode]
+            expected_size = original_size[0] * original_size[1] * channel_count
             if len(encrypted_bytes) >= expected_size:
-                # Создаем временное изображение из зашифрованных данных
-                temp_img = Image.frombytes(
-                    "RGB", original_size, encrypted_bytes[:expected_size]
+                channel_entropies = calculate_channel_entropy_from_bytes(
+                    as_byte_array(encrypted_bytes)[:expected_size], channel_count
                 )
-                channels = temp_img.split()
-
-                for i, channel in enumerate(channels):
-                    channel_bytes = channel.tobytes()
-                    entropy = calculate_entropy_from_bytes(channel_bytes)
-                    channel_name = ["R", "G", "B"][i]
-                    channel_entropies[channel_name] = entropy
-            else:
+            elif original_mode == "RGB":
                 print(f"Недостаточно данных для анализа каналов RGB")
 
-        elif original_mode == "L":
-            expected_size = original_size[0] * original_size[1]
-            if len(encrypted_bytes) >= expected_size:
-                temp_img = Image.frombytes(
-                    "L", original_size, encrypted_bytes[:expected_size]
-                )
-                channel_bytes = temp_img.tobytes()
-                entropy = calculate_entropy_from_bytes(channel_bytes)
-                channel_entropies["L"] = entropy
-
-        elif original_mode == "RGBA":
-            expected_size = original_size[0] * original_size[1] * 4
-            if len(encrypted_bytes) >= expected_size:
-                temp_img = Image.frombytes(
-                    "RGBA", original_size, encrypted_bytes[:expected_size]
-                )
-                channels = temp_img.split()
-
-                for i, channel in enumerate(channels):
-                    channel_bytes = channel.tobytes()
-                    entropy = calculate_entropy_from_bytes(channel_bytes)
-                    channel_name = ["R", "G", "B", "A"][i]
-                    channel_entropies[channel_name] = entropy
-
         # Если не удалось создать изображение, анализируем байты как отдельные "каналы"
         if not channel_entropies:
             print("Используем адаптивный анализ каналов для зашифрованных данных")
@@ -133,7 +222,9 @@ def calculate_channel_entropy_for_encrypted(
         return channel_entropies
 
     except Exception as e:
-        print(f"Ошибка вычисления энтропии каналов для зашифрованных данных: {e}")
+        metric_error(
+            f"Ошибка вычисления энтропии каналов для зашифрованных данных: {e}"
+        )
         return calculate_adaptive_channel_entropy(encrypted_bytes)
 
 
@@ -146,25 +237,18 @@ def calculate_adaptive_channel_entropy(data_bytes: bytes) -> Dict[str, float]:
         channel_entropies = {}
 
         if len(data_bytes) >= 3:
-            # Для RGB-подобного анализа
-            channel1 = bytes([data_bytes[i] for i in range(0, len(data_bytes), 3)])
-            channel2 = (
-                bytes([data_bytes[i] for i in range(1, len(data_bytes), 3)])
-                if len(data_bytes) > 1
-                else b""
-            )
-            channel3 = (
-                bytes([data_bytes[i] for i in range(2, len(data_bytes), 3)])
-                if len(data_bytes) > 2
-                else b""
-            )
+            # Для RGB-подобного анализа - срезы с шагом 3 без копирования
+            data_array = as_byte_array(data_bytes)
+            channel1 = data_array[0::3]
+            channel2 = data_array[1::3]
+            channel3 = data_array[2::3]
 
             channel_entropies["Encrypted_R"] = calculate_entropy_from_bytes(channel1)
-            if channel2:
+            if len(channel2):
                 channel_entropies["Encrypted_G"] = calculate_entropy_from_bytes(
                     channel2
                 )
-            if channel3:
+            if len(channel3):
                 channel_entropies["Encrypted_B"] = calculate_entropy_from_bytes(
                     channel3
                 )
@@ -177,7 +261,7 @@ def calculate_adaptive_channel_entropy(data_bytes: bytes) -> Dict[str, float]:
         return channel_entropies
 
     except Exception as e:
-        print(f"Ошибка в адаптивном анализе каналов: {e}")
+        metric_error(f"Ошибка в адаптивном анализе каналов: {e}")
         return {"Encrypted_Data": calculate_entropy_from_bytes(data_bytes)}
 
 
@@ -197,62 +281,76 @@ def calculate_correlation_from_image(
     image_path: str, direction: str = "horizontal"
 ) -> float:
     try:
-        img = Image.open(image_path).convert("L")
-        pixels = list(img.getdata())
+        img = load_image(image_path).image.convert("L")
+        pixels = np.asarray(img)
         width, height = img.size
 
         return calculate_correlation_from_pixels(pixels, width, height, direction)
     except Exception as e:
-        print(f"Ошибка вычисления корреляции для {image_path}: {e}")
+        metric_error(f"Ошибка вычисления корреляции для {image_path}: {e}")
         return 0.0
 
 
+# пары соседних пикселей как два сдвинутых среза одного массива
+def neighbor_pairs(
+    pixels, width: int, height: int, direction: str
+) -> Tuple[np.ndarray, np.ndarray]:
+    grid = np.asarray(pixels).reshape(-1)[: width * height].reshape(height, width)
+
+    if direction == "horizontal":
+        return grid[:, :-1], grid[:, 1:]
+    elif direction == "vertical":
+        return grid[:-1, :], grid[1:, :]
+    elif direction == "diagonal":
+        return grid[:-1, :-1], grid[1:, 1:]
+
+    empty = grid[:0, :0]
+    return empty, empty
+
+
 # коррелляция соседних пикселей из массива пикселей
 def calculate_correlation_from_pixels(
-    pixels: list, width: int, height: int, direction: str = "horizontal"
+    pixels,
+    width: int,
+    height: int,
+    direction: str = "horizontal",
+    sample: int = None,
+    seed: int = 0,
 ) -> float:
     try:
-        correlations = []
-
-        if direction == "horizontal":
-            for y in range(height):
-                for x in range(width - 1):
-                    p1 = pixels[y * width + x]
-                    p2 = pixels[y * width + x + 1]
-                    correlations.append((p1, p2))
-        elif direction == "vertical":
-            for y in range(height - 1):
-                for x in range(width):
-                    p1 = pixels[y * width + x]
-                    p2 = pixels[(y + 1) * width + x]
-                    correlations.append((p1, p2))
-        elif direction == "diagonal":
-            for y in range(height - 1):
-                for x in range(width - 1):
-                    p1 = pixels[y * width + x]
-                    p2 = pixels[(y + 1) * width + x + 1]
-                    correlations.append((p1, p2))
-
-        if len(correlations) < 2:
+        x_vals, y_vals = neighbor_pairs(pixels, width, height, direction)
+
+        if x_vals.size < 2:
             return 0.0
 
-        x_vals = [p[0] for p in correlations]
-        y_vals = [p[1] for p in correlations]
+        # выборка случайных пар: индексация по строкам и столбцам без копии всей сетки
+        sampled = sample is not None and sample < x_vals.size
+        if sampled:
+            rng = sample_rng(seed)
+            rows = rng.integers(0, x_vals.shape[0], size=sample)
+            cols = rng.integers(0, x_vals.shape[1], size=sample)
+            x_vals = x_vals[rows, cols]
+            y_vals = y_vals[rows, cols]
 
-        mean_x = statistics.mean(x_vals)
-        mean_y = statistics.mean(y_vals)
+        x_vals = x_vals.astype(np.float64)
+        y_vals = y_vals.astype(np.float64)
 
-        covariance = sum((x - mean_x) * (y - mean_y) for x, y in correlations)
-        variance_x = sum((x - mean_x) ** 2 for x in x_vals)
-        variance_y = sum((y - mean_y) ** 2 for y in y_vals)
+        x_centered = x_vals - x_vals.mean()
+        y_centered = y_vals - y_vals.mean()
+
+        covariance = np.sum(x_centered * y_centered)
+        variance_x = np.sum(x_centered * x_centered)
+        variance_y = np.sum(y_centered * y_centered)
 
         if variance_x == 0 or variance_y == 0:
             return 0.0
 
         correlation = covariance / math.sqrt(variance_x * variance_y)
-        return correlation
+        if sampled:
+            return correlation_estimate(float(correlation), x_vals.size)
+        return float(correlation)
     except Exception as e:
-        print(f"Ошибка в calculate_correlation_from_pixels: {e}")
+        metric_error(f"Ошибка в calculate_correlation_from_pixels: {e}")
         return 0.0
 
 
@@ -271,33 +369,73 @@ UACI = [∑ |I₁(i,j) - I₂(i,j)| / (M × N × 255)] × 100%
 """
 
 
-def calculate_npcr_uaci(bytes1: bytes, bytes2: bytes) -> Tuple[float, float]:
+def calculate_npcr_uaci(
+    bytes1: bytes, bytes2: bytes, sample: int = None, seed: int = 0
+) -> Tuple[float, float]:
     try:
-        if len(bytes1) != len(bytes2):
-            # Используем минимальную длину для вычислений
-            min_len = min(len(bytes1), len(bytes2))
-            bytes1 = bytes1[:min_len]
-            bytes2 = bytes2[:min_len]
+        comparison = compare_buffers(bytes1, bytes2, sample=sample, seed=seed)
+        return comparison["npcr"], comparison["uaci"]
+    except Exception as e:
+        metric_error(f"Ошибка вычисления NPCR/UACI: {e}")
+        return 0.0, 0.0
 
-        total_bytes = len(bytes1)
-        if total_bytes == 0:
-            return 0.0, 0.0
 
-        changed_bytes = 0
-        total_difference = 0
+# размер блока для совмещенного прохода по паре буферов
+COMPARE_BLOCK_SIZE = 1024 * 1024
 
-        for i in range(total_bytes):
-            if bytes1[i] != bytes2[i]:
-                changed_bytes += 1
-                total_difference += abs(bytes1[i] - bytes2[i])
 
-        npcr = (changed_bytes / total_bytes) * 100
-        uaci = (total_difference / (total_bytes * 255)) * 100
+# NPCR, UACI и avalanche за один проход по паре буферов блоками
+def compare_buffers(
+    bytes1: bytes, bytes2: bytes, sample: int = None, seed: int = 0
+) -> Dict[str, float]:
+    # Используем минимальную длину для вычислений
+    min_len = min(len(bytes1), len(bytes2))
+    array1 = as_byte_array(bytes1)[:min_len]
+    array2 = as_byte_array(bytes2)[:min_len]
+
+    if min_len == 0:
+        return {"npcr": 0.0, "uaci": 0.0, "avalanche_effect": 0.0}
+
+    if sample is not None and sample < min_len:
+        return estimate_comparison(array1, array2, sample, seed)
+
+    changed_bytes = 0
+    total_difference = 0
+    changed_bits = 0
+
+    for start in range(0, min_len, COMPARE_BLOCK_SIZE):
+        block1 = array1[start : start + COMPARE_BLOCK_SIZE]
+        block2 = array2[start : start + COMPARE_BLOCK_SIZE]
+
+        xor_result = np.bitwise_xor(block1, block2)
+        changed_bytes += int(np.count_nonzero(xor_result))
+        # popcount через таблицу для каждого байта XOR
+        changed_bits += int(POPCOUNT_TABLE[xor_result].sum(dtype=np.int64))
+        total_difference += int(
+            np.abs(block1.astype(np.int16) - block2).sum(dtype=np.int64)
+        )
 
-        return npcr, uaci
-    except Exception as e:
-        print(f"Ошибка вычисления NPCR/UACI: {e}")
-        return 0.0, 0.0
+    return {
+        "npcr": (changed_bytes / min_len) * 100,
+        "uaci": (total_difference / (min_len * 255)) * 100,
+        "avalanche_effect": (changed_bits / (min_len * 8)) * 100,
+    }
+
+
+# NPCR, UACI и avalanche по случайной выборке позиций
+def estimate_comparison(
+    array1: np.ndarray, array2: np.ndarray, sample: int, seed: int
+) -> Dict[str, Estimate]:
+    positions = np.sort(sample_rng(seed).integers(0, len(array1), size=sample))
+    block1 = array1[positions]
+    block2 = array2[positions]
+
+    xor_result = np.bitwise_xor(block1, block2)
+    return {
+        "npcr": mean_estimate((xor_result != 0).astype(np.float64)),
+        "uaci": mean_estimate(np.abs(block1.astype(np.int16) - block2) / 255),
+        "avalanche_effect": mean_estimate(POPCOUNT_TABLE[xor_result] / 8),
+    }
 
 
 # avalanche effect
@@ -307,28 +445,15 @@ AE = [∑ popcount(B1_i ⊕ B2_i)] / (N × 8) × 100%
 """
 
 
-def calculate_avalanche_effect(bytes1: bytes, bytes2: bytes) -> float:
+def calculate_avalanche_effect(
+    bytes1: bytes, bytes2: bytes, sample: int = None, seed: int = 0
+) -> float:
     try:
-        if len(bytes1) != len(bytes2):
-            # Используем минимальную длину для вычислений
-            min_len = min(len(bytes1), len(bytes2))
-            bytes1 = bytes1[:min_len]
-            bytes2 = bytes2[:min_len]
-
-        total_bits = len(bytes1) * 8
-        if total_bits == 0:
-            return 0.0
-
-        changed_bits = 0
-
-        for i in range(len(bytes1)):
-            xor_result = bytes1[i] ^ bytes2[i]
-            changed_bits += bin(xor_result).count("1")
-
-        avalanche_percent = (changed_bits / total_bits) * 100
-        return avalanche_percent
+        return compare_buffers(bytes1, bytes2, sample=sample, seed=seed)[
+            "avalanche_effect"
+        ]
     except Exception as e:
-        print(f"Ошибка вычисления avalanche effect: {e}")
+        metric_error(f"Ошибка вычисления avalanche effect: {e}")
         return 0.0
 
 
@@ -350,9 +475,13 @@ uniformity_score = (1 - (avg_deviation / expected_per_byte)) × 100%
 
 
 def analyze_byte_distribution(data_bytes: bytes, label: str) -> Dict[str, Any]:
+    return distribution_from_histogram(byte_histogram(data_bytes), label)
+
+
+# распределение по готовой гистограмме
+def distribution_from_histogram(byte_counts: np.ndarray, label: str) -> Dict[str, Any]:
     try:
-        byte_counts = Counter(data_bytes)
-        total_bytes = len(data_bytes)
+        total_bytes = int(byte_counts.sum())
 
         if total_bytes == 0:
             return {
@@ -367,14 +496,10 @@ def analyze_byte_distribution(data_bytes: bytes, label: str) -> Dict[str, Any]:
         expected_per_byte = total_bytes / 256
 
         # Вычисление отклонения от равномерности
-        deviations = []
-        for byte_val in range(256):
-            actual_count = byte_counts.get(byte_val, 0)
-            deviation = abs(actual_count - expected_per_byte)
-            deviations.append(deviation)
+        deviations = np.abs(byte_counts - expected_per_byte)
 
-        avg_deviation = sum(deviations) / len(deviations)
-        max_deviation = max(deviations)
+        avg_deviation = float(deviations.mean())
+        max_deviation = float(deviations.max())
 
         uniformity_score = (
             (1 - (avg_deviation / expected_per_byte)) * 100
@@ -383,14 +508,14 @@ def analyze_byte_distribution(data_bytes: bytes, label: str) -> Dict[str, Any]:
         )
 
         return {
-            "unique_bytes": len(byte_counts),
+            "unique_bytes": int(np.count_nonzero(byte_counts)),
             "total_bytes": total_bytes,
             "avg_deviation": avg_deviation,
             "max_deviation": max_deviation,
             "uniformity_score": uniformity_score,
         }
     except Exception as e:
-        print(f"Ошибка анализа распределения байтов ({label}): {e}")
+        metric_error(f"Ошибка анализа распределения байтов ({label}): {e}")
         return {
             "unique_bytes": 0,
             "total_bytes": 0,
@@ -400,57 +525,65 @@ def analyze_byte_distribution(data_bytes: bytes, label: str) -> Dict[str, Any]:
         }
 
 
+# зашифрованные данные как полутоновое изображение исходного размера
+def encrypted_grayscale(
+    encrypted_bytes: bytes, image_size: tuple, image_mode: str
+) -> np.ndarray:
+    width, height = image_size
+    # Определяем ожидаемый размер данных для изображения
+    channel_counts = {"RGB": 3, "L": 1, "RGBA": 4}
+    if image_mode not in channel_counts:
+        return None
+
+    expected_size = width * height * channel_counts[image_mode]
+    if len(encrypted_bytes) < expected_size:
+        return None
+
+    temp_img = Image.frombytes(
+        image_mode, (width, height), bytes(encrypted_bytes[:expected_size])
+    )
+    if image_mode != "L":
+        temp_img = temp_img.convert("L")
+    return np.asarray(temp_img)
+
+
 # корреляция для зашифрованных данных
 def calculate_encrypted_correlation(
-    encrypted_bytes: bytes, image_size: tuple, image_mode: str, direction: str
+    encrypted_bytes: bytes,
+    image_size: tuple,
+    image_mode: str,
+    direction: str,
+    pixels: np.ndarray = None,
+    sample: int = None,
+    seed: int = 0,
 ) -> float:
     try:
         width, height = image_size
-        # Определяем ожидаемый размер данных для изображения
-        if image_mode == "RGB":
-            expected_size = width * height * 3
-            if len(encrypted_bytes) >= expected_size:
-                temp_img = Image.frombytes(
-                    "RGB", (width, height), encrypted_bytes[:expected_size]
-                )
-                temp_img = temp_img.convert("L")
-                pixels = list(temp_img.getdata())
-                return calculate_correlation_from_pixels(
-                    pixels, width, height, direction
-                )
-        elif image_mode == "L":
-            expected_size = width * height
-            if len(encrypted_bytes) >= expected_size:
-                temp_img = Image.frombytes(
-                    "L", (width, height), encrypted_bytes[:expected_size]
-                )
-                pixels = list(temp_img.getdata())
-                return calculate_correlation_from_pixels(
-                    pixels, width, height, direction
-                )
-        elif image_mode == "RGBA":
-            expected_size = width * height * 4
-            if len(encrypted_bytes) >= expected_size:
-                temp_img = Image.frombytes(
-                    "RGBA", (width, height), encrypted_bytes[:expected_size]
-                )
-                temp_img = temp_img.convert("L")
-                pixels = list(temp_img.getdata())
-                return calculate_correlation_from_pixels(
-                    pixels, width, height, direction
-                )
+        # полутоновое представление можно передать готовым, чтобы не строить его заново
+        if pixels is None:
+            pixels = encrypted_grayscale(encrypted_bytes, image_size, image_mode)
+        if pixels is not None:
+            return calculate_correlation_from_pixels(
+                pixels, width, height, direction, sample=sample, seed=seed
+            )
 
         # Если данных недостаточно, используем адаптивный метод
         print(f" Недостаточно данных для корреляции, используем адаптивный метод")
-        return calculate_adaptive_correlation(encrypted_bytes, direction)
+        return calculate_adaptive_correlation(
+            encrypted_bytes, direction, sample=sample, seed=seed
+        )
 
     except Exception as e:
-        print(f" Ошибка вычисления корреляции для зашифрованных данных: {e}")
-        return calculate_adaptive_correlation(encrypted_bytes, direction)
+        metric_error(f" Ошибка вычисления корреляции для зашифрованных данных: {e}")
+        return calculate_adaptive_correlation(
+            encrypted_bytes, direction, sample=sample, seed=seed
+        )
 
 
 # метод вычисления корреляции для произвольных байтов
-def calculate_adaptive_correlation(data_bytes: bytes, direction: str) -> float:
+def calculate_adaptive_correlation(
+    data_bytes: bytes, direction: str, sample: int = None, seed: int = 0
+) -> float:
     try:
         if len(data_bytes) < 2:
             return 0.0
@@ -460,48 +593,54 @@ def calculate_adaptive_correlation(data_bytes: bytes, direction: str) -> float:
         virtual_height = max(1, len(data_bytes) // virtual_width)
 
         # Используем первые virtual_width * virtual_height байтов как пиксели
-        pixels = list(data_bytes[: virtual_width * virtual_height])
+        pixels = as_byte_array(data_bytes)[: virtual_width * virtual_height]
 
         return calculate_correlation_from_pixels(
-            pixels, virtual_width, virtual_height, direction
+            pixels, virtual_width, virtual_height, direction, sample=sample, seed=seed
         )
     except Exception as e:
-        print(f"Ошибка в адаптивной корреляции: {e}")
+        metric_error(f"Ошибка в адаптивной корреляции: {e}")
         return 0.0
 
 
 # чувствительность к изменению ключа
 def analyze_key_sensitivity(
-    original_path: str, key1: str, key2: str, algorithm: str = "stream-rc4-custom"
+    original_path: str,
+    key1: str,
+    key2: str,
+    algorithm: str = "stream-rc4-custom",
+    original_bytes: bytes = None,
+    sample: int = None,
+    seed: int = 0,
 ) -> Dict[str, Any]:
     try:
         print(f"АНАЛИЗ ЧУВСТВИТЕЛЬНОСТИ К КЛЮЧУ")
         print(f"   Ключ 1: {key1}")
         print(f"   Ключ 2: {key2}")
 
-        original_img = Image.open(original_path)
-        original_bytes = original_img.tobytes()
+        # уже декодированные пиксели можно передать, чтобы не открывать файл заново
+        if original_bytes is None:
+            original_bytes = load_image(original_path).data
 
         # Шифруем с первым ключом
         print("   Шифрование с ключом 1...")
-        encrypted1 = encrypt_with_key(original_path, key1, algorithm)
+        encrypted1 = encrypt_bytes_with_key(original_bytes, key1, algorithm)
 
         # Шифруем со вторым ключом
         print("   Шифрование с ключом 2...")
-        encrypted2 = encrypt_with_key(original_path, key2, algorithm)
+        encrypted2 = encrypt_bytes_with_key(original_bytes, key2, algorithm)
 
-        # Вычисляем метрики различий между двумя шифрами
+        # Вычисляем метрики различий между двумя шифрами за один проход
         print("   Вычисление метрик различий...")
-        npcr, uaci = calculate_npcr_uaci(encrypted1, encrypted2)
-        avalanche = calculate_avalanche_effect(encrypted1, encrypted2)
-
-        # Энтропия каждого шифра
-        entropy1 = calculate_entropy_from_bytes(encrypted1)
-        entropy2 = calculate_entropy_from_bytes(encrypted2)
+        comparison = compare_buffers(encrypted1, encrypted2, sample=sample, seed=seed)
+        npcr, uaci = comparison["npcr"], comparison["uaci"]
+        avalanche = comparison["avalanche_effect"]
 
-        # Распределение байтов
-        distribution1 = analyze_byte_distribution(encrypted1, "key1_encrypted")
-        distribution2 = analyze_byte_distribution(encrypted2, "key2_encrypted")
+        # Энтропия и распределение байтов каждого шифра из одной гистограммы
+        analysis1 = analyze_bytes(encrypted1, "key1_encrypted")
+        analysis2 = analyze_bytes(encrypted2, "key2_encrypted")
+        entropy1, distribution1 = analysis1["entropy"], analysis1["distribution"]
+        entropy2, distribution2 = analysis2["entropy"], analysis2["distribution"]
 
         results = {
             "test_type": "key_sensitivity",
@@ -531,54 +670,57 @@ def analyze_key_sensitivity(
         return results
 
     except Exception as e:
-        print(f"Ошибка анализа чувствительности к ключу: {e}")
+        metric_error(f"Ошибка анализа чувствительности к ключу: {e}")
 
 
 def encrypt_with_key(image_path: str, key: str, algorithm: str) -> bytes:
-    try:
-        if algorithm.startswith("aes-"):
-            # импортируем тут во избежать циклических импортов
-            from crypto_block import block_encrypt
-
-            mode = algorithm.replace("aes-", "")
-            encrypted_data, meta = block_encrypt(image_path, key, mode=mode)
-            return encrypted_data
-
-        elif algorithm == "stream-rc4-custom":
-            from crypto_stream import stream_encrypt
+    return encrypt_bytes_with_key(load_image(image_path).data, key, algorithm)
 
-            encrypted_data, meta = stream_encrypt(image_path, key)
-            return encrypted_data
 
-        else:
-            raise ValueError(f"Неизвестный алгоритм: {algorithm}")
+# шифрование уже декодированных пикселей, без повторного чтения изображения
+def encrypt_bytes_with_key(data: bytes, key: str, algorithm: str) -> bytes:
+    try:
+        # модуль шифра импортируется реестром при первом обращении
+        encrypted_data, params = get_cipher(algorithm).encrypt_bytes(
+            data, key, salt=METRICS_SALT
+        )
+        return encrypted_data
 
     except ImportError as e:
-        print(f" Модуль для {algorithm} не найден: {e}")
+        metric_error(f" Модуль для {algorithm} не найден: {e}")
 
 
 # анализ чувствительности к изменению IV/nonce
 def analyze_iv_nonce_sensitivity(
-    original_path: str, key: str, algorithm: str
+    original_path: str,
+    key: str,
+    algorithm: str,
+    original_bytes: bytes = None,
+    sample: int = None,
+    seed: int = 0,
 ) -> Dict[str, Any]:
     try:
         print(f"АНАЛИЗ ЧУВСТВИТЕЛЬНОСТИ К IV/NONCE")
 
-        # шифруем с разными IV/nonce
-        if algorithm in ["aes-cbc", "aes-cfb", "aes-ctr"]:
+        # шифруем с разными IV/nonce; как и прежде, только режимы AES и AEAD
+        cipher = get_cipher(algorithm)
+        if cipher.uses_iv and isinstance(cipher, (BlockCipher, AEADCipher)):
             print("   Тестирование с разными параметрами...")
+            if original_bytes is None:
+                original_bytes = load_image(original_path).data
             # с первыми параметрами
-            encrypted1 = encrypt_with_key(original_path, key, algorithm)
+            encrypted1 = encrypt_bytes_with_key(original_bytes, key, algorithm)
             # со вторыми параметрами
-            encrypted2 = encrypt_with_key(original_path, key, algorithm)
+            encrypted2 = encrypt_bytes_with_key(original_bytes, key, algorithm)
 
         else:
             print(f"   Алгоритм {algorithm} не использует IV/nonce")
             return {}
 
         # метрики различий
-        npcr, uaci = calculate_npcr_uaci(encrypted1, encrypted2)
-        avalanche = calculate_avalanche_effect(encrypted1, encrypted2)
+        comparison = compare_buffers(encrypted1, encrypted2, sample=sample, seed=seed)
+        npcr, uaci = comparison["npcr"], comparison["uaci"]
+        avalanche = comparison["avalanche_effect"]
 
         results = {
             "test_type": "iv_nonce_sensitivity",
@@ -596,12 +738,17 @@ def analyze_iv_nonce_sensitivity(
         return results
 
     except Exception as e:
-        print(f" Ошибка анализа чувствительности к IV/nonce: {e}")
+        metric_error(f" Ошибка анализа чувствительности к IV/nonce: {e}")
         return {}
 
 
 def compute_all_metrics(
-    original_path: str, encrypted_bin_path: str, image_name: str, algorithm: str
+    original_path: str,
+    encrypted_bin_path: str,
+    image_name: str,
+    algorithm: str,
+    sample: int = None,
+    seed: int = 0,
 ) -> Dict[str, Any]:
 
     # проверка существования файлов
@@ -611,36 +758,41 @@ def compute_all_metrics(
         raise FileNotFoundError(f"Зашифрованный файл не найден: {encrypted_bin_path}")
 
     try:
-        with open(encrypted_bin_path, "rb") as f:
-            encrypted_bytes = f.read()
-
-        original_img = Image.open(original_path)
-        original_bytes = original_img.tobytes()
+        # шифр без заголовка и метаданные: контейнер или .bin + .meta.json
+        meta, encrypted_bytes = read_payload(encrypted_bin_path)
 
-        # дешифруем данные для корректного сравнения
-        meta_path = encrypted_bin_path + ".meta.json"
-        with open(meta_path, "r") as f:
-            meta = json.load(f)
+        # исходное изображение декодируется один раз на весь анализ
+        original_img, original_bytes = load_image(original_path)
 
         # дешифр для проверки обратимости
-        if algorithm.startswith("aes-"):
-            from crypto_block import block_decrypt
-
-            decrypted_bytes = block_decrypt(encrypted_bin_path, "test123", meta)
-        else:
-            from crypto_stream import stream_decrypt
+        decrypted_bytes = get_cipher(algorithm).decrypt_bytes(
+            encrypted_bytes, "test123", meta
+        )
 
-            decrypted_bytes = stream_decrypt(encrypted_bin_path, "test123", meta)
+        # одна гистограмма на буфер: из нее и энтропия, и распределение байтов
+        original_analysis = analyze_bytes(original_bytes, "original")
+        encrypted_analysis = analyze_bytes(encrypted_bytes, "encrypted")
 
         print("ВЫЧИСЛЕНИЕ ЭНТРОПИИ...")
-        original_entropy = calculate_entropy_from_bytes(original_bytes)
-        encrypted_entropy = calculate_entropy_from_bytes(encrypted_bytes)
+        original_entropy = original_analysis["entropy"]
+        encrypted_entropy = encrypted_analysis["entropy"]
 
         print(f"   Исходная энтропия: {original_entropy:.6f}")
         print(f"   Энтропия шифра: {encrypted_entropy:.6f}")
 
         print("ЭНТРОПИЯ КАНАЛОВ...")
-        original_channel_entropy = calculate_channel_entropy_for_image(original_path)
+        channel_count = len(original_img.getbands())
+        if len(original_bytes) == (
+            original_img.size[0] * original_img.size[1] * channel_count
+        ):
+            # 8 бит на канал - каналы берем срезами из уже декодированных байтов
+            original_channel_entropy = calculate_channel_entropy_from_bytes(
+                original_bytes, channel_count
+            )
+        else:
+            original_channel_entropy = calculate_channel_entropy_for_image(
+                original_path
+            )
         encrypted_channel_entropy = calculate_channel_entropy_for_encrypted(
             encrypted_bytes, original_img.size, original_img.mode
         )
@@ -649,21 +801,38 @@ def compute_all_metrics(
         print(f"   Зашифрованные каналы: {encrypted_channel_entropy}")
 
         print("NPCR/UACI...")
-        # сравнение оригинала с зашифрованнными данными
-        npcr, uaci = calculate_npcr_uaci(original_bytes, encrypted_bytes)
+        # сравнение оригинала с зашифрованнными данными, NPCR/UACI и avalanche за один проход
+        comparison = compare_buffers(
+            original_bytes, encrypted_bytes, sample=sample, seed=seed
+        )
+        npcr, uaci = comparison["npcr"], comparison["uaci"]
         print(f"   NPCR: {npcr:.6f}%")
         print(f"   UACI: {uaci:.6f}%")
 
         print("AVALANCHE EFFECT...")
-        avalanche = calculate_avalanche_effect(original_bytes, encrypted_bytes)
+        avalanche = comparison["avalanche_effect"]
         print(f"   Avalanche effect: {avalanche:.6f}%")
 
         print("КОРРЕЛЯЦИЯ...")
+        # полутоновые представления строятся один раз на все направления
+        original_gray = np.asarray(original_img.convert("L"))
+        encrypted_gray = encrypted_grayscale(
+            encrypted_bytes, original_img.size, original_img.mode
+        )
+        width, height = original_img.size
         correlations = {}
         for direction in ["horizontal", "vertical", "diagonal"]:
-            original_corr = calculate_correlation_from_image(original_path, direction)
+            original_corr = calculate_correlation_from_pixels(
+                original_gray, width, height, direction, sample=sample, seed=seed
+            )
             encrypted_corr = calculate_encrypted_correlation(
-                encrypted_bytes, original_img.size, original_img.mode, direction
+                encrypted_bytes,
+                original_img.size,
+                original_img.mode,
+                direction,
+                pixels=encrypted_gray,
+                sample=sample,
+                seed=seed,
             )
 
             correlations[direction] = {
@@ -678,8 +847,8 @@ def compute_all_metrics(
             print(f"   {direction}: {original_corr:.6f} → {encrypted_corr:.6f}")
 
         print("РАСПРЕДЕЛЕНИЕ БАЙТОВ...")
-        original_distribution = analyze_byte_distribution(original_bytes, "original")
-        encrypted_distribution = analyze_byte_distribution(encrypted_bytes, "encrypted")
+        original_distribution = original_analysis["distribution"]
+        encrypted_distribution = encrypted_analysis["distribution"]
 
         print("ПРОВЕРКА ОБРАТИМОСТИ...")
         reversibility_ok = original_bytes == decrypted_bytes
@@ -692,19 +861,33 @@ def compute_all_metrics(
 
             # Диагностика различий
             min_len = min(len(original_bytes), len(decrypted_bytes))
-            differences = sum(
-                1 for i in range(min_len) if original_bytes[i] != decrypted_bytes[i]
+            differences = int(
+                np.count_nonzero(
+                    as_byte_array(original_bytes)[:min_len]
+                    != as_byte_array(decrypted_bytes)[:min_len]
+                )
             )
             print(f"   Различий: {differences} из {min_len} байт")
 
         print("АНАЛИЗ ЧУВСТВИТЕЛЬНОСТИ К КЛЮЧУ...")
         key_sensitivity_results = analyze_key_sensitivity(
-            original_path, "test_key_123", "test_key_124", algorithm
+            original_path,
+            "test_key_123",
+            "test_key_124",
+            algorithm,
+            original_bytes=original_bytes,
+            sample=sample,
+            seed=seed,
         )
 
         print("АНАЛИЗ ЧУВСТВИТЕЛЬНОСТИ К IV/NONCE...")
         iv_sensitivity_results = analyze_iv_nonce_sensitivity(
-            original_path, "test_key_123", algorithm
+            original_path,
+            "test_key_123",
+            algorithm,
+            original_bytes=original_bytes,
+            sample=sample,
+            seed=seed,
         )
 
         results = {
@@ -739,11 +922,31 @@ def compute_all_metrics(
             "iv_nonce_sensitivity": iv_sensitivity_results,
         }
 
+        # приближенный режим: параметры выборки и интервалы рядом с оценками
+        if sample is not None:
+            results["sampling"] = {
+                "sample_size": sample,
+                "seed": seed,
+                "confidence": CONFIDENCE_LEVEL,
+            }
+            results["confidence_intervals"] = {
+                "npcr": confidence_interval(npcr),
+                "uaci": confidence_interval(uaci),
+                "avalanche_effect": confidence_interval(avalanche),
+                "correlations": {
+                    direction: {
+                        "original": confidence_interval(values["original"]),
+                        "encrypted": confidence_interval(values["encrypted"]),
+                    }
+                    for direction, values in correlations.items()
+                },
+            }
+
         print("ВЫЧИСЛЕНИЯ ЗАВЕРШЕНЫ")
         return results
 
     except Exception as e:
-        print(f"КРИТИЧЕСКАЯ ОШИБКА при вычислении метрик для {image_name}: {e}")
+        metric_error(f"КРИТИЧЕСКАЯ ОШИБКА при вычислении метрик для {image_name}: {e}")
         return create_fallback_metrics(
             image_name, original_path, encrypted_bin_path, algorithm
         )
@@ -755,10 +958,8 @@ def create_fallback_metrics(
     print(f"СОЗДАНИЕ РЕЗЕРВНЫХ МЕТРИК ДЛЯ {image_name}")
 
     try:
-        with open(encrypted_path, "rb") as f:
-            encrypted_bytes = f.read()
-        original_img = Image.open(original_path)
-        original_bytes = original_img.tobytes()
+        encrypted_bytes = read_payload(encrypted_path)[1]
+        original_bytes = load_image(original_path).data
     except:
         encrypted_bytes = b""
         original_bytes = b""
@@ -799,8 +1000,11 @@ def create_fallback_metrics(
     }
 
 
-def update_summary_table(new_results: Dict[str, Any]):
-    summary_file = "results/report_data/summary_table.csv"
+SUMMARY_FILE = "results/report_data/summary_table.csv"
+
+
+# запись сводной таблицы из результатов одного изображения (числа, без форматирования)
+def summary_row(new_results: Dict[str, Any]) -> Dict[str, Any]:
     entropy_data = new_results.get(
         "entropy", {"original": 0, "encrypted": 0, "improvement": 0}
     )
@@ -810,187 +1014,243 @@ def update_summary_table(new_results: Dict[str, Any]):
     file_sizes = new_results.get(
         "file_sizes", {"original_bytes": 0, "encrypted_bytes": 0}
     )
-    key_sensitivity = new_results.get("key_sensitivity", {}).get(
+    key_sensitivity = (new_results.get("key_sensitivity") or {}).get(
         "sensitivity_metrics", {}
     )
-    iv_sensitivity = new_results.get("iv_nonce_sensitivity", {}).get(
+    iv_sensitivity = (new_results.get("iv_nonce_sensitivity") or {}).get(
         "sensitivity_metrics", {}
     )
 
     row_data = {
         "image": new_results.get("image_name", "unknown"),
         "algorithm": new_results.get("algorithm", "unknown"),
-        "original_entropy": f"{entropy_data.get('original', 0):.6f}",
-        "encrypted_entropy": f"{entropy_data.get('encrypted', 0):.6f}",
-        "entropy_improvement": f"{entropy_data.get('improvement', 0):+.6f}",
-        "npcr": f"{npcr_data.get('npcr', 0):.6f}%",
-        "uaci": f"{npcr_data.get('uaci', 0):.6f}%",
-        "avalanche": f"{new_results.get('avalanche_effect', 0):.6f}%",
-        "horizontal_corr_original": f"{horizontal_corr.get('original', 0):.6f}",
-        "horizontal_corr_encrypted": f"{horizontal_corr.get('encrypted', 0):.6f}",
+        "original_entropy": float(entropy_data.get("original", 0)),
+        "encrypted_entropy": float(entropy_data.get("encrypted", 0)),
+        "entropy_improvement": float(entropy_data.get("improvement", 0)),
+        "npcr": float(npcr_data.get("npcr", 0)),
+        "uaci": float(npcr_data.get("uaci", 0)),
+        "avalanche": float(new_results.get("avalanche_effect", 0)),
+        "horizontal_corr_original": float(horizontal_corr.get("original", 0)),
+        "horizontal_corr_encrypted": float(horizontal_corr.get("encrypted", 0)),
         "file_size_original": file_sizes.get("original_bytes", 0),
         "file_size_encrypted": file_sizes.get("encrypted_bytes", 0),
-        "key_sensitivity_npcr": f"{key_sensitivity.get('npcr', 0):.6f}%",
-        "key_sensitivity_uaci": f"{key_sensitivity.get('uaci', 0):.6f}%",
-        "key_sensitivity_avalanche": f"{key_sensitivity.get('avalanche_effect', 0):.6f}%",
-        "iv_sensitivity_npcr": f"{iv_sensitivity.get('npcr', 0):.6f}%",
+        "key_sensitivity_npcr": float(key_sensitivity.get("npcr", 0)),
+        "key_sensitivity_uaci": float(key_sensitivity.get("uaci", 0)),
+        "key_sensitivity_avalanche": float(key_sensitivity.get("avalanche_effect", 0)),
+        "iv_sensitivity_npcr": float(iv_sensitivity.get("npcr", 0)),
     }
+    return row_data
 
-    # Проверяем существует ли файл
-    if os.path.exists(summary_file):
-        with open(summary_file, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            existing_data = list(reader)
-
-        # Обновляем или добавляем строку
-        updated = False
-        for i, row in enumerate(existing_data):
-            if (
-                row["image"] == new_results["image_name"]
-                and row["algorithm"] == new_results["algorithm"]
-            ):
-                existing_data[i] = row_data
-                updated = True
-                break
-
-        if not updated:
-            existing_data.append(row_data)
-    else:
-        existing_data = [row_data]
 
-    # Сохраняем обновленные данные
-    with open(summary_file, "w", newline="", encoding="utf-8") as f:
-        fieldnames = row_data.keys()
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(existing_data)
+# запись добавляется в хранилище, CSV перевыгружается из актуальных записей
+def update_summary_table(new_results: Dict[str, Any], run_id: str = None):
+    with ResultsStore() as store:
+        store.append([summary_row(new_results)], run_id=run_id)
+        store.export_csv(SUMMARY_FILE)
 
-    print(f"Сводная таблица обновлена: {summary_file}")
+    print(f"Сводная таблица обновлена: {SUMMARY_FILE}")
 
 
 # Основная функция для использования
 def analyze_and_save_metrics(
-    original_path: str, encrypted_bin_path: str, image_name: str, algorithm: str
+    original_path: str,
+    encrypted_bin_path: str,
+    image_name: str,
+    algorithm: str,
+    sample: int = None,
+    seed: int = 0,
+    update_summary: bool = True,
+    run_id: str = None,
 ) -> Dict[str, Any]:
+    METRIC_ERRORS.clear()
     try:
         results = compute_all_metrics(
-            original_path, encrypted_bin_path, image_name, algorithm
+            original_path,
+            encrypted_bin_path,
+            image_name,
+            algorithm,
+            sample=sample,
+            seed=seed,
         )
+        if METRIC_ERRORS:
+            results["errors"] = list(METRIC_ERRORS)
         metrics_filename = f"{image_name}_metrics.json"
         save_metrics_to_json(results, metrics_filename)
-        update_summary_table(results)
+        if update_summary:
+            update_summary_table(results, run_id=run_id)
 
         print(f" МЕТРИКИ ВЫЧИСЛЕНЫ И СОХРАНЕНЫ: {image_name}")
         return results
 
     except Exception as e:
-        print(f" ОШИБКА В ОСНОВНОЙ ФУНКЦИИ: {e}")
+        metric_error(f" ОШИБКА В ОСНОВНОЙ ФУНКЦИИ: {e}")
         fallback_results = create_fallback_metrics(
             image_name, original_path, encrypted_bin_path, algorithm
         )
+        fallback_results["errors"] = list(METRIC_ERRORS)
         metrics_filename = f"{image_name}_metrics.json"
         save_metrics_to_json(fallback_results, metrics_filename)
-        update_summary_table(fallback_results)
+        if update_summary:
+            update_summary_table(fallback_results, run_id=run_id)
         return fallback_results
 
 
-if __name__ == "__main__":
+# задания для пакетного вычисления метрик
+"""
+Задание - (исходное изображение, шифр, имя изображения, алгоритм).
+Алгоритм и исходный файл берутся из заголовка контейнера или .meta.json рядом с шифром:
+imgs/encrypted/gradient_aes_cbc.bin -> imgs/input/gradient.png, "aes-cbc", "gradient_cbc"
+"""
 
-    test_images = {
-        "ECB": {
-            "checkerboard": (
-                "imgs/input/checkerboard.png",
-                "imgs/encrypted/checkerboard_aes_ecb.bin",
-            ),
-            "gradient": (
-                "imgs/input/gradient.png",
-                "imgs/encrypted/gradient_aes_ecb.bin",
-            ),
-            "noise_texture": (
-                "imgs/input/noise_texture.png",
-                "imgs/encrypted/noise_texture_aes_ecb.bin",
-            ),
-            "my": ("imgs/input/my.jpg", "imgs/encrypted/my_aes_ecb.bin"),
-        },
-        "CBC": {
-            "checkerboard": (
-                "imgs/input/checkerboard.png",
-                "imgs/encrypted/checkerboard_aes_cbc.bin",
-            ),
-            "gradient": (
-                "imgs/input/gradient.png",
-                "imgs/encrypted/gradient_aes_cbc.bin",
-            ),
-            "noise_texture": (
-                "imgs/input/noise_texture.png",
-                "imgs/encrypted/noise_texture_aes_cbc.bin",
-            ),
-            "my": ("imgs/input/my.jpg", "imgs/encrypted/my_aes_cbc.bin"),
-        },
-        "CFB": {
-            "checkerboard": (
-                "imgs/input/checkerboard.png",
-                "imgs/encrypted/checkerboard_aes_cfb.bin",
-            ),
-            "gradient": (
-                "imgs/input/gradient.png",
-                "imgs/encrypted/gradient_aes_cfb.bin",
-            ),
-            "noise_texture": (
-                "imgs/input/noise_texture.png",
-                "imgs/encrypted/noise_texture_aes_cfb.bin",
-            ),
-            "my": ("imgs/input/my.jpg", "imgs/encrypted/my_aes_cfb.bin"),
-        },
-        "CTR": {
-            "checkerboard": (
-                "imgs/input/checkerboard.png",
-                "imgs/encrypted/checkerboard_aes_ctr.bin",
-            ),
-            "gradient": (
-                "imgs/input/gradient.png",
-                "imgs/encrypted/gradient_aes_ctr.bin",
-            ),
-            "noise_texture": (
-                "imgs/input/noise_texture.png",
-                "imgs/encrypted/noise_texture_aes_ctr.bin",
-            ),
-            "my": ("imgs/input/my.jpg", "imgs/encrypted/my_aes_ctr.bin"),
-        },
-        "STREAM": {
-            "checkerboard": (
-                "imgs/input/checkerboard.png",
-                "imgs/encrypted/checkerboard_stream.bin",
-            ),
-            "gradient": (
-                "imgs/input/gradient.png",
-                "imgs/encrypted/gradient_stream.bin",
-            ),
-            "noise_texture": (
-                "imgs/input/noise_texture.png",
-                "imgs/encrypted/noise_texture_stream.bin",
-            ),
-            "my": ("imgs/input/my.jpg", "imgs/encrypted/my_stream.bin"),
-        },
+
+def metric_job(
+    original_path: str, encrypted_path: str, meta_path: str = None
+) -> Tuple[str, str, str, str]:
+    cipher = cipher_for_meta(read_meta(encrypted_path, meta_path))
+
+    stem = os.path.splitext(os.path.basename(original_path))[0]
+    return original_path, encrypted_path, f"{stem}_{cipher.label}", cipher.report_name
+
+
+# поиск шифров с метаданными в дереве imgs/
+def discover_metric_jobs(root: str = "imgs") -> List[Tuple[str, str, str, str]]:
+    jobs = []
+    for encrypted_path in sorted(glob.glob(os.path.join(root, "encrypted", "*.bin"))):
+        try:
+            original_name = read_meta(encrypted_path).get("original_filename")
+        except FileNotFoundError:
+            print(f" Пропуск {encrypted_path}: нет файла метаданных")
+            continue
+
+        original_path = os.path.join(root, "input", original_name or "")
+        if not original_name or not os.path.exists(original_path):
+            print(f" Пропуск {encrypted_path}: исходное изображение не найдено")
+            continue
+
+        jobs.append(metric_job(original_path, encrypted_path))
+    return jobs
+
+
+# файл-список: "исходное шифр [метаданные]" в строке, пути относительно списка
+def load_metric_jobs(manifest_path: str) -> List[Tuple[str, str, str, str]]:
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            paths = [os.path.join(base_dir, part) for part in line.split()]
+            if len(paths) not in (2, 3):
+                raise ValueError(
+                    f"Строка {line_number} файла-списка: ожидается 'исходное шифр [метаданные]'"
+                )
+            jobs.append(metric_job(*paths))
+    return jobs
+
+
+# одно задание в процессе пула; запись добавляется в хранилище, CSV здесь не трогается
+def _run_metrics_job(job: Tuple) -> Dict[str, Any]:
+    original, encrypted, image_name, algorithm, sample, seed, run_id = job
+    started = time.perf_counter()
+
+    try:
+        # вывод вычислений не смешиваем с отчетом о заданиях
+        with redirect_stdout(io.StringIO()):
+            results = analyze_and_save_metrics(
+                original,
+                encrypted,
+                image_name,
+                algorithm,
+                sample=sample,
+                seed=seed,
+                update_summary=False,
+            )
+        # перехваченные ошибки анализа: резервные значения в хранилище не попадают
+        if results.get("errors"):
+            raise RuntimeError("; ".join(results["errors"]))
+        with ResultsStore() as store:
+            store.append([summary_row(results)], run_id=run_id)
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    return {
+        "image_name": image_name,
+        "error": error,
+        "seconds": time.perf_counter() - started,
     }
 
-    for mode, images in test_images.items():
-        print(f"\n Режим {mode}:")
-        for name, (original, encrypted) in images.items():
-            if os.path.exists(original) and os.path.exists(encrypted):
-                try:
-                    # Определяем алгоритм на основе режима
-                    if mode == "STREAM":
-                        algorithm = "stream-rc4-custom"
-                    else:
-                        algorithm = f"aes-{mode.lower()}"  # 'aes-cbc', 'aes-cfb', 'aes-ctr', 'aes-ecb'
-
-                    results = analyze_and_save_metrics(
-                        original, encrypted, f"{name}_{mode.lower()}", algorithm
-                    )
-
-                    print(
-                        f" {name}: энтропия {results['entropy']['original']:.3f} → {results['entropy']['encrypted']:.3f}"
-                    )
-                except Exception as e:
-                    print(f" Ошибка для {name} ({mode}): {e}")
+
+# метрики для всех заданий в пуле процессов, CSV выгружается один раз в конце
+def run_metrics_pipeline(
+    jobs: List[Tuple[str, str, str, str]],
+    workers: int = None,
+    sample: int = None,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    workers = max(1, workers or os.cpu_count() or 1)
+    run_id = new_run_id()
+    print(f" Метрики: {len(jobs)} заданий, {workers} процессов, запуск {run_id}")
+
+    # хранилище создается (и переносит старый CSV) до запуска пула
+    ResultsStore().close()
+
+    reports = []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_run_metrics_job, job + (sample, seed, run_id))
+            for job in jobs
+        ]
+        for future in as_completed(futures):
+            report = future.result()
+            reports.append(report)
+            status = "OK " if report["error"] is None else "ERR"
+            print(
+                f"  [{len(reports)}/{len(jobs)}] {status} {report['image_name']} ({report['seconds']:.2f} c)"
+            )
+
+    with ResultsStore() as store:
+        store.export_csv(SUMMARY_FILE)
+    print(f"Сводная таблица обновлена: {SUMMARY_FILE}")
+
+    elapsed = time.perf_counter() - started
+    failures = [report for report in reports if report["error"] is not None]
+    print(
+        f"\n Готово: {len(reports) - len(failures)}/{len(reports)} за {elapsed:.2f} c"
+    )
+    print(f" Суммарное время заданий: {sum(r['seconds'] for r in reports):.2f} c")
+    for report in failures:
+        print(f"  {report['image_name']}: {report['error']}")
+    return reports
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Метрики шифрования изображений")
+    parser.add_argument(
+        "--sample",
+        type=int,
+        help="Приближенный режим: число случайных позиций/пар для NPCR, UACI, avalanche и корреляции",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Зерно ГПСЧ для выборки")
+    parser.add_argument(
+        "--root", default="imgs", help="Каталог с подкаталогами input/ и encrypted/"
+    )
+    parser.add_argument(
+        "--manifest", help="Файл-список заданий: 'исходное шифр [метаданные]' в строке"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="Количество процессов"
+    )
+    args = parser.parse_args()
+
+    if args.manifest:
+        jobs = load_metric_jobs(args.manifest)
+    else:
+        jobs = discover_metric_jobs(args.root)
+
+    run_metrics_pipeline(jobs, workers=args.workers, sample=args.sample, seed=args.seed)
@@ -0,0 +1,192 @@
+import csv
+import os
+import sqlite3
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+
+RESULTS_DB = "results/report_data/results.sqlite"
+
+# хранилище результатов метрик
+#
+# Записи только добавляются: (изображение, алгоритм, запуск) -> метрики.
+# Повторный расчет не переписывает старую запись, а добавляет новую;
+# актуальной считается последняя запись для пары (изображение, алгоритм) -
+# представление latest_results. summary_table.csv - выгрузка этого представления.
+#
+# Несколько процессов могут писать одновременно: журнал WAL и ожидание блокировки.
+
+# столбцы сводной таблицы: (имя, тип SQLite, формат в CSV)
+SUMMARY_COLUMNS = [
+    ("image", "TEXT", "{}"),
+    ("algorithm", "TEXT", "{}"),
+    ("original_entropy", "REAL", "{:.6f}"),
+    ("encrypted_entropy", "REAL", "{:.6f}"),
+    ("entropy_improvement", "REAL", "{:+.6f}"),
+    ("npcr", "REAL", "{:.6f}%"),
+    ("uaci", "REAL", "{:.6f}%"),
+    ("avalanche", "REAL", "{:.6f}%"),
+    ("horizontal_corr_original", "REAL", "{:.6f}"),
+    ("horizontal_corr_encrypted", "REAL", "{:.6f}"),
+    ("file_size_original", "INTEGER", "{}"),
+    ("file_size_encrypted", "INTEGER", "{}"),
+    ("key_sensitivity_npcr", "REAL", "{:.6f}%"),
+    ("key_sensitivity_uaci", "REAL", "{:.6f}%"),
+    ("key_sensitivity_avalanche", "REAL", "{:.6f}%"),
+    ("iv_sensitivity_npcr", "REAL", "{:.6f}%"),
+]
+COLUMN_NAMES = [name for name, _, _ in SUMMARY_COLUMNS]
+
+# сколько ждать блокировки другого писателя, секунд
+BUSY_TIMEOUT = 60
+
+
+def new_run_id() -> str:
+    return time.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:8]
+
+
+class ResultsStore:
+    def __init__(self, path: str = RESULTS_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        created = not os.path.exists(path)
+
+        self.connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+        # старая сводная таблица переносится в новое хранилище один раз
+        csv_path = os.path.join(os.path.dirname(path), "summary_table.csv")
+        if created and os.path.exists(csv_path):
+            self.import_csv(csv_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _create_schema(self):
+        columns = ",\n".join(
+            f"{name} {sql_type}" for name, sql_type, _ in SUMMARY_COLUMNS
+        )
+        with self.connection:
+            self.connection.executescript(
+                f"""
+                CREATE TABLE IF NOT EXISTS metric_records (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id TEXT NOT NULL,
+                    recorded_at REAL NOT NULL,
+                    {columns}
+                );
+                CREATE INDEX IF NOT EXISTS idx_records_key
+                    ON metric_records (image, algorithm, id);
+                CREATE INDEX IF NOT EXISTS idx_records_run
+                    ON metric_records (run_id);
+                CREATE VIEW IF NOT EXISTS latest_results AS
+                    SELECT * FROM metric_records
+                    WHERE id IN (
+                        SELECT MAX(id) FROM metric_records GROUP BY image, algorithm
+                    );
+                """
+            )
+
+    # добавление записей одной транзакцией
+    def append(self, records: List[Dict[str, Any]], run_id: str = None) -> str:
+        run_id = run_id or new_run_id()
+        placeholders = ", ".join("?" for _ in range(len(COLUMN_NAMES) + 2))
+        statement = (
+            "INSERT INTO metric_records "
+            f"(run_id, recorded_at, {', '.join(COLUMN_NAMES)}) "
+            f"VALUES ({placeholders})"
+        )
+        recorded_at = time.time()
+        with self.connection:
+            self.connection.executemany(
+                statement,
+                [
+                    [run_id, recorded_at] + [record.get(name) for name in COLUMN_NAMES]
+                    for record in records
+                ],
+            )
+        return run_id
+
+    # выборка с фильтрами; latest=True - только актуальные записи
+    def query(
+        self,
+        image: Optional[str] = None,
+        algorithm: Optional[str] = None,
+        run_id: Optional[str] = None,
+        latest: bool = True,
+    ) -> List[Dict[str, Any]]:
+        conditions, parameters = [], []
+        filters = (("image", image), ("algorithm", algorithm), ("run_id", run_id))
+        for column, value in filters:
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+
+        source = "latest_results" if latest else "metric_records"
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.connection.execute(
+            f"SELECT * FROM {source} {where} ORDER BY {self._order_by(latest)}",
+            parameters,
+        )
+        return [dict(row) for row in rows]
+
+    # порядок строк как в прежней таблице: по первому появлению пары
+    def _order_by(self, latest: bool) -> str:
+        if not latest:
+            return "id"
+        return (
+            "(SELECT MIN(first.id) FROM metric_records AS first "
+            "WHERE first.image = latest_results.image "
+            "AND first.algorithm = latest_results.algorithm)"
+        )
+
+    # выгрузка актуальных записей в CSV прежнего формата
+    def export_csv(self, csv_path: str) -> str:
+        temporary_path = f"{csv_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMN_NAMES)
+            for record in self.query():
+                writer.writerow(format_row(record))
+
+        # замена целиком: читатели не увидят наполовину записанный файл
+        os.replace(temporary_path, csv_path)
+        return csv_path
+
+    def import_csv(self, csv_path: str) -> int:
+        with open(csv_path, "r", encoding="utf-8") as f:
+            records = [parse_row(row) for row in csv.DictReader(f)]
+        if records:
+            self.append(records, run_id="imported-csv")
+        return len(records)
+
+
+def format_row(record: Dict[str, Any]) -> List[str]:
+    return [
+        "" if record.get(name) is None else template.format(record[name])
+        for name, _, template in SUMMARY_COLUMNS
+    ]
+
+
+def parse_row(row: Dict[str, str]) -> Dict[str, Any]:
+    record = {}
+    for name, sql_type, _ in SUMMARY_COLUMNS:
+        value = (row.get(name) or "").strip()
+        if sql_type == "TEXT":
+            record[name] = value
+        elif not value:
+            record[name] = None
+        elif sql_type == "INTEGER":
+            record[name] = int(value)
+        else:
+            record[name] = float(value.rstrip("%"))
+    return record
@@ -0,0 +1,303 @@
+import asyncio
+import io
+import json
+import os
+import signal
+import socket
+import stat
+import tempfile
+import time
+
+from async_api import AsyncRunner
+from ciphers import CIPHERS, get_cipher, cipher_for_meta
+from kdf import DEFAULT_KDF, KDF_LEGACY, generate_salt, derive_key
+
+# демон шифрования: запросы по Unix-сокету, без запуска процесса на каждое изображение
+#
+# Протокол: запрос - строка JSON (заголовок), за ней "length" байт данных;
+# ответ - строка JSON {"ok": true, ..., "length": N} и N байт данных,
+# при ошибке - {"ok": false, "error": "..."}. По одному соединению можно
+# отправлять запросы друг за другом.
+#
+#     {"op": "ping"}
+#     {"op": "encrypt", "algo": "aes-cbc", "key": "...", "input": "a.png", "output": "a.cpic"}
+#     {"op": "encrypt", "algo": "aes-cbc", "key": "...", "length": N}       + байты файла изображения
+#     {"op": "decrypt", "key": "...", "input": "a.cpic", "output": "a.png"}
+#     {"op": "decrypt", "key": "...", "length": N}                          + контейнер (или шифр и "meta")
+#
+# Запросы с путями работают как --mode encrypt/decrypt (те же параметры: format,
+# threads, tile, pyramid, kdf, iv, nonce, region, level). Запросы с байтами
+# шифруют как block_encrypt/stream_encrypt и возвращают контейнер (format=legacy -
+# только шифр, метаданные - в заголовке ответа); дешифрование возвращает
+# изображение в формате image_format (PNG по умолчанию).
+#
+# Модули шифров загружаются при старте, а кэши (производные ключи, перестановки ключа RC4,
+# декодированные изображения) живут в памяти демона между запросами. Соль для
+# каждого KDF выбирается одна на время работы демона (как одна на пакет в
+# пакетном режиме, IV/nonce у каждого шифра свои), поэтому медленный KDF для
+# пароля выполняется один раз. Запросы обслуживаются параллельно в пуле из
+# workers потоков (AsyncRunner из async_api).
+#
+# Доступ: сокет создается с правами 0600, сокет по умолчанию лежит в каталоге
+# пользователя ($XDG_RUNTIME_DIR или cryptopic-<uid> с правами 0700 во временном
+# каталоге). Запросы с путями (input, output, meta_file) читают и пишут файлы
+# с правами пользователя, от имени которого запущен демон, - любой, кто может
+# подключиться к сокету, получает эти права на файлы.
+
+SOCKET_NAME = 'cryptopic.sock'
+SOCKET_DIR_MODE = 0o700
+SOCKET_MODE = 0o600
+
+# каталог сокета по умолчанию - свой у каждого пользователя, а не общий временный каталог
+def default_socket_dir():
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return runtime_dir
+    return os.path.join(tempfile.gettempdir(), f'cryptopic-{os.getuid()}')
+
+DEFAULT_SOCKET = os.path.join(default_socket_dir(), SOCKET_NAME)
+
+# заголовок запроса - одна строка JSON; данные запроса не больше MAX_REQUEST_SIZE
+MAX_HEADER_SIZE = 64 * 1024
+MAX_REQUEST_SIZE = 1024 * 1024 * 1024
+
+class CryptoServer:
+
+    def __init__(self, workers=None, salts=None):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        # пул потоков с ограничением очереди: лишние запросы ждут, а не копятся в исполнителе
+        self.runner = AsyncRunner(max_concurrency=self.workers)
+        # соль для каждого KDF на время работы демона
+        self.salts = salts or {}
+        self.requests = 0
+        self.errors = 0
+
+    # загрузка модулей шифров и PIL до первого запроса
+    def warm_up(self, algos=None):
+        from PIL import Image, PngImagePlugin
+        for algo in algos or CIPHERS:
+            get_cipher(algo).backend
+
+    def salt_for(self, kdf):
+        if kdf == KDF_LEGACY:
+            return None
+        if kdf not in self.salts:
+            self.salts[kdf] = generate_salt()
+        return self.salts[kdf]
+
+    # обработка запроса в потоке пула: (заголовок, данные) -> (заголовок ответа, данные)
+    def handle_request(self, request, data):
+        op = request.get('op')
+        if op == 'ping':
+            cache = derive_key.cache_info()
+            return {"ok": True, "requests": self.requests, "errors": self.errors, "workers": self.workers,
+                    "kdf_cache_hits": cache.hits, "kdf_cache_misses": cache.misses}, b''
+        if not request.get('key'):
+            raise ValueError("В запросе нет ключа!")
+
+        if op == 'encrypt':
+            if request.get('input'):
+                return self.encrypt_path(request), b''
+            return self.encrypt_data(request, data)
+        if op == 'decrypt':
+            if request.get('input'):
+                return self.decrypt_path(request), b''
+            return self.decrypt_data(request, data)
+        raise ValueError(f"Неизвестная операция: {op}")
+
+    def encrypt_path(self, request):
+        from cryptopic import encrypt_file
+
+        kdf = request.get('kdf', DEFAULT_KDF)
+        output_format = request.get('format', 'container')
+        meta, meta_filename = encrypt_file(
+            request['input'],
+            request['output'],
+            request['algo'],
+            request['key'],
+            iv=request.get('iv'),
+            nonce=request.get('nonce'),
+            meta_file=request.get('meta_file'),
+            threads=request.get('threads', 1),
+            output_format=output_format,
+            tile_size=request.get('tile'),
+            pyramid_levels=request.get('pyramid', 0),
+            kdf=kdf,
+            salt=self.salt_for(kdf)
+        )
+        return {"ok": True, "meta": meta, "meta_file": meta_filename, "length": 0}
+
+    def encrypt_data(self, request, data):
+        from container import write_container
+
+        if request.get('tile') or request.get('pyramid'):
+            raise ValueError("Плитки и пирамида доступны только для запросов с путями к файлам!")
+
+        cipher = get_cipher(request['algo'])
+        kdf = request.get('kdf', DEFAULT_KDF)
+        iv, nonce = request.get('iv'), request.get('nonce')
+
+        # файл изображения из запроса открывается прямо из памяти
+        source = io.BytesIO(data)
+        source.name = request.get('filename', '')
+        encrypted_bytes, meta = cipher.encrypt(source, request['key'], iv=bytes.fromhex(iv) if iv else None,
+                                               nonce=bytes.fromhex(nonce) if nonce else None,
+                                               workers=request.get('threads', 1), kdf=kdf, salt=self.salt_for(kdf))
+
+        if request.get('format', 'container') == 'legacy':
+            return {"ok": True, "meta": meta, "length": len(encrypted_bytes)}, encrypted_bytes
+
+        output = io.BytesIO()
+        write_container(output, meta, [encrypted_bytes])
+        body = output.getvalue()
+        return {"ok": True, "meta": meta, "length": len(body)}, body
+
+    def decrypt_path(self, request):
+        from cryptopic import decrypt_file
+        from container import read_meta
+
+        # алгоритм можно не указывать - он берется из метаданных шифра
+        algo = request.get('algo') or cipher_for_meta(read_meta(request['input'], request.get('meta_file'))).algorithm_id
+        region = request.get('region')
+        meta = decrypt_file(request['input'], request['output'], algo, request['key'],
+                            meta_file=request.get('meta_file'), threads=request.get('threads', 1),
+                            region=tuple(region) if region else None, level=request.get('level', 0))
+        return {"ok": True, "meta": meta, "length": 0}
+
+    def decrypt_data(self, request, data):
+        from PIL import Image
+        from container import MAGIC, EXT_TILE_TABLE, unpack_header, level_payload
+        from image_io import raw_image_size, check_decrypted_size
+
+        # контейнер: метаданные из заголовка; иначе шифр и метаданные из запроса
+        if bytes(data[:len(MAGIC)]) == MAGIC:
+            info = unpack_header(data)
+            if EXT_TILE_TABLE in info.extensions:
+                raise ValueError("Плиточный контейнер расшифровывается только по пути к файлу!")
+            meta, offset, length = level_payload(info, request.get('level', 0))
+            if offset + length > len(data):
+                raise ValueError("Контейнер поврежден: шифр короче, чем указано в заголовке!")
+            payload = memoryview(data)[offset:offset + length]
+        else:
+            if 'meta' not in request:
+                raise ValueError("Для шифра без контейнера нужны метаданные (поле meta)!")
+            meta, payload = request['meta'], data
+
+        cipher = get_cipher(request['algo']) if request.get('algo') else cipher_for_meta(meta)
+        decrypted_bytes = cipher.decrypt_bytes(payload, request['key'], meta, workers=request.get('threads', 1))
+        check_decrypted_size(len(decrypted_bytes), raw_image_size(meta['original_size'], meta['mode']))
+
+        img = Image.frombuffer(meta['mode'], tuple(meta['original_size']), decrypted_bytes, 'raw', meta['mode'], 0, 1)
+        output = io.BytesIO()
+        img.save(output, format=request.get('image_format', 'PNG'))
+        body = output.getvalue()
+        return {"ok": True, "meta": meta, "length": len(body)}, body
+
+    # одно соединение: запросы читаются по очереди, шифрование - в пуле потоков
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    # строка заголовка длиннее MAX_HEADER_SIZE: отвечаем ошибкой и закрываем соединение,
+                    # остаток строки в потоке уже не отделить от следующего запроса
+                    self.requests += 1
+                    self.errors += 1
+                    response = {"ok": False, "error": f"ValueError: Заголовок запроса длиннее {MAX_HEADER_SIZE} байт", "length": 0}
+                    writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                    await writer.drain()
+                    print(f"[serve] ERR (заголовок длиннее {MAX_HEADER_SIZE} байт)")
+                    break
+                if not line:
+                    break
+
+                started = time.perf_counter()
+                request = {}
+                try:
+                    request = json.loads(line)
+                    length = int(request.get('length', 0))
+                    if not 0 <= length <= MAX_REQUEST_SIZE:
+                        raise ValueError(f"Недопустимая длина данных запроса: {length}")
+                    data = await reader.readexactly(length)
+                    response, body = await self.runner.run(self.handle_request, request, data)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    raise
+                except Exception as e:
+                    self.errors += 1
+                    response, body = {"ok": False, "error": f"{type(e).__name__}: {e}", "length": 0}, b''
+                self.requests += 1
+
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                if body:
+                    writer.write(body)
+                await writer.drain()
+                print(f"[serve] {request.get('op')} {request.get('algo', '')} "
+                      f"{'OK' if response['ok'] else 'ERR'} ({time.perf_counter() - started:.3f} c)")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path=DEFAULT_SOCKET):
+        if socket_path == DEFAULT_SOCKET:
+            _prepare_socket_dir(os.path.dirname(socket_path))
+        _remove_stale_socket(socket_path)
+        server = await asyncio.start_unix_server(self.handle_client, socket_path, limit=MAX_HEADER_SIZE)
+        # подключаться может только владелец демона (права не зависят от umask)
+        os.chmod(socket_path, SOCKET_MODE)
+
+        # SIGTERM/SIGINT - остановка с удалением файла сокета
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+
+        print(f"CryptoPic: демон слушает {socket_path}, потоков: {self.workers}")
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            self.runner.shutdown(wait=True)
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            print(f"CryptoPic: демон остановлен, обработано запросов: {self.requests}, ошибок: {self.errors}")
+
+# каталог сокета по умолчанию: создается с правами 0700; чужой или доступный другим
+# каталог (например, заранее созданный в общем /tmp) не используется
+def _prepare_socket_dir(socket_dir):
+    os.makedirs(socket_dir, mode=SOCKET_DIR_MODE, exist_ok=True)
+    info = os.lstat(socket_dir)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o077:
+        raise ValueError(f"Каталог сокета {socket_dir} должен принадлежать текущему пользователю "
+                         f"и быть закрыт для остальных (права 0700)")
+
+# файл сокета от прежнего демона удаляется; если демон еще работает - ошибка
+def _remove_stale_socket(socket_path):
+    if not os.path.exists(socket_path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.remove(socket_path)
+            return
+    raise ValueError(f"Демон уже запущен на {socket_path}")
+
+def run_server(socket_path=None, workers=None, algos=None):
+    server = CryptoServer(workers)
+    server.warm_up(algos)
+    asyncio.run(server.serve(socket_path or DEFAULT_SOCKET))
+
+# клиент для скриптов: один запрос по новому соединению -> (заголовок ответа, данные)
+def call(request, data=b'', socket_path=DEFAULT_SOCKET):
+    request = dict(request, length=len(data))
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        if data:
+            client.sendall(data)
+        with client.makefile('rb') as stream:
+            response = json.loads(stream.readline())
+            body = stream.read(response.get('length', 0))
+    return response, body
@@ -1,13 +1,210 @@
+import matplotlib
+
+# графики только сохраняются в файлы - интерактивный бэкенд не нужен
+matplotlib.use("Agg")
+
 import matplotlib.pyplot as plt
 import numpy as np
+import hashlib
+import inspect
 import json
+import os
+import sys
+import time
 import pandas as pd
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from matplotlib.figure import SubplotParams
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+
+# поля файла метрик, которые нужны таблицам и графикам отчета
+REPORT_FIELDS = (
+    "entropy",
+    "npcr_uaci",
+    "avalanche_effect",
+    "correlations",
+    "file_sizes",
+)
+
+PLOT_STYLE = "seaborn-v0_8"
+
+# хэши входов и параметров построения для каждого файла отчета
+RENDER_MANIFEST = "render_manifest.json"
+
+# выходные файлы сравнительных графиков и таблиц относительно results_dir
+CHART_OUTPUTS = {
+    "create_comparative_summary_chart": ["histograms/comparative_analysis.png"],
+    "create_correlation_comparison_chart": [
+        "comparative_charts/correlation_comparison.png"
+    ],
+    "create_security_metrics_chart": [
+        "comparative_charts/security_metrics_comparison.png"
+    ],
+    "create_entropy_comparison_chart": ["comparative_charts/entropy_comparison.png"],
+    "create_heatmap_comparison": ["comparative_charts/heatmap_comparison.png"],
+    "create_radar_chart": ["comparative_charts/radar_chart_comparison.png"],
+    "create_entropy_comparison_table": ["tables/entropy_comparison.png"],
+    "create_security_metrics_comparison_table": [
+        "tables/security_metrics_comparison.png"
+    ],
+    "create_correlation_comparison_table": ["tables/correlation_comparison.png"],
+    "create_file_size_comparison_table": ["tables/file_size_comparison.png"],
+    # по таблице на метод шифрования - список зависит от данных
+    "create_encryption_methods_comparison_table": [],
+}
+
+# поля записей, которые читает каждый сравнительный график или таблица:
+# в процесс пула передаются только они
+SECURITY_FIELDS = ("npcr_uaci", "avalanche_effect")
+SUMMARY_FIELDS = ("entropy", "npcr_uaci", "avalanche_effect", "correlations")
+CHART_FIELDS = {
+    "create_comparative_summary_chart": SUMMARY_FIELDS,
+    "create_correlation_comparison_chart": ("correlations",),
+    "create_security_metrics_chart": SECURITY_FIELDS,
+    "create_entropy_comparison_chart": ("entropy",),
+    "create_heatmap_comparison": SUMMARY_FIELDS,
+    "create_radar_chart": SUMMARY_FIELDS,
+    "create_entropy_comparison_table": ("entropy",),
+    "create_security_metrics_comparison_table": SECURITY_FIELDS,
+    "create_correlation_comparison_table": ("correlations",),
+    "create_file_size_comparison_table": ("file_sizes",),
+    "create_encryption_methods_comparison_table": SUMMARY_FIELDS,
+}
+
+# фигуры, которые переиспользуются графиками одного вида (см. reused_figure)
+REUSED_FIGURES = ("table", "dashboard")
+
+# визуализатор процесса пула: создается один раз в инициализаторе,
+# задачи передают только метод и нужные поля записей
+_worker_visualizer = None
+
+
+def apply_plot_style():
+    plt.style.use(PLOT_STYLE)
+
+
+def _init_render_worker(results_dir: str):
+    """Инициализатор процесса пула: стиль графиков и каталоги результатов"""
+    global _worker_visualizer
+    _worker_visualizer = CryptoVisualizer(results_dir, workers=1)
+
+
+def _render_chart(task: tuple) -> float:
+    """Строит один график или таблицу в процессе пула"""
+    method_name, args = task
+    started = time.perf_counter()
+    getattr(_worker_visualizer, method_name)(*args)
+    return time.perf_counter() - started
+
+
+def project_records(
+    metrics_data: Dict[str, Any], fields: tuple
+) -> Dict[str, Dict[str, Any]]:
+    """Записи только с полями fields - столько уходит в процесс пула"""
+    return {
+        name: dict(
+            data,
+            main={
+                field: data["main"][field] for field in fields if field in data["main"]
+            },
+        )
+        for name, data in metrics_data.items()
+    }
+
+
+def close_reused_figures():
+    for kind in REUSED_FIGURES:
+        plt.close(f"cryptopic-{kind}")
+
+
+def render_params_hash() -> str:
+    """Хэш параметров построения: код визуализатора, стиль, версия matplotlib"""
+    digest = hashlib.sha256()
+    digest.update(inspect.getsource(sys.modules[__name__]).encode("utf-8"))
+    digest.update(f"{PLOT_STYLE}|{matplotlib.__version__}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class MetricsRepository(Mapping):
+    """Индекс файлов метрик: файлы читаются по требованию, только нужные поля"""
+
+    def __init__(
+        self,
+        metrics_dir: Path,
+        fields: tuple = REPORT_FIELDS,
+        paths: Dict[str, Path] = None,
+        cache: Dict[str, Any] = None,
+    ):
+        self.metrics_dir = Path(metrics_dir)
+        self.fields = fields
+        if paths is None:
+            paths = {
+                file_path.stem.replace("_metrics", ""): file_path
+                for file_path in self.metrics_dir.glob("*metrics.json")
+            }
+        self.paths = paths
+        # общий для всех выборок кэш разобранных файлов, None - файл не читается
+        self._cache = {} if cache is None else cache
+
+    def _load(self, image_type: str) -> Optional[Dict[str, Any]]:
+        if image_type not in self._cache:
+            file_path = self.paths[image_type]
+            try:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                main_data = {
+                    field: data[field] for field in self.fields if field in data
+                }
+                self._cache[image_type] = {"main": main_data, "key_sensitivity": None}
+                print(f"   Loaded: {image_type}")
+            except Exception as e:
+                print(f"Error loading {file_path}: {e}")
+                self._cache[image_type] = None
+        return self._cache[image_type]
+
+    def __getitem__(self, image_type: str) -> Dict[str, Any]:
+        record = self._load(image_type) if image_type in self.paths else None
+        if record is None:
+            raise KeyError(image_type)
+        return record
+
+    def __iter__(self):
+        for image_type in self.paths:
+            if self._load(image_type) is not None:
+                yield image_type
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def content_hash(self, image_type: str) -> str:
+        """Хэш содержимого файла метрик, без разбора JSON"""
+        with open(self.paths[image_type], "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    @staticmethod
+    def split_name(image_type: str) -> tuple:
+        """Имя вида gradient_cbc -> (gradient, cbc)"""
+        parts = image_type.split("_")
+        if len(parts) < 2:
+            return image_type, None
+        return "_".join(parts[:-1]), parts[-1]
+
+    def select(self, image: str = None, method: str = None) -> "MetricsRepository":
+        """Выборка по изображению и/или методу без чтения остальных файлов"""
+        paths = {}
+        for image_type, file_path in self.paths.items():
+            image_base, image_method = self.split_name(image_type)
+            if image is not None and image_base != image:
+                continue
+            if method is not None and image_method != method:
+                continue
+            paths[image_type] = file_path
+        return MetricsRepository(self.metrics_dir, self.fields, paths, self._cache)
 
 
 class CryptoVisualizer:
-    def __init__(self, results_dir: str = "results"):
+    def __init__(self, results_dir: str = "results", workers: int = None):
         self.results_dir = Path(results_dir)
         self.metrics_dir = self.results_dir / "metrics"
         self.tables_dir = self.results_dir / "tables"
@@ -17,7 +214,10 @@ class CryptoVisualizer:
         for directory in [self.tables_dir, self.histograms_dir, self.comparative_dir]:
             directory.mkdir(parents=True, exist_ok=True)
 
-        plt.style.use("seaborn-v0_8")
+        # процессов для построения графиков, 1 - все в текущем процессе
+        self.workers = max(1, workers or os.cpu_count() or 1)
+
+        apply_plot_style()
         self.colors = [
             "#FF6B6B",
             "#4ECDC4",
@@ -31,22 +231,19 @@ class CryptoVisualizer:
             "#FF9F43",
         ]
 
-    def load_metrics_data(self) -> Dict[str, Any]:
-        metrics_data = {}
+    def load_metrics_data(self) -> MetricsRepository:
+        return MetricsRepository(self.metrics_dir)
 
-        metric_files = list(self.metrics_dir.glob("*metrics.json"))
+    def reused_figure(self, kind: str, figsize: tuple):
+        """Фигура для графиков одного вида: создается один раз на процесс
 
-        for file_path in metric_files:
-            image_type = file_path.stem.replace("_metrics", "")
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    metrics_data[image_type] = {"main": data, "key_sensitivity": None}
-                    print(f"   Loaded: {image_type}")
-            except Exception as e:
-                print(f"Error loading {file_path}: {e}")
-
-        return metrics_data
+        Перед графиком очищается, размер и поля задаются заново - результат тот же,
+        что с новой фигурой. Фигура становится текущей для вызовов plt.*.
+        """
+        fig = plt.figure(num=f"cryptopic-{kind}", clear=True)
+        fig.set_size_inches(figsize)
+        fig.subplotpars = SubplotParams()
+        return fig
 
     def save_table_as_image(
         self,
@@ -65,7 +262,7 @@ class CryptoVisualizer:
         fig_width = max(14, n_cols * 3.0)
         fig_height = max(10, n_rows * 1.5)
 
-        plt.figure(figsize=(fig_width, fig_height))
+        fig = self.reused_figure("table", (fig_width, fig_height))
         plt.axis("off")
         plt.title(title, fontsize=18, fontweight="bold", pad=25)
 
@@ -113,7 +310,7 @@ class CryptoVisualizer:
             facecolor="white",
             pad_inches=0.8,
         )
-        plt.close()
+        fig.clear()
 
         print(f"  Таблица сохранена: {filepath}")
         return filepath
@@ -339,187 +536,188 @@ class CryptoVisualizer:
             main_data = data["main"]
             if not main_data:
                 continue
-            fig, (ax1, ax2, ax3) = plt.subplots(1, 3, figsize=(22, 7))  # Шире и ниже
-            fig.suptitle(
-                f"СВОДНЫЙ ДАШБОРД - {image_name.upper()}",
-                fontsize=18,
-                fontweight="bold",
-                y=0.98,
-            )
+            self.create_image_dashboard(image_name, main_data)
 
-            entropy_data = main_data["entropy"]
-            categories_entropy = ["Оригинал", "Шифр"]
-            values_entropy = [entropy_data["original"], entropy_data["encrypted"]]
+    def create_image_dashboard(self, image_name: str, main_data: Dict[str, Any]):
+        """Создает сводный дашборд одного изображения"""
+        fig = self.reused_figure("dashboard", (22, 7))  # Шире и ниже
+        ax1, ax2, ax3 = fig.subplots(1, 3)
+        fig.suptitle(
+            f"СВОДНЫЙ ДАШБОРД - {image_name.upper()}",
+            fontsize=18,
+            fontweight="bold",
+            y=0.98,
+        )
 
-            bars_entropy = ax1.bar(
-                categories_entropy,
-                values_entropy,
-                color=["#FF6B6B", "#4ECDC4"],
-                alpha=0.8,
-                width=0.6,
-            )
+        entropy_data = main_data["entropy"]
+        categories_entropy = ["Оригинал", "Шифр"]
+        values_entropy = [entropy_data["original"], entropy_data["encrypted"]]
 
-            ax1.set_ylabel("Энтропия (биты)", fontsize=12)
-            ax1.set_title("ЭНТРОПИЯ ШЕННОНА", fontweight="bold", fontsize=14, pad=15)
-            ax1.grid(True, alpha=0.3)
-            ax1.tick_params(axis="both", which="major", labelsize=11)
+        bars_entropy = ax1.bar(
+            categories_entropy,
+            values_entropy,
+            color=["#FF6B6B", "#4ECDC4"],
+            alpha=0.8,
+            width=0.6,
+        )
 
-            max_entropy = max(values_entropy)
-            text_offset_entropy = max_entropy * 0.08
+        ax1.set_ylabel("Энтропия (биты)", fontsize=12)
+        ax1.set_title("ЭНТРОПИЯ ШЕННОНА", fontweight="bold", fontsize=14, pad=15)
+        ax1.grid(True, alpha=0.3)
+        ax1.tick_params(axis="both", which="major", labelsize=11)
 
-            for bar, value in zip(bars_entropy, values_entropy):
-                ax1.text(
-                    bar.get_x() + bar.get_width() / 2,
-                    bar.get_height() + text_offset_entropy,
-                    f"{value:.3f}",
-                    ha="center",
-                    va="bottom",
-                    fontweight="bold",
-                    fontsize=11,
-                )
+        max_entropy = max(values_entropy)
+        text_offset_entropy = max_entropy * 0.08
 
-            ax1.axhline(
-                y=8.0, color="red", linestyle="--", alpha=0.5, label="Идеал (8.0)"
+        for bar, value in zip(bars_entropy, values_entropy):
+            ax1.text(
+                bar.get_x() + bar.get_width() / 2,
+                bar.get_height() + text_offset_entropy,
+                f"{value:.3f}",
+                ha="center",
+                va="bottom",
+                fontweight="bold",
+                fontsize=11,
             )
 
-            npcr_uaci = main_data["npcr_uaci"]
-            avalanche = main_data["avalanche_effect"]
+        ax1.axhline(y=8.0, color="red", linestyle="--", alpha=0.5, label="Идеал (8.0)")
 
-            security_metrics = ["NPCR", "UACI", "Avalanche"]
-            security_values = [npcr_uaci["npcr"], npcr_uaci["uaci"], avalanche]
-            security_ideals = [99.6, 33.4, 50.0]
+        npcr_uaci = main_data["npcr_uaci"]
+        avalanche = main_data["avalanche_effect"]
 
-            x_security = np.arange(len(security_metrics))
-            bars_security = ax2.bar(
-                x_security,
-                security_values,
-                color=["#45B7D1", "#96CEB4", "#FECA57"],
-                alpha=0.8,
-                width=0.6,
+        security_metrics = ["NPCR", "UACI", "Avalanche"]
+        security_values = [npcr_uaci["npcr"], npcr_uaci["uaci"], avalanche]
+        security_ideals = [99.6, 33.4, 50.0]
+
+        x_security = np.arange(len(security_metrics))
+        bars_security = ax2.bar(
+            x_security,
+            security_values,
+            color=["#45B7D1", "#96CEB4", "#FECA57"],
+            alpha=0.8,
+            width=0.6,
+        )
+
+        ax2.set_ylabel("Процент (%)", fontsize=12)
+        ax2.set_title("МЕТРИКИ БЕЗОПАСНОСТИ", fontweight="bold", fontsize=14, pad=15)
+        ax2.set_xticks(x_security)
+        ax2.set_xticklabels(security_metrics, fontsize=11)
+        ax2.grid(True, alpha=0.3)
+        ax2.tick_params(axis="both", which="major", labelsize=11)
+
+        max_security = max(security_values)
+        text_offset_security = max_security * 0.03
+
+        for i, (value, ideal) in enumerate(zip(security_values, security_ideals)):
+            color = "green" if abs(value - ideal) < (ideal * 0.1) else "red"
+            ax2.axhline(y=ideal, color=color, linestyle="--", alpha=0.7)
+            ax2.text(
+                i,
+                ideal + text_offset_security * 0.5,
+                f"Идеал: {ideal}%",
+                ha="center",
+                va="bottom",
+                fontsize=10,
+                color=color,
+                fontweight="bold",
             )
 
-            ax2.set_ylabel("Процент (%)", fontsize=12)
-            ax2.set_title(
-                "МЕТРИКИ БЕЗОПАСНОСТИ", fontweight="bold", fontsize=14, pad=15
+        for bar, value in zip(bars_security, security_values):
+            ax2.text(
+                bar.get_x() + bar.get_width() / 2,
+                bar.get_height() + text_offset_security,
+                f"{value:.2f}%",
+                ha="center",
+                va="bottom",
+                fontweight="bold",
+                fontsize=11,
             )
-            ax2.set_xticks(x_security)
-            ax2.set_xticklabels(security_metrics, fontsize=11)
-            ax2.grid(True, alpha=0.3)
-            ax2.tick_params(axis="both", which="major", labelsize=11)
 
-            max_security = max(security_values)
-            text_offset_security = max_security * 0.03
+        correlations = main_data["correlations"]
 
-            for i, (value, ideal) in enumerate(zip(security_values, security_ideals)):
-                color = "green" if abs(value - ideal) < (ideal * 0.1) else "red"
-                ax2.axhline(y=ideal, color=color, linestyle="--", alpha=0.7)
-                ax2.text(
-                    i,
-                    ideal + text_offset_security * 0.5,
-                    f"Идеал: {ideal}%",
-                    ha="center",
-                    va="bottom",
-                    fontsize=10,
-                    color=color,
-                    fontweight="bold",
-                )
+        directions = [
+            "Гориз.",
+            "Верт.",
+            "Диаг.",
+        ]
+        original_corr = [
+            correlations["horizontal"]["original"],
+            correlations["vertical"]["original"],
+            correlations["diagonal"]["original"],
+        ]
+        encrypted_corr = [
+            correlations["horizontal"]["encrypted"],
+            correlations["vertical"]["encrypted"],
+            correlations["diagonal"]["encrypted"],
+        ]
 
-            for bar, value in zip(bars_security, security_values):
-                ax2.text(
-                    bar.get_x() + bar.get_width() / 2,
-                    bar.get_height() + text_offset_security,
-                    f"{value:.2f}%",
-                    ha="center",
-                    va="bottom",
-                    fontweight="bold",
-                    fontsize=11,
-                )
+        x_corr = np.arange(len(directions))
+        width = 0.35
 
-            correlations = main_data["correlations"]
+        bars_corr1 = ax3.bar(
+            x_corr - width / 2,
+            original_corr,
+            width,
+            label="Оригинал",
+            color="#FF6B6B",
+            alpha=0.8,
+        )
+        bars_corr2 = ax3.bar(
+            x_corr + width / 2,
+            encrypted_corr,
+            width,
+            label="Шифр",
+            color="#4ECDC4",
+            alpha=0.8,
+        )
 
-            directions = [
-                "Гориз.",
-                "Верт.",
-                "Диаг.",
-            ]
-            original_corr = [
-                correlations["horizontal"]["original"],
-                correlations["vertical"]["original"],
-                correlations["diagonal"]["original"],
-            ]
-            encrypted_corr = [
-                correlations["horizontal"]["encrypted"],
-                correlations["vertical"]["encrypted"],
-                correlations["diagonal"]["encrypted"],
-            ]
+        ax3.set_ylabel("Коэффициент корреляции", fontsize=12)
+        ax3.set_title(
+            "КОРРЕЛЯЦИЯ СОСЕДНИХ ПИКСЕЛЕЙ", fontweight="bold", fontsize=14, pad=15
+        )
+        ax3.set_xticks(x_corr)
+        ax3.set_xticklabels(directions, fontsize=11)
+        ax3.legend(fontsize=11)
+        ax3.grid(True, alpha=0.3)
+        ax3.tick_params(axis="both", which="major", labelsize=11)
+        ax3.axhline(y=0, color="black", linewidth=0.8)
 
-            x_corr = np.arange(len(directions))
-            width = 0.35
+        max_corr = max(max(original_corr), max(encrypted_corr))
+        min_corr = min(min(original_corr), min(encrypted_corr))
+        text_offset_corr = (max_corr - min_corr) * 0.05
 
-            bars_corr1 = ax3.bar(
-                x_corr - width / 2,
-                original_corr,
-                width,
-                label="Оригинал",
-                color="#FF6B6B",
-                alpha=0.8,
-            )
-            bars_corr2 = ax3.bar(
-                x_corr + width / 2,
-                encrypted_corr,
-                width,
-                label="Шифр",
-                color="#4ECDC4",
-                alpha=0.8,
+        for bar, value in zip(bars_corr1, original_corr):
+            ax3.text(
+                bar.get_x() + bar.get_width() / 2,
+                bar.get_height() + text_offset_corr,
+                f"{value:.3f}",
+                ha="center",
+                va="bottom",
+                fontsize=10,
+                fontweight="bold",
             )
-
-            ax3.set_ylabel("Коэффициент корреляции", fontsize=12)
-            ax3.set_title(
-                "КОРРЕЛЯЦИЯ СОСЕДНИХ ПИКСЕЛЕЙ", fontweight="bold", fontsize=14, pad=15
+        for bar, value in zip(bars_corr2, encrypted_corr):
+            ax3.text(
+                bar.get_x() + bar.get_width() / 2,
+                bar.get_height() + text_offset_corr,
+                f"{value:.3f}",
+                ha="center",
+                va="bottom",
+                fontsize=10,
+                fontweight="bold",
             )
-            ax3.set_xticks(x_corr)
-            ax3.set_xticklabels(directions, fontsize=11)
-            ax3.legend(fontsize=11)
-            ax3.grid(True, alpha=0.3)
-            ax3.tick_params(axis="both", which="major", labelsize=11)
-            ax3.axhline(y=0, color="black", linewidth=0.8)
-
-            max_corr = max(max(original_corr), max(encrypted_corr))
-            min_corr = min(min(original_corr), min(encrypted_corr))
-            text_offset_corr = (max_corr - min_corr) * 0.05
-
-            for bar, value in zip(bars_corr1, original_corr):
-                ax3.text(
-                    bar.get_x() + bar.get_width() / 2,
-                    bar.get_height() + text_offset_corr,
-                    f"{value:.3f}",
-                    ha="center",
-                    va="bottom",
-                    fontsize=10,
-                    fontweight="bold",
-                )
-            for bar, value in zip(bars_corr2, encrypted_corr):
-                ax3.text(
-                    bar.get_x() + bar.get_width() / 2,
-                    bar.get_height() + text_offset_corr,
-                    f"{value:.3f}",
-                    ha="center",
-                    va="bottom",
-                    fontsize=10,
-                    fontweight="bold",
-                )
 
-            plt.tight_layout(pad=4.0)
-            filename = self.histograms_dir / f"{image_name}_dashboard.png"
-            plt.savefig(
-                filename,
-                dpi=150,
-                bbox_inches="tight",
-                facecolor="white",
-                pad_inches=1.0,
-            )
-            plt.close()
-            print(f"    ✅ Дашборд создан: {filename}")
+        plt.tight_layout(pad=4.0)
+        filename = self.histograms_dir / f"{image_name}_dashboard.png"
+        plt.savefig(
+            filename,
+            dpi=150,
+            bbox_inches="tight",
+            facecolor="white",
+            pad_inches=1.0,
+        )
+        fig.clear()
+        print(f"    ✅ Дашборд создан: {filename}")
 
     def create_comparative_summary_chart(self, metrics_data: Dict[str, Any]):
         """Создает сравнительный график всех изображений с правильными отступами"""
@@ -1167,11 +1365,12 @@ class CryptoVisualizer:
         plt.close()
         print(f"  Тепловая карта создана: {filename}")
 
-    def generate_comprehensive_comparison(self):
+    def generate_comprehensive_comparison(self, metrics_data: Dict[str, Any] = None):
         """Генерирует все сравнительные графики"""
         print(" Generating comprehensive comparative charts...")
 
-        metrics_data = self.load_metrics_data()
+        if metrics_data is None:
+            metrics_data = self.load_metrics_data()
 
         if not metrics_data:
             print(" No metrics data found for comparative analysis!")
@@ -1188,34 +1387,203 @@ class CryptoVisualizer:
         print(" All comparative charts generated successfully!")
         print(f"  Charts saved to: {self.comparative_dir}")
 
-    def generate_summary_report(self):
-        """Генерация сводного отчета с таблицами и графиками"""
+    def report_tasks(self, repository: MetricsRepository) -> List[tuple]:
+        """Независимые графики и таблицы отчета: (метод, изображение или None)"""
+        # крупные сравнительные графики первыми - пул меньше простаивает в конце
+        tasks = [
+            (method_name, None)
+            for method_name in [
+                "create_comparative_summary_chart",
+                "create_correlation_comparison_chart",
+                "create_security_metrics_chart",
+                "create_entropy_comparison_chart",
+                "create_heatmap_comparison",
+                "create_radar_chart",
+            ]
+        ]
+
+        tasks += [
+            ("create_image_dashboard", image_name) for image_name in repository.paths
+        ]
+
+        tasks += [
+            (method_name, None)
+            for method_name in [
+                "create_entropy_comparison_table",
+                "create_security_metrics_comparison_table",
+                "create_correlation_comparison_table",
+                "create_file_size_comparison_table",
+                "create_encryption_methods_comparison_table",
+            ]
+        ]
+        return tasks
+
+    def task_outputs(
+        self, method_name: str, image_name: str, repository: MetricsRepository
+    ) -> List[str]:
+        """Файлы, которые строит задача, относительно results_dir"""
+        if method_name == "create_image_dashboard":
+            return [f"histograms/{image_name}_dashboard.png"]
+        if method_name == "create_encryption_methods_comparison_table":
+            # те же записи, что строит create_encryption_methods_comparison_table:
+            # нечитаемые файлы и записи с пустым main таблиц не дают
+            methods = {
+                repository.split_name(name)[1]
+                for name, data in repository.items()
+                if data["main"]
+            } - {None}
+            return [
+                f"tables/encryption_method_{method}.png" for method in sorted(methods)
+            ]
+        return CHART_OUTPUTS[method_name]
+
+    def load_render_manifest(self) -> Dict[str, Any]:
+        manifest_path = self.results_dir / RENDER_MANIFEST
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_render_manifest(self, manifest: Dict[str, Any]):
+        manifest_path = self.results_dir / RENDER_MANIFEST
+        temporary_path = manifest_path.with_suffix(".tmp")
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(temporary_path, manifest_path)
+
+    def stale_tasks(
+        self, repository: MetricsRepository, manifest: Dict[str, Any]
+    ) -> tuple:
+        """Делит задачи на устаревшие (метод, изображение, запись) и актуальные"""
+        params_hash = render_params_hash()
+        input_hashes = {
+            name: repository.content_hash(name) for name in repository.paths
+        }
+        # общие графики зависят от всех файлов и от их порядка
+        all_inputs = hashlib.sha256(
+            json.dumps(list(input_hashes.items())).encode("utf-8")
+        ).hexdigest()
+
+        stale, fresh = {}, {}
+        for method_name, image_name in self.report_tasks(repository):
+            key = method_name if image_name is None else f"{method_name}:{image_name}"
+            inputs = all_inputs if image_name is None else input_hashes[image_name]
+            outputs = self.task_outputs(method_name, image_name, repository)
+            entry = {"inputs": inputs, "params": params_hash, "outputs": outputs}
+
+            previous = manifest.get(key)
+            up_to_date = (
+                previous is not None
+                and previous["inputs"] == inputs
+                and previous["params"] == params_hash
+                and previous["outputs"] == outputs
+                and all((self.results_dir / output).exists() for output in outputs)
+            )
+            if up_to_date:
+                fresh[key] = entry
+            else:
+                stale[key] = (method_name, image_name, entry)
+        return stale, fresh
+
+    def render_tasks(self, tasks: List[tuple]) -> List[int]:
+        """Строит графики в пуле процессов (workers=1 - в текущем процессе)
+
+        Возвращает индексы построенных задач; ошибки печатаются, а не выбрасываются.
+        """
+        done = []
+        if self.workers == 1 or len(tasks) < 2:
+            for index, (method_name, args) in enumerate(tasks):
+                try:
+                    getattr(self, method_name)(*args)
+                    done.append(index)
+                except Exception as e:
+                    print(f"  ❌ Ошибка построения {method_name}: {e}")
+            close_reused_figures()
+            return done
+
+        # визуализатор (каталоги результатов) передается процессу один раз,
+        # задача - только метод и записи с нужными ему полями
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_render_worker,
+            initargs=(str(self.results_dir),),
+        ) as executor:
+            futures = {
+                executor.submit(_render_chart, task): index
+                for index, task in enumerate(tasks)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    future.result()
+                    done.append(index)
+                except Exception as e:
+                    print(f"  ❌ Ошибка построения {tasks[index][0]}: {e}")
+        return done
+
+    def generate_summary_report(self, force: bool = False):
+        """Генерация сводного отчета: перестраиваются только устаревшие файлы"""
         print(" Starting summary visualization...")
 
-        metrics_data = self.load_metrics_data()
+        repository = self.load_metrics_data()
 
-        if not metrics_data:
+        if not repository.paths:
             print(" No metrics data found!")
             return
 
-        print(f" Processing {len(metrics_data)} images")
+        print(f" Processing {len(repository.paths)} images")
+
+        manifest = {} if force else self.load_render_manifest()
+        stale, fresh = self.stale_tasks(repository, manifest)
+        print(f" Up to date: {len(fresh)}, to render: {len(stale)}")
 
-        print(" Creating comparative tables...")
-        self.generate_comparative_tables(metrics_data)
+        # разбираются только файлы, нужные устаревшим задачам;
+        # в процессы пула уходят уже готовые записи
+        needs_all = any(image_name is None for _, image_name, _ in stale.values())
+        names = (
+            repository.paths
+            if needs_all
+            else [image_name for _, image_name, _ in stale.values()]
+        )
+        metrics_data = {name: repository[name] for name in names if name in repository}
+
+        keys, tasks = [], []
+        for key, (method_name, image_name, _) in stale.items():
+            if image_name is None:
+                args = (project_records(metrics_data, CHART_FIELDS[method_name]),)
+            elif image_name in metrics_data and metrics_data[image_name]["main"]:
+                args = (image_name, metrics_data[image_name]["main"])
+            else:
+                continue
+            keys.append(key)
+            tasks.append((method_name, args))
 
-        print(" Creating summary charts...")
-        self.create_summary_dashboard(metrics_data)
-        self.create_comparative_summary_chart(metrics_data)
+        print(f" Rendering {len(tasks)} tables and charts, workers: {self.workers}...")
+        started = time.perf_counter()
+        done = self.render_tasks(tasks)
 
-        print(" Creating specialized comparative charts...")
-        self.generate_comprehensive_comparison()
+        # в манифест попадают только актуальные задачи и успешно построенные
+        fresh.update({keys[index]: stale[keys[index]][2] for index in done})
+        self.save_render_manifest(fresh)
 
-        print(f" Summary report completed!")
+        print(f" Summary report completed in {time.perf_counter() - started:.2f} s!")
         print(f"    Tables: {self.tables_dir}")
         print(f"    Charts: {self.histograms_dir}")
         print(f"    Comparative: {self.comparative_dir}")
 
 
 if __name__ == "__main__":
-    visualizer = CryptoVisualizer("results")
-    visualizer.generate_summary_report()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Сводный отчет по метрикам")
+    parser.add_argument(
+        "--force", action="store_true", help="Перестроить все файлы отчета"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="Количество процессов"
+    )
+    args = parser.parse_args()
+
+    visualizer = CryptoVisualizer("results", workers=args.workers)
+    visualizer.generate_summary_report(force=args.force)